@@ -0,0 +1,166 @@
+"""
+Benchmark the /articles/ list endpoint
+
+Compares the previous path of `GET /articles/?limit=1000`, loading ORM objects
+and validating them through the response model before encoding with the standard
+json module, with the fast path selecting rows as dicts and encoding them with
+orjson.
+
+Serialization alone is compared on synthetic rows. The full query and
+serialization paths require a running, disposable postgres (see DB_HOST):
+    $ DB_HOST=localhost python benchmarks/bench_article_list.py
+    $ python benchmarks/bench_article_list.py --no-db
+"""
+import argparse
+import asyncio
+import json
+import time
+import uuid
+from datetime import datetime, timedelta
+
+from fastapi.responses import JSONResponse, ORJSONResponse
+from fastapi.routing import serialize_response
+from fastapi.utils import create_response_field
+
+from cryptomonitor import schemas
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from cryptomonitor.database import async_session, engine, models
+from cryptomonitor.database.crud import article as article_crud
+from cryptomonitor.database.crud import feed as feed_crud
+
+LIMIT = 1_000
+ROUNDS = 20
+
+RESPONSE_FIELD = create_response_field(
+    name="Response_read_articles", type_=list[schemas.ArticleSummary]
+)
+
+
+async def get_articles_current(db_session: AsyncSession, feed_id: int):
+    """
+    Previous path of `crud.article.get_article_rows`, loading ORM objects
+    """
+    result = await db_session.execute(
+        article_crud.select_articles()
+        .where(models.Article.feed_id == feed_id)
+        .order_by(models.Article.published.desc(), models.Article.id.desc())
+        .limit(LIMIT)
+    )
+    return [
+        schemas.ArticleSummary(**db_article.to_dict())
+        for db_article in result.scalars().all()
+    ]
+
+
+async def encode_current(articles) -> bytes:
+    content = await serialize_response(
+        field=RESPONSE_FIELD, response_content=articles, exclude_unset=True
+    )
+    return JSONResponse(content=content).body
+
+
+def encode_fast(rows) -> bytes:
+    return ORJSONResponse(content=rows).body
+
+
+def make_rows():
+    published = datetime.now()
+    return [
+        {
+            "id": i,
+            "title": f"Article {i}",
+            "url": f"https://example.com/{i}",
+            "feed_id": 1,
+            "published": published - timedelta(minutes=i),
+            "rule_ids": [1, 2, 3],
+        }
+        for i in range(LIMIT)
+    ]
+
+
+async def bench_serialization():
+    rows = make_rows()
+    articles = [schemas.ArticleSummary(**row) for row in rows]
+    # Both paths return the same document
+    assert json.loads(await encode_current(articles)) == json.loads(encode_fast(rows))
+
+    start = time.perf_counter()
+    for _ in range(ROUNDS):
+        await encode_current(articles)
+    current = (time.perf_counter() - start) / ROUNDS
+
+    start = time.perf_counter()
+    for _ in range(ROUNDS):
+        encode_fast(rows)
+    fast = (time.perf_counter() - start) / ROUNDS
+
+    print(f"serialize {LIMIT} articles")
+    print(f"  current  {current * 1000:>8.2f} ms")
+    print(f"  fast     {fast * 1000:>8.2f} ms  ({current / fast:.1f}x)")
+
+
+async def add_articles(feed_id: int):
+    published = datetime.now()
+    articles = [
+        schemas.ArticleCreate(
+            title=f"Article {i}",
+            body="lorem ipsum " * 200,
+            url=f"https://example.com/{uuid.uuid4()}",
+            feed_id=feed_id,
+            published=published - timedelta(minutes=i),
+        )
+        for i in range(LIMIT)
+    ]
+    async with async_session() as db_session:
+        for i in range(0, LIMIT, 100):
+            await article_crud.create_articles(
+                db_session=db_session, articles=articles[i : i + 100]
+            )
+
+
+async def bench_queries():
+    async with engine.begin() as conn:
+        await conn.run_sync(models.Base.metadata.create_all)
+    suffix = uuid.uuid4().hex[:8]
+    async with async_session() as db_session:
+        db_feed = await feed_crud.create_feed(
+            db_session=db_session,
+            feed=schemas.FeedCreate(name=f"bench-{suffix}", url=f"bench-{suffix}"),
+        )
+    await add_articles(feed_id=db_feed.id)
+
+    start = time.perf_counter()
+    for _ in range(ROUNDS):
+        async with async_session() as db_session:
+            articles = await get_articles_current(db_session, feed_id=db_feed.id)
+            await encode_current(articles)
+    current = (time.perf_counter() - start) / ROUNDS
+
+    start = time.perf_counter()
+    for _ in range(ROUNDS):
+        async with async_session() as db_session:
+            rows, _ = await article_crud.get_article_rows(
+                db_session, limit=LIMIT, feed_id=db_feed.id
+            )
+            encode_fast(rows)
+    fast = (time.perf_counter() - start) / ROUNDS
+
+    print(f"GET /articles/?limit={LIMIT}")
+    print(f"  current  {current * 1000:>8.2f} ms")
+    print(f"  fast     {fast * 1000:>8.2f} ms  ({current / fast:.1f}x)")
+    await engine.dispose()
+
+
+async def main():
+    arg_parser = argparse.ArgumentParser()
+    arg_parser.add_argument("--no-db", action="store_true")
+    args = arg_parser.parse_args()
+
+    await bench_serialization()
+    if not args.no_db:
+        await bench_queries()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
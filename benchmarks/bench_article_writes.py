@@ -0,0 +1,119 @@
+"""
+Benchmark article persistence
+
+Compares persisting articles one at a time (a commit for the article and one per
+matched rule) with the batched `crud.article.create_articles`.
+
+Requires a running, disposable postgres (see DB_HOST):
+    $ DB_HOST=localhost python benchmarks/bench_article_writes.py
+"""
+import asyncio
+import time
+import uuid
+from datetime import datetime
+from typing import List
+
+from cryptomonitor import schemas
+from cryptomonitor.database import async_session, engine, models
+from cryptomonitor.database.crud import article as article_crud
+from cryptomonitor.database.crud import feed as feed_crud
+from cryptomonitor.database.crud import rule as rule_crud
+
+ARTICLES = 1_000
+RULES_PER_ARTICLE = 3
+BATCH_SIZE = 50
+
+
+async def create_article_rule(db_session, article_id: int, rule_id: int):
+    """
+    Previous implementation of `crud.article.create_article_rule`
+    """
+    db_article_rule = models.ArticleRule(article_id=article_id, rule_id=rule_id)
+    db_session.add(db_article_rule)
+    await db_session.commit()
+    await db_session.refresh(db_article_rule)
+    return db_article_rule
+
+
+async def create_article_one_by_one(db_session, article: schemas.ArticleCreate):
+    """
+    Previous implementation of `crud.article.create_article`
+    """
+    db_article = models.Article(
+        title=article.title,
+        published=article.published,
+        url=article.url,
+        feed_id=article.feed_id,
+        body=article.body,
+    )
+    db_session.add(db_article)
+    await db_session.commit()
+    await db_session.refresh(db_article)
+    for rule in article.rules:
+        await create_article_rule(
+            db_session=db_session, article_id=db_article.id, rule_id=rule.id
+        )
+
+
+def make_articles(
+    feed_id: int, rules: List[schemas.Rule]
+) -> List[schemas.ArticleCreate]:
+    return [
+        schemas.ArticleCreate(
+            title=f"Article {i}",
+            body="lorem ipsum " * 200,
+            url=f"https://example.com/{uuid.uuid4()}",
+            feed_id=feed_id,
+            published=datetime.now(),
+            rules=rules,
+        )
+        for i in range(ARTICLES)
+    ]
+
+
+async def main():
+    async with engine.begin() as conn:
+        await conn.run_sync(models.Base.metadata.create_all)
+
+    suffix = uuid.uuid4().hex[:8]
+    async with async_session() as db_session:
+        db_feed = await feed_crud.create_feed(
+            db_session=db_session,
+            feed=schemas.FeedCreate(name=f"bench-{suffix}", url=f"bench-{suffix}"),
+        )
+        rules = [
+            schemas.Rule.from_orm(
+                await rule_crud.create_rule(
+                    db_session=db_session,
+                    rule=schemas.RuleCreate(
+                        name=f"bench-{suffix}-{i}", pattern=f"bench-{suffix}-{i}"
+                    ),
+                )
+            )
+            for i in range(RULES_PER_ARTICLE)
+        ]
+
+    async with async_session() as db_session:
+        articles = make_articles(feed_id=db_feed.id, rules=rules)
+        start = time.perf_counter()
+        for article in articles:
+            await create_article_one_by_one(db_session=db_session, article=article)
+        one_by_one = time.perf_counter() - start
+        print(f"one by one  {ARTICLES / one_by_one:>10.1f} articles/s")
+
+    async with async_session() as db_session:
+        articles = make_articles(feed_id=db_feed.id, rules=rules)
+        start = time.perf_counter()
+        for i in range(0, ARTICLES, BATCH_SIZE):
+            await article_crud.create_articles(
+                db_session=db_session, articles=articles[i : i + BATCH_SIZE]
+            )
+        batched = time.perf_counter() - start
+        print(f"batched     {ARTICLES / batched:>10.1f} articles/s")
+
+    print(f"Speedup: {one_by_one / batched:.1f}x")
+    await engine.dispose()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,275 @@
+"""
+Benchmark suite of the ingestion hot paths
+
+Generates a synthetic corpus of RSS and Atom feeds and article pages (see
+synthetic.py), serves it from an in-process stub server and times:
+    - feedparser.parse of every feed
+    - parser.parse_html of every article page
+    - rules.match_rules of every article body
+    - crud.article.create_articles of every article, in batches
+    - the ingestion cycle, `fetch_pending_feeds` then `fetch_pending_articles`
+      until no article job is left, from the stub server
+
+Results are printed and written as JSON with the version and parameters of the
+run, so that versions can be compared. The corpus only depends on the parameters.
+
+The crud and cycle stages require a running, disposable postgres (see DB_HOST),
+whose tables are dropped. Request rate limiting is disabled for the cycle so that
+it measures ingestion rather than the limiter.
+
+Usage:
+    $ python benchmarks/bench_ingestion.py --no-db --output results.json
+    $ DB_HOST=localhost python benchmarks/bench_ingestion.py --feeds 20 --entries 50
+"""
+import argparse
+import asyncio
+import json
+import logging
+import platform
+import subprocess
+import time
+import uuid
+from datetime import datetime
+from typing import Callable, Dict, Iterable, List
+
+import feedparser
+from synthetic import RULE_PATTERNS, Corpus, StubServer
+
+import cryptomonitor
+from cryptomonitor import schemas
+from cryptomonitor.config import ARTICLE_BATCH_SIZE
+from cryptomonitor.database import async_session, engine, models
+from cryptomonitor.database.crud import article as article_crud
+from cryptomonitor.database.crud import feed as feed_crud
+from cryptomonitor.ingestion import articles, feeds, parser, rules
+from cryptomonitor.ingestion.client import http_client
+from cryptomonitor.ingestion.executor import parse_executor
+from cryptomonitor.ingestion.rate_limiter import RateLimiter
+
+
+def get_git_revision() -> str:
+    try:
+        return subprocess.run(
+            ["git", "describe", "--always", "--dirty"],
+            capture_output=True,
+            text=True,
+            check=True,
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return "unknown"
+
+
+def create_result(count: int, seconds: float, size: int = 0) -> dict:
+    result = {
+        "count": count,
+        "seconds": seconds,
+        "per_second": count / seconds if seconds else 0.0,
+    }
+    if size:
+        result["mib_per_second"] = size / seconds / 1024 / 1024 if seconds else 0.0
+    return result
+
+
+def time_items(func: Callable, items: List, repeat: int, size: int = 0) -> dict:
+    start = time.perf_counter()
+    for _ in range(repeat):
+        for item in items:
+            func(item)
+    return create_result(
+        count=len(items) * repeat,
+        seconds=time.perf_counter() - start,
+        size=size * repeat,
+    )
+
+
+def make_rules(count: int) -> List[models.Rule]:
+    """
+    Return the fixture rules, then rules matching nothing up to `count` rules
+    """
+    patterns = RULE_PATTERNS + [
+        f".*((nomatch{i}a)|(nomatch{i}b)).*"
+        for i in range(max(0, count - len(RULE_PATTERNS)))
+    ]
+    return [
+        models.Rule(id=i, name=f"rule-{i}", pattern=pattern)
+        for i, pattern in enumerate(patterns[:count])
+    ]
+
+
+def bench_cpu(corpus: Corpus, stub_urls: Iterable[str], args) -> Dict[str, dict]:
+    documents = [
+        corpus.to_xml(feed, base_url) for feed, base_url in zip(corpus.feeds, stub_urls)
+    ]
+    pages = [article.to_html() for article in corpus.articles]
+    bodies = [parser.parse_html(page) for page in pages]
+    match_rules = make_rules(args.rules)
+    return {
+        "feedparser.parse": time_items(
+            feedparser.parse,
+            documents,
+            repeat=args.repeat,
+            size=sum(len(document) for document in documents),
+        ),
+        "parser.parse_html": time_items(
+            parser.parse_html,
+            pages,
+            repeat=args.repeat,
+            size=sum(len(page) for page in pages),
+        ),
+        "rules.match_rules": time_items(
+            lambda body: rules.match_rules(match_rules=match_rules, body=body),
+            bodies,
+            repeat=args.repeat,
+        ),
+    }
+
+
+async def bench_cycle(corpus: Corpus, stub: StubServer) -> dict:
+    async with async_session() as db_session:
+        for feed_index, feed in enumerate(corpus.feeds):
+            await feed_crud.create_feed_with_rules(
+                db_session=db_session,
+                feed=schemas.FeedCreate(
+                    name=f"bench-{feed_index}",
+                    url=stub.get_feed_url(feed_index),
+                    rules=[
+                        schemas.RuleCreate(name=f"rule-{i}", pattern=pattern)
+                        for i, pattern in enumerate(RULE_PATTERNS)
+                    ],
+                ),
+            )
+
+    start = time.perf_counter()
+    await feeds.fetch_pending_feeds()
+    feeds_seconds = time.perf_counter() - start
+
+    start = time.perf_counter()
+    while True:
+        async with async_session() as db_session:
+            pending = await article_crud.get_article_jobs_by_status(
+                db_session=db_session,
+                status=schemas.ArticleJobStatus.pending,
+                limit=1,
+            )
+        if not pending:
+            break
+        await articles.fetch_pending_articles()
+    articles_seconds = time.perf_counter() - start
+
+    async with async_session() as db_session:
+        persisted, _ = await article_crud.get_article_rows(
+            db_session=db_session, limit=len(corpus.articles)
+        )
+    seconds = feeds_seconds + articles_seconds
+    return {
+        **create_result(count=len(corpus.articles), seconds=seconds),
+        "fetch_pending_feeds_seconds": feeds_seconds,
+        "fetch_pending_articles_seconds": articles_seconds,
+        "articles_persisted": len(persisted),
+        "requests": stub.requests,
+    }
+
+
+async def bench_writes(corpus: Corpus, repeat: int) -> dict:
+    async with async_session() as db_session:
+        db_feed = await feed_crud.create_feed(
+            db_session=db_session,
+            feed=schemas.FeedCreate(name="bench-writes", url="bench-writes"),
+        )
+    seconds = 0.0
+    count = 0
+    for _ in range(repeat):
+        batch = [
+            schemas.ArticleCreate(
+                title=article.title,
+                body=article.body,
+                url=f"https://example.com/{uuid.uuid4()}",
+                feed_id=db_feed.id,
+                published=article.published,
+            )
+            for article in corpus.articles
+        ]
+        start = time.perf_counter()
+        async with async_session() as db_session:
+            for i in range(0, len(batch), ARTICLE_BATCH_SIZE):
+                await article_crud.create_articles(
+                    db_session=db_session, articles=batch[i : i + ARTICLE_BATCH_SIZE]
+                )
+        seconds += time.perf_counter() - start
+        count += len(batch)
+    return create_result(count=count, seconds=seconds)
+
+
+def print_results(stages: Dict[str, dict]):
+    for name, result in stages.items():
+        line = (
+            f"{name:<22} {result['count']:>8} in {result['seconds']:>8.3f}s"
+            f"  {result['per_second']:>10.1f}/s"
+        )
+        if "mib_per_second" in result:
+            line += f"  {result['mib_per_second']:>8.2f} MiB/s"
+        print(line)
+
+
+async def main():
+    arg_parser = argparse.ArgumentParser()
+    arg_parser.add_argument("--feeds", type=int, default=10)
+    arg_parser.add_argument("--entries", type=int, default=20, help="per feed")
+    arg_parser.add_argument("--words", type=int, default=600, help="per article")
+    arg_parser.add_argument("--rules", type=int, default=len(RULE_PATTERNS))
+    arg_parser.add_argument("--repeat", type=int, default=3)
+    arg_parser.add_argument("--seed", type=int, default=0)
+    arg_parser.add_argument("--no-db", action="store_true")
+    arg_parser.add_argument("--output", help="JSON results file")
+    args = arg_parser.parse_args()
+
+    logging.getLogger().setLevel(logging.WARNING)
+    corpus = Corpus(
+        feeds=args.feeds, entries=args.entries, words=args.words, seed=args.seed
+    )
+    # A host per feed, so articles are spread over hosts as in production
+    stub = StubServer(corpus, hosts=args.feeds)
+    await stub.start()
+    RateLimiter.request_delay = 1e-6
+    RateLimiter.burst = len(corpus.articles)
+    try:
+        stages = bench_cpu(
+            corpus,
+            stub_urls=[stub.get_base_url(i) for i in range(args.feeds)],
+            args=args,
+        )
+        if not args.no_db:
+            async with engine.begin() as conn:
+                await conn.run_sync(models.Base.metadata.drop_all)
+                await conn.run_sync(models.Base.metadata.create_all)
+            # Run first, article writes would make the cycle's articles duplicates
+            stages["ingestion cycle"] = await bench_cycle(corpus=corpus, stub=stub)
+            stages["crud.create_articles"] = await bench_writes(
+                corpus=corpus, repeat=args.repeat
+            )
+    finally:
+        await stub.stop()
+        await http_client.close()
+        await parse_executor.shutdown()
+        await engine.dispose()
+
+    print_results(stages)
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(
+                {
+                    "version": cryptomonitor.__version__,
+                    "revision": get_git_revision(),
+                    "python": platform.python_version(),
+                    "date": datetime.now().isoformat(),
+                    "parameters": vars(args),
+                    "stages": stages,
+                },
+                f,
+                indent=2,
+            )
+        print(f"Results written to {args.output}")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
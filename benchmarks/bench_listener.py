@@ -0,0 +1,93 @@
+"""
+Benchmark websocket fan-out
+
+Simulates 10k websocket subscribers, a tenth of them never reading, and
+broadcasts messages through the listener, with each slow consumer policy. Then
+simulates 10k subscribers each filtering on one of many rules. Delivery and
+buffering are checked by tests/test_listener.py.
+
+Usage:
+    $ python benchmarks/bench_listener.py
+"""
+import asyncio
+import time
+from datetime import datetime
+
+from cryptomonitor.listener import DISCONNECT, DROP_OLDEST, Listener, Subscription
+
+SUBSCRIBERS = 10_000
+SLOW_EVERY = 10
+MESSAGES = 200
+BUFFER_SIZE = 50
+RULES = 1_000
+
+
+async def consume(subscription: Subscription, received: list):
+    while True:
+        received.append(await subscription.get())
+
+
+async def simulate(policy: str):
+    listener = Listener()
+    consumers = []
+    for i in range(SUBSCRIBERS):
+        subscription = listener.subscribe(
+            Subscription(maxsize=BUFFER_SIZE, policy=policy)
+        )
+        if i % SLOW_EVERY:
+            consumers.append(asyncio.create_task(consume(subscription, [])))
+
+    message = {"id": 1, "title": "title", "body": "body " * 500, "published": None}
+    start = time.perf_counter()
+    for i in range(MESSAGES):
+        message["published"] = datetime.now()
+        listener.publish(message)
+        # Let fast subscribers drain their buffers
+        await asyncio.sleep(0)
+    elapsed = time.perf_counter() - start
+
+    await asyncio.sleep(0)
+    for consumer in consumers:
+        consumer.cancel()
+    await asyncio.gather(*consumers, return_exceptions=True)
+
+    deliveries = MESSAGES * SUBSCRIBERS
+    print(
+        f"{policy:<12} {SUBSCRIBERS} subscribers  {MESSAGES / elapsed:>8.1f} msgs/s"
+        f"  {deliveries / elapsed:>12.0f} deliveries/s"
+    )
+
+
+async def simulate_filtered():
+    listener = Listener()
+    for i in range(SUBSCRIBERS):
+        listener.subscribe(
+            Subscription(rule_ids=[i % RULES], body=not i % 2, maxsize=MESSAGES)
+        )
+    message = {
+        "id": 1,
+        "title": "title",
+        "body": "body " * 500,
+        "feed_id": 1,
+        "published": datetime.now(),
+        "rule_ids": [],
+    }
+    start = time.perf_counter()
+    for i in range(MESSAGES):
+        message["rule_ids"] = [i % RULES, (i + 1) % RULES]
+        listener.publish(message)
+    elapsed = time.perf_counter() - start
+
+    print(
+        f"{'filtered':<12} {SUBSCRIBERS} subscribers  {MESSAGES / elapsed:>8.1f} msgs/s"
+    )
+
+
+async def main():
+    for policy in (DROP_OLDEST, DISCONNECT):
+        await simulate(policy)
+    await simulate_filtered()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,91 @@
+"""
+Benchmark html to text extraction
+
+Compares the previous BeautifulSoup based `parse_html` with the streaming
+extractor on a corpus of saved pages, and reports any page where the
+extracted text differs.
+
+Usage:
+    $ python benchmarks/bench_parse_html.py <corpus dir>
+
+The corpus is every *.html file in the directory, e.g. article pages saved with
+`curl -o`.
+"""
+import sys
+import time
+from pathlib import Path
+from typing import Callable, List
+
+from bs4 import BeautifulSoup
+
+from cryptomonitor.ingestion.parser import parse_html
+
+REPEAT = 3
+
+
+def parse_html_bs4(html: str):
+    """
+    Previous implementation of `parser.parse_html`
+    """
+    soup = BeautifulSoup(html, "html.parser")
+    text = soup.find_all(text=True)
+    # Remove unwanted tag elements:
+    cleaned_text = ""
+    blacklist = [
+        "[document]",
+        "noscript",
+        "header",
+        "html",
+        "meta",
+        "head",
+        "input",
+        "script",
+        "style",
+    ]
+    for item in text:
+        if item.parent.name not in blacklist:
+            cleaned_text += "{} ".format(item)
+
+    cleaned_text = cleaned_text.replace("\t", "")
+    return cleaned_text.strip()
+
+
+def bench(label: str, func: Callable, pages: List[bytes]) -> float:
+    size = sum(len(page) for page in pages) * REPEAT
+    start = time.perf_counter()
+    for _ in range(REPEAT):
+        for page in pages:
+            func(page)
+    elapsed = time.perf_counter() - start
+    print(
+        f"{label:<14} {len(pages) * REPEAT / elapsed:>10.1f} pages/s"
+        f"  {size / elapsed / 1024 / 1024:>8.2f} MiB/s"
+    )
+    return elapsed
+
+
+def main(corpus: Path):
+    paths = sorted(corpus.glob("*.html"))
+    if not paths:
+        raise Exception(f"No *.html files found in {corpus}")
+    pages = [path.read_bytes() for path in paths]
+    print(f"{len(pages)} pages, {sum(len(page) for page in pages) / 1024:.0f} KiB")
+
+    different = [
+        path.name
+        for path, page in zip(paths, pages)
+        if parse_html(page) != parse_html_bs4(page)
+    ]
+    if different:
+        print(f"Extracted text differs for: {', '.join(different)}")
+
+    baseline = bench("BeautifulSoup", parse_html_bs4, pages)
+    streaming = bench("TextExtractor", parse_html, pages)
+    print(f"Speedup: {baseline / streaming:.1f}x")
+
+
+if __name__ == "__main__":
+    try:
+        main(Path(sys.argv[1]))
+    except IndexError:
+        raise Exception("Provide corpus directory argument")
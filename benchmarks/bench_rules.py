@@ -0,0 +1,93 @@
+"""
+Benchmark rule matching throughput
+
+Compares the previous per-article `re.match(rule.pattern, body)` loop with the
+compiled rule engine, without and with its literal prefilter, at 10, 1k and 10k
+rules. Bodies contain literals of some of the rules so that a few of them match.
+
+Usage:
+    $ python benchmarks/bench_rules.py
+"""
+import random
+import re
+import string
+import time
+from types import SimpleNamespace
+from typing import List
+
+from cryptomonitor.rule_engine import RuleEngine
+
+RULE_COUNTS = [10, 1_000, 10_000]
+ARTICLES = 20
+BODY_WORDS = 400
+RULE_WORDS = 20
+
+random.seed(0)
+
+
+def random_word(length: int = 7) -> str:
+    return "".join(random.choices(string.ascii_lowercase, k=length))
+
+
+def make_rules(count: int) -> List[SimpleNamespace]:
+    return [
+        SimpleNamespace(
+            id=i, pattern=f".*(({random_word()})|({random_word()})).*{random_word(4)}.*"
+        )
+        for i in range(count)
+    ]
+
+
+def make_bodies(count: int, rules: List[SimpleNamespace]) -> List[str]:
+    rule_words = [
+        word for rule in rules for word in re.findall(r"[a-z]+", rule.pattern)
+    ]
+    bodies = []
+    for _ in range(count):
+        words = [random_word(random.randint(3, 9)) for _ in range(BODY_WORDS)]
+        words += random.sample(rule_words, min(RULE_WORDS, len(rule_words)))
+        random.shuffle(words)
+        bodies.append(" ".join(words))
+    return bodies
+
+
+def match_rules_baseline(rules, body: str) -> List[int]:
+    return [rule.id for rule in rules if re.match(rule.pattern, body)]
+
+
+def bench(label: str, func, rules, bodies) -> float:
+    start = time.perf_counter()
+    for body in bodies:
+        func(rules, body)
+    elapsed = time.perf_counter() - start
+    rate = len(bodies) / elapsed
+    print(f"{label:<12} {len(rules):>6} rules  {rate:>10.1f} articles/s")
+    return rate
+
+
+def main():
+    for count in RULE_COUNTS:
+        rules = make_rules(count)
+        bodies = make_bodies(ARTICLES, rules)
+        engine = RuleEngine(prefilter=False)
+        prefiltered = RuleEngine()
+        # Build once outside of the timed loop, as ingestion would
+        engine.get_rule_set(rules)
+        prefiltered.get_rule_set(rules)
+        # All paths match the same rules
+        for body in bodies:
+            expected = match_rules_baseline(rules, body)
+            assert engine.match(rules=rules, body=body) == expected
+            assert prefiltered.match(rules=rules, body=body) == expected
+        bench("re.match", match_rules_baseline, rules, bodies)
+        bench("RuleEngine", lambda r, b: engine.match(rules=r, body=b), rules, bodies)
+        bench(
+            "prefilter",
+            lambda r, b: prefiltered.match(rules=r, body=b),
+            rules,
+            bodies,
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,226 @@
+"""
+Synthetic feeds and article pages for benchmarks, and a stub server serving them
+
+Corpora are generated from a seed so that runs are reproducible. Even feeds are
+RSS with full article content, parsed from the feed, odd feeds are Atom with
+summaries only, whose articles are queued as article jobs and fetched from the
+stub server. Bodies mix filler words with the keywords of the fixture rules, so
+that some articles match.
+
+The stub server listens on several loopback addresses (127.0.0.1, 127.0.0.2, ...)
+so that articles are spread over distinct hosts, as they are in production. These
+addresses are only routed to the loopback interface by default on Linux.
+"""
+import random
+from dataclasses import dataclass, field
+from datetime import datetime, timedelta
+from email.utils import format_datetime
+from html import escape
+from typing import Dict, List
+
+from aiohttp import web
+
+# fmt: off
+FILLER = [
+    "market", "price", "token", "network", "wallet", "block", "chain", "fee",
+    "trader", "volume", "protocol", "validator", "miner", "exchange", "report",
+    "analyst", "week", "rally", "support", "resistance", "liquidity", "yield",
+]
+KEYWORDS = [
+    "hack", "exploit", "vulnerability", "Coinbase", "Binance", "listing",
+    "Ethereum", "ETH", "fork", "upgrade", "Bitcoin", "BTC",
+]
+# fmt: on
+KEYWORD_RATIO = 0.02
+
+# Patterns of the fixture rules, see `cryptomonitor.database.fixtures`
+RULE_PATTERNS = [
+    ".*((hack)|(exploit)|(vuln)).*",
+    ".*((Coinbase)|(Binance)).*list.*",
+    ".*((Ethereum)|(ETH)).*((fork)|(upgrad)).*",
+    ".*([Bb]itcoin|BTC).*",
+]
+
+PAGE_TEMPLATE = """<!DOCTYPE html>
+<html>
+<head>
+<meta charset="utf-8">
+<title>{title}</title>
+<style>body {{ font-family: sans-serif; }}</style>
+<script>window.analytics = {{ page: "{title}" }};</script>
+</head>
+<body>
+<header><nav><a href="/">Home</a> <a href="/markets">Markets</a></nav></header>
+<article>
+<h1>{title}</h1>
+{paragraphs}
+</article>
+<footer><p>Copyright benchmark news</p></footer>
+</body>
+</html>
+"""
+
+
+@dataclass
+class Article:
+    path: str
+    title: str
+    published: datetime
+    body: str
+
+    def to_html(self) -> str:
+        paragraphs = "\n".join(
+            f"<p>{escape(paragraph)}</p>" for paragraph in self.body.split("\n")
+        )
+        return PAGE_TEMPLATE.format(title=escape(self.title), paragraphs=paragraphs)
+
+
+@dataclass
+class Feed:
+    path: str
+    kind: str
+    articles: List[Article] = field(default_factory=list)
+
+
+class Corpus:
+    def __init__(
+        self,
+        feeds: int = 10,
+        entries: int = 20,
+        words: int = 600,
+        seed: int = 0,
+    ):
+        self.random = random.Random(seed)
+        self.words = words
+        self.now = datetime(2022, 1, 1)
+        self.feeds: List[Feed] = [
+            Feed(path=f"/feeds/{i}.xml", kind="rss" if i % 2 == 0 else "atom")
+            for i in range(feeds)
+        ]
+        for feed_index, feed in enumerate(self.feeds):
+            for entry_index in range(entries):
+                feed.articles.append(
+                    Article(
+                        path=f"/articles/{feed_index}/{entry_index}.html",
+                        title=f"Story {entry_index} of feed {feed_index}",
+                        published=self.now - timedelta(minutes=entry_index * 7),
+                        body=self.make_body(),
+                    )
+                )
+
+    @property
+    def articles(self) -> List[Article]:
+        return [article for feed in self.feeds for article in feed.articles]
+
+    def make_body(self) -> str:
+        words = [
+            self.random.choice(KEYWORDS)
+            if self.random.random() < KEYWORD_RATIO
+            else self.random.choice(FILLER)
+            for _ in range(self.words)
+        ]
+        return "\n".join(
+            " ".join(words[i : i + 60]) + "." for i in range(0, len(words), 60)
+        )
+
+    def to_xml(self, feed: Feed, base_url: str) -> str:
+        if feed.kind == "rss":
+            return self.to_rss(feed, base_url)
+        return self.to_atom(feed, base_url)
+
+    def to_rss(self, feed: Feed, base_url: str) -> str:
+        items = "".join(
+            f"""<item>
+<title>{escape(article.title)}</title>
+<link>{base_url}{article.path}</link>
+<guid>{base_url}{article.path}</guid>
+<pubDate>{format_datetime(article.published)}</pubDate>
+<description>{escape(article.body[:200])}</description>
+<content:encoded><![CDATA[{article.to_html()}]]></content:encoded>
+</item>
+"""
+            for article in feed.articles
+        )
+        return f"""<?xml version="1.0" encoding="UTF-8"?>
+<rss version="2.0" xmlns:content="http://purl.org/rss/1.0/modules/content/">
+<channel>
+<title>Benchmark feed {feed.path}</title>
+<link>{base_url}</link>
+<description>Synthetic feed</description>
+<lastBuildDate>{format_datetime(self.now)}</lastBuildDate>
+{items}</channel>
+</rss>
+"""
+
+    def to_atom(self, feed: Feed, base_url: str) -> str:
+        entries = "".join(
+            f"""<entry>
+<title>{escape(article.title)}</title>
+<link href="{base_url}{article.path}"/>
+<id>{base_url}{article.path}</id>
+<published>{article.published.isoformat()}Z</published>
+<updated>{article.published.isoformat()}Z</updated>
+<summary>{escape(article.body[:200])}</summary>
+</entry>
+"""
+            for article in feed.articles
+        )
+        return f"""<?xml version="1.0" encoding="UTF-8"?>
+<feed xmlns="http://www.w3.org/2005/Atom">
+<title>Benchmark feed {feed.path}</title>
+<id>{base_url}{feed.path}</id>
+<updated>{self.now.isoformat()}Z</updated>
+{entries}</feed>
+"""
+
+
+class StubServer:
+    """
+    Serve the feeds and article pages of a corpus, article links of feed i pointing
+    to host 127.0.0.(i % hosts + 1)
+    """
+
+    def __init__(self, corpus: Corpus, hosts: int = 1):
+        self.corpus = corpus
+        self.hosts = [f"127.0.0.{i + 1}" for i in range(hosts)]
+        self.requests = 0
+        self._runner = None
+        # host -> base url, set once started
+        self.base_urls: Dict[str, str] = {}
+        self._documents: Dict[str, str] = {}
+
+    async def start(self):
+        app = web.Application()
+        app.router.add_get("/{path:.*}", self.handle)
+        self._runner = web.AppRunner(app, access_log=None)
+        await self._runner.setup()
+        for host in self.hosts:
+            site = web.TCPSite(self._runner, host, 0)
+            await site.start()
+            _, port = self._runner.addresses[-1][:2]
+            self.base_urls[host] = f"http://{host}:{port}"
+
+        for feed_index, feed in enumerate(self.corpus.feeds):
+            base_url = self.get_base_url(feed_index)
+            self._documents[feed.path] = self.corpus.to_xml(feed, base_url)
+            for article in feed.articles:
+                self._documents[article.path] = article.to_html()
+
+    async def stop(self):
+        if self._runner is not None:
+            await self._runner.cleanup()
+            self._runner = None
+
+    def get_base_url(self, feed_index: int) -> str:
+        return self.base_urls[self.hosts[feed_index % len(self.hosts)]]
+
+    def get_feed_url(self, feed_index: int) -> str:
+        return self.get_base_url(feed_index) + self.corpus.feeds[feed_index].path
+
+    async def handle(self, request: web.Request) -> web.Response:
+        self.requests += 1
+        document = self._documents.get(request.path)
+        if document is None:
+            raise web.HTTPNotFound()
+        content_type = "text/html" if request.path.endswith(".html") else "text/xml"
+        return web.Response(text=document, content_type=content_type)
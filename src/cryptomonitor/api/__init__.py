@@ -1,18 +1,55 @@
 import asyncio
+from datetime import datetime
+from typing import List, Optional
 
-from fastapi import Depends, FastAPI, HTTPException, WebSocket, WebSocketDisconnect
-from fastapi.encoders import jsonable_encoder
+from fastapi import (
+    Depends,
+    FastAPI,
+    HTTPException,
+    Query,
+    Request,
+    Response,
+    WebSocket,
+    WebSocketDisconnect,
+    status,
+)
+from fastapi.responses import FileResponse, ORJSONResponse
+from pydantic import ValidationError
+from sqlalchemy.exc import NoResultFound
 from sqlalchemy.ext.asyncio import AsyncSession
 
-from cryptomonitor import schemas
-from cryptomonitor.database import engine, fixtures, get_session, models
+from cryptomonitor import metrics, schemas
+from cryptomonitor.config import RULE_BACKFILL_ON_CREATE
+from cryptomonitor.database import (
+    engine,
+    fixtures,
+    get_pool_status,
+    get_session,
+    models,
+)
 from cryptomonitor.database.crud import article as article_crud
 from cryptomonitor.database.crud import feed as feed_crud
 from cryptomonitor.database.crud import rule as rule_crud
-from cryptomonitor.ingestion import articles, feeds, task_runner
-from cryptomonitor.listener import global_listener
+from cryptomonitor.database.writer import article_writer
+from cryptomonitor.ingestion import articles, task_runner
+from cryptomonitor.ingestion.backfill import rule_backfiller
+from cryptomonitor.ingestion.client import http_client
+from cryptomonitor.ingestion.dedup import deduplicator
+from cryptomonitor.ingestion.executor import parse_executor
+from cryptomonitor.ingestion.scheduler import feed_scheduler
+from cryptomonitor.listener import (
+    SlowConsumer,
+    Subscription,
+    SubscriptionClosed,
+    global_listener,
+)
+from cryptomonitor.profiling import profiler
+from cryptomonitor.read_cache import CachedRead, global_read_cache
 
-app = FastAPI()
+app = FastAPI(default_response_class=ORJSONResponse)
+
+# Response header holding the cursor of the next page of paginated endpoints
+NEXT_CURSOR_HEADER = "X-Next-Cursor"
 
 
 @app.on_event("startup")
@@ -28,17 +65,24 @@ async def app_startup():
     # Start event listener
     await global_listener.start_listening()
 
+    # Resume rule backfills interrupted by a restart
+    await rule_backfiller.resume()
+
     # Uncomment to run ingestion run using fastapi background tasks,
     # DO NOT RUN 'feed' and 'article' docker containers when doing so
     # Not that it is ideal to have long running background tasks tied to your api thread
     #
-    asyncio.create_task(task_runner.run(feeds.fetch_pending_feeds))
+    asyncio.create_task(feed_scheduler.run())
     asyncio.create_task(task_runner.run(articles.fetch_pending_articles))
 
 
 @app.on_event("shutdown")
 async def app_shutdown():
     await global_listener.stop_listening()
+    await rule_backfiller.stop()
+    await article_writer.flush()
+    await parse_executor.shutdown()
+    await http_client.close()
 
 
 @app.post("/feeds/", response_model=schemas.Feed)
@@ -51,46 +95,149 @@ async def create_feed(
     return await feed_crud.create_feed(db_session=db, feed=feed)
 
 
+def create_cached_response(request: Request, read: CachedRead) -> Response:
+    """
+    Return a cached read, or 304 Not Modified if the client holds its ETag
+    """
+    headers = {"ETag": read.etag, "Cache-Control": "no-cache"}
+    if_none_match = request.headers.get("if-none-match", "")
+    etags = {etag.strip().removeprefix("W/") for etag in if_none_match.split(",")}
+    if read.etag in etags or "*" in etags:
+        return Response(status_code=status.HTTP_304_NOT_MODIFIED, headers=headers)
+    return Response(content=read.body, media_type="application/json", headers=headers)
+
+
 @app.get("/feeds/", response_model=list[schemas.Feed])
 async def read_feeds(
-    skip: int = 0, limit: int = 100, db: AsyncSession = Depends(get_session)
+    request: Request,
+    skip: int = 0,
+    limit: int = 100,
+    db: AsyncSession = Depends(get_session),
 ):
-    feeds = await feed_crud.get_feeds(db, skip=skip, limit=limit)
-    return feeds
+    read = await feed_crud.get_cached_feeds(db, skip=skip, limit=limit)
+    return create_cached_response(request=request, read=read)
 
 
 @app.get("/feeds/{feed_id}", response_model=schemas.Feed)
-async def read_feed(feed_id: int, db: AsyncSession = Depends(get_session)):
-    db_feed = await feed_crud.get_feed(db, feed_id=feed_id)
-    if db_feed is None:
+async def read_feed(
+    request: Request, feed_id: int, db: AsyncSession = Depends(get_session)
+):
+    read = await feed_crud.get_cached_feed(db, feed_id=feed_id)
+    if read is None:
         raise HTTPException(status_code=404, detail="Feed not found")
-    return db_feed
+    return create_cached_response(request=request, read=read)
 
 
 @app.post("/rules/", response_model=schemas.Rule)
 async def create_rule(
     rule: schemas.RuleCreate, db: AsyncSession = Depends(get_session)
 ):
-    db_rule = await rule_crud.get_rule_by_pattern(db, pattern=rule.pattern)
-    if db_rule:
-        raise HTTPException(status_code=400, detail="Rule pattern already registered")
-    return await rule_crud.create_rule(db=db, rule=rule)
+    """
+    Create a rule, matched against existing articles in the background unless
+    RULE_BACKFILL_ON_CREATE is disabled
+    """
+    try:
+        await rule_crud.get_rule_by_pattern(db, pattern=rule.pattern)
+    except NoResultFound:
+        db_rule = await rule_crud.create_rule(db_session=db, rule=rule)
+        if RULE_BACKFILL_ON_CREATE:
+            await rule_backfiller.start(rule_id=db_rule.id)
+        return db_rule
+    raise HTTPException(status_code=400, detail="Rule pattern already registered")
 
 
 @app.get("/rules/", response_model=list[schemas.Rule])
 async def read_rules(
-    skip: int = 0, limit: int = 100, db: AsyncSession = Depends(get_session)
+    request: Request,
+    skip: int = 0,
+    limit: int = 100,
+    db: AsyncSession = Depends(get_session),
 ):
-    rules = await rule_crud.get_rules(db, skip=skip, limit=limit)
-    return rules
+    read = await rule_crud.get_cached_rules(db, skip=skip, limit=limit)
+    return create_cached_response(request=request, read=read)
 
 
 @app.get("/rules/{rule_id}", response_model=schemas.Rule)
-async def read_rule(rule_id: int, db: AsyncSession = Depends(get_session)):
-    db_rule = await rule_crud.get_rule(db, feed_id=rule_id)
-    if db_rule is None:
+async def read_rule(
+    request: Request, rule_id: int, db: AsyncSession = Depends(get_session)
+):
+    read = await rule_crud.get_cached_rule(db, rule_id=rule_id)
+    if read is None:
         raise HTTPException(status_code=404, detail="Rule not found")
-    return db_rule
+    return create_cached_response(request=request, read=read)
+
+
+@app.post("/rules/{rule_id}/backfill", response_model=schemas.RuleBackfill)
+async def start_rule_backfill(rule_id: int, restart: bool = False):
+    """
+    Match a rule against existing articles in the background, resuming from the
+    last checkpoint unless complete or `restart`
+    """
+    backfill = await rule_backfiller.start(rule_id=rule_id, restart=restart)
+    if backfill is None:
+        raise HTTPException(status_code=404, detail="Rule not found")
+    return backfill
+
+
+@app.get("/rules/{rule_id}/backfill", response_model=schemas.RuleBackfill)
+async def read_rule_backfill(rule_id: int):
+    backfill = await rule_backfiller.get_status(rule_id=rule_id)
+    if backfill is None:
+        raise HTTPException(status_code=404, detail="Rule backfill not found")
+    return backfill
+
+
+# Defined before /articles/{article_id}, which would otherwise match it
+@app.get(
+    "/articles/search",
+    response_model=list[schemas.ArticleSearchResult],
+    response_model_exclude_unset=True,
+)
+@profiler.profiled("search_articles")
+async def search_articles(
+    response: Response,
+    q: str = Query(..., min_length=1),
+    cursor: Optional[str] = None,
+    limit: int = Query(100, gt=0, le=1000),
+    rule_id: Optional[int] = None,
+    feed_id: Optional[int] = None,
+    published_after: Optional[datetime] = None,
+    published_before: Optional[datetime] = None,
+    fields: List[schemas.ArticleField] = Query([]),
+    db: AsyncSession = Depends(get_session),
+):
+    """
+    Search article titles and bodies, best match first, the next page is read with
+    the X-Next-Cursor header
+
+    `q` supports web search syntax: "quoted phrases", `or` and -exclusions
+    """
+    try:
+        articles, next_cursor = await article_crud.search_articles(
+            db,
+            query=q,
+            cursor=cursor,
+            limit=limit,
+            rule_id=rule_id,
+            feed_id=feed_id,
+            published_after=published_after,
+            published_before=published_before,
+            body=schemas.ArticleField.body in fields,
+        )
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    if next_cursor is not None:
+        response.headers[NEXT_CURSOR_HEADER] = next_cursor
+    return articles
+
+
+def create_page_response(items: List[dict], next_cursor: Optional[str]) -> Response:
+    """
+    Return a page of rows serialized as is, the response model of the endpoint is
+    only used for documentation
+    """
+    headers = {} if next_cursor is None else {NEXT_CURSOR_HEADER: next_cursor}
+    return ORJSONResponse(content=items, headers=headers)
 
 
 @app.get("/articles/{article_id}", response_model=schemas.Article)
@@ -101,30 +248,201 @@ async def read_article(article_id: int, db: AsyncSession = Depends(get_session))
     return db_article
 
 
-@app.get("/articles/", response_model=list[schemas.Article])
+@app.get(
+    "/articles/",
+    response_model=list[schemas.ArticleSummary],
+    response_model_exclude_unset=True,
+)
+@profiler.profiled("read_articles")
 async def read_articles(
-    skip: int = 0, limit: int = 100, db: AsyncSession = Depends(get_session)
+    cursor: Optional[str] = None,
+    limit: int = Query(100, gt=0, le=1000),
+    feed_id: Optional[int] = None,
+    fields: List[schemas.ArticleField] = Query([]),
+    db: AsyncSession = Depends(get_session),
 ):
-    articles = await article_crud.get_articles(db, skip=skip, limit=limit)
-    return articles
+    """
+    Read articles newest first, the next page is read with the X-Next-Cursor header
+
+    Bodies are only included with `fields=body`
+    """
+    try:
+        articles, next_cursor = await article_crud.get_article_rows(
+            db,
+            cursor=cursor,
+            limit=limit,
+            feed_id=feed_id,
+            body=schemas.ArticleField.body in fields,
+        )
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    return create_page_response(items=articles, next_cursor=next_cursor)
 
 
 @app.get("/article-jobs/", response_model=list[schemas.ArticleJob])
 async def read_articles_jobs(
-    skip: int = 0, limit: int = 100, db: AsyncSession = Depends(get_session)
+    cursor: Optional[str] = None,
+    limit: int = Query(100, gt=0, le=1000),
+    status: Optional[schemas.ArticleJobStatus] = None,
+    db: AsyncSession = Depends(get_session),
+):
+    """
+    Read article jobs oldest first, the next page is read with the X-Next-Cursor
+    header
+    """
+    try:
+        article_jobs, next_cursor = await article_crud.get_article_job_rows(
+            db, cursor=cursor, limit=limit, status=status
+        )
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    return create_page_response(items=article_jobs, next_cursor=next_cursor)
+
+
+async def collect_metrics(db_session: AsyncSession):
+    """
+    Copy the values held by other components into their metrics
+    """
+    job_counts = await article_crud.count_article_jobs_by_status(db_session=db_session)
+    for job_status in schemas.ArticleJobStatus:
+        metrics.article_jobs.set(
+            job_counts.get(job_status.value, 0), status=job_status.value
+        )
+
+    listener_stats = global_listener.get_stats()
+    metrics.websocket_subscribers.set(listener_stats["subscribers"])
+    metrics.websocket_queued_messages.set(listener_stats["buffered"], aggregate="total")
+    metrics.websocket_queued_messages.set(
+        listener_stats["buffered_max"], aggregate="max"
+    )
+    metrics.queue_depth.set(listener_stats["pending_articles"], queue="article_events")
+    metrics.queue_depth.set(article_writer.pending, queue="article_writer")
+    metrics.queue_depth.set(parse_executor.in_flight, queue="parse_executor")
+
+    pool_status = get_pool_status()
+    if "size" in pool_status:
+        # Overflow is negative until the pool is full
+        for state in ("checked_in", "checked_out", "overflow"):
+            metrics.db_pool_connections.set(max(0, pool_status[state]), state=state)
+        metrics.db_pool_checkouts.set(pool_status["checkouts"])
+        metrics.db_pool_checkout_wait_seconds.set(pool_status["wait_total"])
+
+
+@app.get("/metrics", include_in_schema=False)
+async def read_metrics(db: AsyncSession = Depends(get_session)):
+    """
+    Metrics in the Prometheus text format
+    """
+    await collect_metrics(db_session=db)
+    return Response(content=metrics.registry.render(), media_type=metrics.CONTENT_TYPE)
+
+
+@app.post("/profiling")
+async def start_profiling(target: str, runs: int = Query(1, gt=0, le=100)):
+    """
+    Profile the next `runs` runs of `target`, one of the profiled ingestion cycles,
+    feed polls or requests listed by GET /profiling
+    """
+    try:
+        profiler.request(target=target, runs=runs)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    return profiler.get_status()
+
+
+@app.get("/profiling")
+async def read_profiling():
+    return profiler.get_status()
+
+
+@app.get("/profiling/{file}", response_class=FileResponse)
+async def read_profile(file: str):
+    """
+    Download a recent profile, in the collapsed stack format
+    """
+    profile = profiler.get_profile(file)
+    if profile is None:
+        raise HTTPException(status_code=404, detail="Profile not found")
+    return FileResponse(profile.path, media_type="text/plain", filename=file)
+
+
+@app.get("/feed-schedule/")
+async def read_feed_schedule():
+    return feed_scheduler.get_status()
+
+
+@app.get("/database/pool")
+async def read_database_pool():
+    return get_pool_status()
+
+
+@app.get("/dedup")
+async def read_dedup():
+    return deduplicator.get_stats()
+
+
+@app.get("/read-cache")
+async def read_read_cache():
+    return global_read_cache.get_stats()
+
+
+async def receive_subscription_filters(
+    websocket: WebSocket, subscription: Subscription
 ):
-    article_jobs = await article_crud.get_article_jobs(db, skip=skip, limit=limit)
-    return article_jobs
+    """
+    Apply subscription filters sent by the client, until it disconnects
+    """
+    try:
+        while True:
+            try:
+                subscription_filter = schemas.SubscriptionFilter.parse_obj(
+                    await websocket.receive_json()
+                )
+            except (ValidationError, ValueError) as e:
+                await websocket.send_json({"error": str(e)})
+                continue
+            global_listener.update_subscription(
+                subscription=subscription,
+                rule_ids=subscription_filter.rules,
+                feed_ids=subscription_filter.feeds,
+                body=schemas.ArticleField.body in subscription_filter.fields,
+            )
+    except WebSocketDisconnect:
+        global_listener.unsubscribe(subscription)
 
 
 @app.websocket("/ws")
-async def websocket_endpoint(websocket: WebSocket, response_model=models.Article):
+async def websocket_endpoint(
+    websocket: WebSocket,
+    rules: List[int] = Query([]),
+    feeds: List[int] = Query([]),
+    fields: List[schemas.ArticleField] = Query([]),
+):
+    """
+    Stream new articles matching any of `rules` and from any of `feeds`
+
+    Filters can be replaced by sending a `SubscriptionFilter` as JSON. Articles are
+    sent without their body unless subscribed with `fields=body`.
+    """
     await websocket.accept()
-    q: asyncio.Queue = asyncio.Queue()
-    await global_listener.subscribe(q=q)
+    subscription = global_listener.subscribe(
+        Subscription(
+            rule_ids=rules,
+            feed_ids=feeds,
+            body=schemas.ArticleField.body in fields,
+        )
+    )
+    receiver = asyncio.create_task(
+        receive_subscription_filters(websocket=websocket, subscription=subscription)
+    )
     try:
         while True:
-            data = await q.get()
-            await websocket.send_text(jsonable_encoder(data))
-    except WebSocketDisconnect:
+            message = await subscription.get()
+            await websocket.send_text(message)
+    except SlowConsumer:
+        await websocket.close(code=status.WS_1013_TRY_AGAIN_LATER)
+    except (SubscriptionClosed, WebSocketDisconnect):
         return
+    finally:
+        receiver.cancel()
+        global_listener.unsubscribe(subscription)
@@ -1 +1,88 @@
+import os
+
 HEADERS = {"User-Agent": "cryptomonitor/0.0.1"}
+
+# Executor used for cpu bound parsing, either "process" or "thread"
+PARSE_EXECUTOR = os.environ.get("PARSE_EXECUTOR", "process")
+PARSE_WORKERS = int(os.environ.get("PARSE_WORKERS", os.cpu_count() or 1))
+# Maximum number of parse jobs submitted to the executor at once
+PARSE_MAX_IN_FLIGHT = int(os.environ.get("PARSE_MAX_IN_FLIGHT", PARSE_WORKERS * 2))
+
+# Shared ingestion http client
+HTTP_LIMIT = int(os.environ.get("HTTP_LIMIT", 100))
+HTTP_LIMIT_PER_HOST = int(os.environ.get("HTTP_LIMIT_PER_HOST", 4))
+HTTP_KEEPALIVE_TIMEOUT = float(os.environ.get("HTTP_KEEPALIVE_TIMEOUT", 60))
+HTTP_DNS_TTL = int(os.environ.get("HTTP_DNS_TTL", 300))
+HTTP_CONNECT_TIMEOUT = float(os.environ.get("HTTP_CONNECT_TIMEOUT", 10))
+HTTP_READ_TIMEOUT = float(os.environ.get("HTTP_READ_TIMEOUT", 30))
+
+# Articles are persisted in batches of up to ARTICLE_BATCH_SIZE, waiting at most
+# ARTICLE_BATCH_DELAY seconds for a batch to fill
+ARTICLE_BATCH_SIZE = int(os.environ.get("ARTICLE_BATCH_SIZE", 50))
+ARTICLE_BATCH_DELAY = float(os.environ.get("ARTICLE_BATCH_DELAY", 0.2))
+
+# Postgres compression of stored article bodies, e.g. "lz4" or "pglz", empty to keep
+# the server default
+ARTICLE_BODY_COMPRESSION = os.environ.get("ARTICLE_BODY_COMPRESSION", "lz4")
+
+# Near-duplicate articles, whose body has an estimated similarity of at least
+# DEDUP_MIN_SIMILARITY with an already persisted article, are persisted without body
+# or rules and linked to it ("mark"), dropped ("skip"), or not detected ("off").
+# Bodies shorter than DEDUP_MIN_WORDS words are not fingerprinted.
+DEDUP_POLICY = os.environ.get("DEDUP_POLICY", "mark")
+DEDUP_MIN_SIMILARITY = float(os.environ.get("DEDUP_MIN_SIMILARITY", 0.8))
+DEDUP_MIN_WORDS = int(os.environ.get("DEDUP_MIN_WORDS", 50))
+# Fingerprints of recent articles kept in memory in front of the persisted index
+DEDUP_CACHE_SIZE = int(os.environ.get("DEDUP_CACHE_SIZE", 10000))
+
+# Per host request rate, a request every RATE_LIMIT_DELAY seconds with bursts of up
+# to RATE_LIMIT_BURST requests
+RATE_LIMIT_DELAY = float(os.environ.get("RATE_LIMIT_DELAY", 5))
+RATE_LIMIT_BURST = int(os.environ.get("RATE_LIMIT_BURST", 1))
+# Pending article jobs taken per cycle, in total and per host
+ARTICLE_JOBS_LIMIT = int(os.environ.get("ARTICLE_JOBS_LIMIT", 100))
+ARTICLE_JOBS_PER_HOST = int(os.environ.get("ARTICLE_JOBS_PER_HOST", 2))
+# Seconds an article worker holds a claimed job before it is returned to pending
+ARTICLE_JOB_LEASE = int(os.environ.get("ARTICLE_JOB_LEASE", 300))
+
+# Feed polling, intervals adapt to each feed's publish rate within these bounds
+FEED_POLL_MIN_INTERVAL = float(os.environ.get("FEED_POLL_MIN_INTERVAL", 10))
+FEED_POLL_MAX_INTERVAL = float(os.environ.get("FEED_POLL_MAX_INTERVAL", 900))
+FEED_POLL_CONCURRENCY = int(os.environ.get("FEED_POLL_CONCURRENCY", 20))
+# Seconds between reloads of the feed list, picking up new and removed feeds
+FEED_REFRESH_INTERVAL = float(os.environ.get("FEED_REFRESH_INTERVAL", 60))
+
+# Messages buffered per websocket subscriber, when full the oldest message is
+# dropped ("drop_oldest") or the subscriber is disconnected ("disconnect")
+WS_BUFFER_SIZE = int(os.environ.get("WS_BUFFER_SIZE", 100))
+WS_SLOW_CONSUMER_POLICY = os.environ.get("WS_SLOW_CONSUMER_POLICY", "drop_oldest")
+
+# Postgres channel on which the ids of new articles are sent
+ARTICLE_EVENTS_CHANNEL = os.environ.get("ARTICLE_EVENTS_CHANNEL", "articles")
+# Maximum number of notified articles loaded at once by the websocket listener
+ARTICLE_EVENTS_BATCH_SIZE = int(os.environ.get("ARTICLE_EVENTS_BATCH_SIZE", 100))
+
+# Feed and rule reads are cached in process for up to READ_CACHE_TTL seconds, or until
+# feeds or rules are created, keeping at most READ_CACHE_SIZE reads
+READ_CACHE_SIZE = int(os.environ.get("READ_CACHE_SIZE", 1000))
+READ_CACHE_TTL = float(os.environ.get("READ_CACHE_TTL", 60))
+
+# Rules are matched against the articles persisted before them in chunks of
+# RULE_BACKFILL_CHUNK_SIZE articles, with up to RULE_BACKFILL_CONCURRENCY chunks
+# matched in the parse executor at once. Backfills start when a rule is created if
+# RULE_BACKFILL_ON_CREATE, and can be started at /rules/{rule_id}/backfill.
+RULE_BACKFILL_CHUNK_SIZE = int(os.environ.get("RULE_BACKFILL_CHUNK_SIZE", 1000))
+RULE_BACKFILL_CONCURRENCY = int(
+    os.environ.get("RULE_BACKFILL_CONCURRENCY", PARSE_WORKERS)
+)
+RULE_BACKFILL_ON_CREATE = (
+    os.environ.get("RULE_BACKFILL_ON_CREATE", "true").lower() == "true"
+)
+
+# Ingestion cycles and selected endpoints are profiled by a sampler taking a stack
+# sample every PROFILE_INTERVAL seconds, when they take longer than
+# PROFILE_SLOW_SECONDS (0 to disable) or when requested at /profiling. Profiles are
+# written to PROFILE_DIR as collapsed stacks.
+PROFILE_SLOW_SECONDS = float(os.environ.get("PROFILE_SLOW_SECONDS", 0))
+PROFILE_INTERVAL = float(os.environ.get("PROFILE_INTERVAL", 0.005))
+PROFILE_DIR = os.environ.get("PROFILE_DIR", "profiles")
@@ -1,83 +1,374 @@
-from typing import List
+from datetime import datetime, timedelta
+from typing import AsyncIterator, Dict, List, Optional, Tuple
 
+from sqlalchemy import REAL, Integer, func, literal_column, update
+from sqlalchemy.dialects.postgresql import ARRAY, insert
 from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.future import select
+from sqlalchemy.orm import undefer
 
-from cryptomonitor.listener import global_listener
-from cryptomonitor import schemas
+from cryptomonitor import fingerprint, schemas
+from cryptomonitor.config import (
+    ARTICLE_EVENTS_CHANNEL,
+    ARTICLE_JOB_LEASE,
+    ARTICLE_JOBS_LIMIT,
+    ARTICLE_JOBS_PER_HOST,
+)
 from cryptomonitor.database import async_session, models
+from cryptomonitor.database.pagination import encode_cursor, paginate
+
+# Postgres regex capturing the host of a url
+URL_HOST_PATTERN = "^[a-zA-Z][a-zA-Z0-9+.-]*://([^/?#:]+)"
+
+NOTIFY_BATCH_SIZE = 500
+
+
+def select_articles(body: bool = False):
+    """
+    Select articles, loading their deferred body if `body`
+    """
+    query = select(models.Article)
+    if body:
+        query = query.options(undefer(models.Article.body))
+    return query
 
 
 async def get_article(db_session: AsyncSession, article_id: int):
     """
-    Get article identified by `article_id`
+    Get article identified by `article_id`, with its body
     """
     result = await db_session.execute(
-        select(models.Article).where(models.Article.id == article_id)
+        select_articles(body=True).where(models.Article.id == article_id)
     )
     return result.scalars().first()
 
 
-async def get_articles(db_session: AsyncSession, skip: int = 0, limit: int = 100):
+async def get_articles_by_ids(
+    db_session: AsyncSession, article_ids: List[int], body: bool = False
+):
     """
-    Get articles
+    Get articles identified by `article_ids`, with their body if `body`
     """
-    result = await db_session.execute(select(models.Article).offset(skip).limit(limit))
+    result = await db_session.execute(
+        select_articles(body=body)
+        .where(models.Article.id.in_(article_ids))
+        .order_by(models.Article.id)
+    )
     return result.scalars().all()
 
 
+def select_article_rows(body: bool = False):
+    """
+    Select the slim projection of articles as rows, with their body if `body`
+
+    Rule ids are aggregated by postgres rather than loaded as rule objects
+    """
+    rule_ids = func.array(
+        select(models.ArticleRule.rule_id)
+        .where(models.ArticleRule.article_id == models.Article.id)
+        .order_by(models.ArticleRule.rule_id)
+        .scalar_subquery(),
+        type_=ARRAY(Integer),
+    )
+    columns = [
+        models.Article.id,
+        models.Article.title,
+        models.Article.url,
+        models.Article.feed_id,
+        models.Article.published,
+        rule_ids.label("rule_ids"),
+        models.Article.canonical_id,
+    ]
+    if body:
+        columns.append(models.Article.body)
+    return select(*columns)
+
+
+async def get_article_rows(
+    db_session: AsyncSession,
+    cursor: Optional[str] = None,
+    limit: int = 100,
+    feed_id: Optional[int] = None,
+    body: bool = False,
+) -> Tuple[List[dict], Optional[str]]:
+    """
+    Get a page of articles, newest first, following `cursor`, as plain dicts of
+    their slim projection ready to be serialized, with their body if `body`
+
+    Rows are read without building ORM objects or validating them against
+    `schemas.ArticleSummary`, which dominates the cost of large pages. Returns the
+    articles and the cursor of the next page, None on the last page
+    """
+    query = select_article_rows(body=body)
+    if feed_id is not None:
+        query = query.where(models.Article.feed_id == feed_id)
+    result = await db_session.execute(
+        paginate(
+            query,
+            columns=[models.Article.published, models.Article.id],
+            cursor=cursor,
+            limit=limit,
+            descending=True,
+        )
+    )
+    articles = [dict(row) for row in result.mappings()]
+    if len(articles) < limit:
+        return articles, None
+    return articles, encode_cursor(articles[-1]["published"], articles[-1]["id"])
+
+
+async def search_articles(
+    db_session: AsyncSession,
+    query: str,
+    cursor: Optional[str] = None,
+    limit: int = 100,
+    rule_id: Optional[int] = None,
+    feed_id: Optional[int] = None,
+    published_after: Optional[datetime] = None,
+    published_before: Optional[datetime] = None,
+    body: bool = False,
+) -> Tuple[List[schemas.ArticleSearchResult], Optional[str]]:
+    """
+    Get a page of articles matching the web search style `query`, best match first,
+    following `cursor`, with their body if `body`
+
+    Matches are found with the GIN index on `search_vector` and ranked with title
+    matches weighted above body matches. Returns the articles and the cursor of the
+    next page, None on the last page
+    """
+    search_config = literal_column(f"'{models.SEARCH_CONFIG}'::regconfig")
+    ts_query = func.websearch_to_tsquery(search_config, query)
+    rank = func.ts_rank(models.Article.search_vector, ts_query, type_=REAL)
+    statement = select_articles(body=body).add_columns(rank.label("rank")).where(
+        models.Article.search_vector.op("@@")(ts_query)
+    )
+    if rule_id is not None:
+        statement = statement.where(
+            models.Article.id.in_(
+                select(models.ArticleRule.article_id).where(
+                    models.ArticleRule.rule_id == rule_id
+                )
+            )
+        )
+    if feed_id is not None:
+        statement = statement.where(models.Article.feed_id == feed_id)
+    if published_after is not None:
+        statement = statement.where(models.Article.published >= published_after)
+    if published_before is not None:
+        statement = statement.where(models.Article.published < published_before)
+    result = await db_session.execute(
+        paginate(
+            statement,
+            columns=[rank, models.Article.id],
+            cursor=cursor,
+            limit=limit,
+            descending=True,
+        )
+    )
+    articles = [
+        schemas.ArticleSearchResult(**db_article.to_dict(body=body), rank=article_rank)
+        for db_article, article_rank in result.all()
+    ]
+    if len(articles) < limit:
+        return articles, None
+    return articles, encode_cursor(articles[-1].rank, articles[-1].id)
+
+
 async def create_article(db_session: AsyncSession, article: schemas.ArticleCreate):
-    db_article = models.Article(
-        title=article.title,
-        published=article.published,
-        url=article.url,
-        feed_id=article.feed_id,
-        body=article.body,
-    )
-    db_session.add(db_article)
+    """
+    Create an article and its article rules
+    """
+    messages = await create_articles(db_session=db_session, articles=[article])
+    return messages[0]
+
+
+async def create_articles(
+    db_session: AsyncSession, articles: List[schemas.ArticleCreate]
+) -> List[dict]:
+    """
+    Create articles and their article rules in a single transaction
+
+    The ids of the new articles are sent on the article events channel, which
+    postgres delivers to listeners once the transaction commits. Article
+    messages are returned in the order of `articles`
+    """
+    if not articles:
+        return []
+    article_ids = await allocate_article_ids(db_session=db_session, count=len(articles))
+    await db_session.execute(
+        insert(models.Article).values(
+            [
+                {
+                    "id": article_id,
+                    "title": article.title,
+                    "published": article.published,
+                    "url": article.url,
+                    "feed_id": article.feed_id,
+                    "body": article.body,
+                    "canonical_id": article.canonical_id,
+                }
+                for article_id, article in zip(article_ids, articles)
+            ]
+        )
+    )
+
+    article_rules = [
+        {"article_id": article_id, "rule_id": rule.id}
+        for article_id, article in zip(article_ids, articles)
+        for rule in article.rules
+    ]
+    if article_rules:
+        await db_session.execute(insert(models.ArticleRule).values(article_rules))
+    article_fingerprints = [
+        create_article_fingerprint(
+            article_id=article_id, signature=article.fingerprint
+        )
+        for article_id, article in zip(article_ids, articles)
+        if article.fingerprint is not None and article.canonical_id is None
+    ]
+    if article_fingerprints:
+        await db_session.execute(
+            insert(models.ArticleFingerprint).values(article_fingerprints)
+        )
+    # Near-duplicates are linked to their canonical article but not announced
+    await notify_articles(
+        db_session=db_session,
+        article_ids=[
+            article_id
+            for article_id, article in zip(article_ids, articles)
+            if article.canonical_id is None
+        ],
+    )
     await db_session.commit()
-    await db_session.refresh(db_article)
-    await create_article_rules(
-        db_session=db_session, rules=article.rules, article_id=db_article.id
+
+    messages: List[dict] = []
+    for article_id, article in zip(article_ids, articles):
+        message = {
+            "id": article_id,
+            "title": article.title,
+            "body": article.body,
+            "url": article.url,
+            "feed_id": article.feed_id,
+            "published": article.published,
+            "rules": [rule.dict() for rule in article.rules],
+            "canonical_id": article.canonical_id,
+        }
+        messages.append(message)
+    return messages
+
+
+async def allocate_article_ids(db_session: AsyncSession, count: int) -> List[int]:
+    """
+    Take `count` ids from the article id sequence
+
+    Ids are assigned before inserting so that each article is known by its id,
+    urls are not unique and a batch may hold the same url from several feeds
+    """
+    sequence = func.pg_get_serial_sequence(models.Article.__tablename__, "id")
+    result = await db_session.execute(
+        select(func.nextval(sequence)).select_from(func.generate_series(1, count))
     )
-    await global_listener.receive_and_publish_message(db_article.to_dict())
-    return db_article
+    return result.scalars().all()
 
 
-async def create_article_rule(db_session: AsyncSession, article_id: int, rule_id: int):
-    db_article_rule = models.ArticleRule(article_id=article_id, rule_id=rule_id)
-    db_session.add(db_article_rule)
-    await db_session.commit()
-    await db_session.refresh(db_article_rule)
-    return db_article_rule
+def create_article_fingerprint(article_id: int, signature: List[int]) -> dict:
+    return {
+        "article_id": article_id,
+        "signature": signature,
+        "bands": fingerprint.get_bands(signature),
+    }
 
 
-async def create_article_rules(
-    db_session: AsyncSession, article_id: int, rules: List[schemas.Rule]
-):
-    db_article_rules: List[models.ArticleRule] = []
-    for rule in rules:
-        db_article_rule = await create_article_rule(
-            db_session=db_session, article_id=article_id, rule_id=rule.id
+async def get_near_duplicate(
+    db_session: AsyncSession, signature: List[int], min_similarity: float
+) -> Optional[Tuple[int, List[int]]]:
+    """
+    Get the (article id, signature) of the canonical article most similar to
+    `signature`, None if none has a similarity of at least `min_similarity`
+
+    Candidates share at least one band with `signature`, found with the GIN index
+    on `bands`
+    """
+    result = await db_session.execute(
+        select(
+            models.ArticleFingerprint.article_id,
+            models.ArticleFingerprint.signature,
+        ).where(
+            models.ArticleFingerprint.bands.overlap(fingerprint.get_bands(signature))
         )
-        db_article_rules.append(db_article_rule)
-    return db_article_rules
+    )
+    candidates = [
+        (fingerprint.similarity(signature, other), article_id, other)
+        for article_id, other in result.all()
+    ]
+    if not candidates:
+        return None
+    similarity, article_id, other = max(candidates)
+    if similarity < min_similarity:
+        return None
+    return article_id, other
 
 
-async def create_article_job(
-    db_session: AsyncSession, article_job: schemas.ArticleJobCreate
-):
-    db_article_job = models.ArticleJob(
-        title=article_job.title,
-        published=article_job.published,
-        url=article_job.url,
-        feed_id=article_job.feed_id,
-        status=article_job.status,
-    )
-    db_session.add(db_article_job)
+async def notify_articles(db_session: AsyncSession, article_ids: List[int]):
+    """
+    Send article ids on the article events channel, in payloads of at most
+    NOTIFY_BATCH_SIZE ids to stay clear of the 8000 byte payload limit
+    """
+    for i in range(0, len(article_ids), NOTIFY_BATCH_SIZE):
+        payload = ",".join(
+            str(article_id) for article_id in article_ids[i : i + NOTIFY_BATCH_SIZE]
+        )
+        await db_session.execute(
+            select(func.pg_notify(ARTICLE_EVENTS_CHANNEL, payload))
+        )
+
+
+async def get_max_article_id(db_session: AsyncSession) -> int:
+    result = await db_session.execute(
+        select(func.coalesce(func.max(models.Article.id), 0))
+    )
+    return result.scalar_one()
+
+
+async def stream_article_bodies(
+    db_session: AsyncSession, after_id: int, max_id: int, chunk_size: int
+) -> AsyncIterator[List[Tuple[int, str]]]:
+    """
+    Yield the (id, body) of articles with an id in (`after_id`, `max_id`], in id
+    order and chunks of `chunk_size`, from a server-side cursor
+
+    Articles without body (near-duplicates) are skipped.
+    """
+    result = await db_session.stream(
+        select(models.Article.id, models.Article.body)
+        .where(models.Article.id > after_id)
+        .where(models.Article.id <= max_id)
+        .where(models.Article.body.isnot(None))
+        .order_by(models.Article.id)
+        .execution_options(yield_per=chunk_size)
+    )
+    async for rows in result.partitions(chunk_size):
+        yield [(article_id, body) for article_id, body in rows]
+
+
+async def create_article_jobs(
+    db_session: AsyncSession, article_jobs: List[schemas.ArticleJobCreate]
+) -> List[str]:
+    """
+    Create article jobs in a single insert, ignoring jobs whose url already exists
+
+    Returns the urls of the jobs that were created
+    """
+    if not article_jobs:
+        return []
+    result = await db_session.execute(
+        insert(models.ArticleJob)
+        .values([article_job.dict() for article_job in article_jobs])
+        .on_conflict_do_nothing(index_elements=[models.ArticleJob.url])
+        .returning(models.ArticleJob.url)
+    )
     await db_session.commit()
-    await db_session.refresh(db_article_job)
-    return db_article_job
+    return result.scalars().all()
 
 
 async def get_article_job(db_session: AsyncSession, article_job_id: int):
@@ -90,28 +381,122 @@ async def get_article_job(db_session: AsyncSession, article_job_id: int):
     return result.scalars().first()
 
 
-async def get_article_jobs(db_session: AsyncSession, skip: int = 0, limit: int = 100):
+async def get_article_job_rows(
+    db_session: AsyncSession,
+    cursor: Optional[str] = None,
+    limit: int = 100,
+    status: Optional[schemas.ArticleJobStatus] = None,
+) -> Tuple[List[dict], Optional[str]]:
     """
-    Get article jobs
+    Get a page of article jobs, oldest first, following `cursor`, as plain dicts of
+    the `schemas.ArticleJob` fields ready to be serialized
+
+    Returns the article jobs and the cursor of the next page, None on the last page
     """
+    names = list(schemas.ArticleJob.__fields__)
+    columns = [models.ArticleJob.__table__.columns[name] for name in names]
+    query = select(*columns)
+    if status is not None:
+        query = query.where(models.ArticleJob.status == status)
     result = await db_session.execute(
-        select(models.ArticleJob).order_by(models.ArticleJob._updated).limit(limit)
+        paginate(query, columns=[models.ArticleJob.id], cursor=cursor, limit=limit)
     )
-    return result.scalars().all()
+    article_jobs = [dict(row) for row in result.mappings().all()]
+    if len(article_jobs) < limit:
+        return article_jobs, None
+    return article_jobs, encode_cursor(article_jobs[-1]["id"])
 
 
-async def get_pending_article_jobs(db_session: AsyncSession, limit: int = 10):
+def rank_pending_article_jobs_by_host():
+    """
+    Subquery of pending article job ids, ranked by id within each url host
     """
-    Get pending article jobs
+    host = func.substring(models.ArticleJob.url, URL_HOST_PATTERN)
+    return (
+        select(
+            models.ArticleJob.id,
+            func.row_number()
+            .over(partition_by=host, order_by=models.ArticleJob.id)
+            .label("host_rank"),
+        )
+        .where(models.ArticleJob.status == schemas.ArticleJobStatus.pending)
+        .subquery()
+    )
+
+
+async def claim_article_jobs(
+    db_session: AsyncSession,
+    worker_id: str,
+    lease: int = ARTICLE_JOB_LEASE,
+    limit: int = ARTICLE_JOBS_LIMIT,
+    per_host: int = ARTICLE_JOBS_PER_HOST,
+) -> List[schemas.ArticleJob]:
+    """
+    Atomically claim pending article jobs for `worker_id` for `lease` seconds
+
+    At most `per_host` jobs are claimed for each url host, spreading jobs over
+    hosts minimises rate limiting and maximises the number of requests that can
+    be made in parallel. Rows locked by another worker's claim are skipped rather
+    than waited on, so concurrent workers claim disjoint jobs.
+    """
+    ranked_jobs = rank_pending_article_jobs_by_host()
+    claimable_jobs = (
+        select(models.ArticleJob.id)
+        .join(ranked_jobs, ranked_jobs.c.id == models.ArticleJob.id)
+        .where(ranked_jobs.c.host_rank <= per_host)
+        .where(models.ArticleJob.status == schemas.ArticleJobStatus.pending)
+        .order_by(ranked_jobs.c.host_rank, models.ArticleJob.id)
+        .limit(limit)
+        .with_for_update(skip_locked=True, of=models.ArticleJob)
+    )
+    result = await db_session.execute(
+        update(models.ArticleJob)
+        .where(models.ArticleJob.id.in_(claimable_jobs))
+        .values(
+            status=schemas.ArticleJobStatus.processing,
+            worker_id=worker_id,
+            lease_expires=func.now() + timedelta(seconds=lease),
+        )
+        .returning(*models.ArticleJob.__table__.columns)
+        .execution_options(synchronize_session=False)
+    )
+    article_jobs = [schemas.ArticleJob(**row) for row in result.mappings()]
+    await db_session.commit()
+    return article_jobs
+
 
-    TODO: use window query to get n rows per feed id
-    This would be superior to the rate limiter as it would minimise
-    rate limiting and maximise the number of async requests that could be
-    made in parallel
+async def reap_expired_article_jobs(db_session: AsyncSession) -> List[int]:
     """
-    return await get_article_jobs_by_status(
-        db_session=db_session, status=schemas.ArticleJobStatus.pending
+    Return processing article jobs whose lease has expired to pending
+
+    Returns the ids of the reaped jobs
+    """
+    result = await db_session.execute(
+        update(models.ArticleJob)
+        .where(models.ArticleJob.status == schemas.ArticleJobStatus.processing)
+        .where(models.ArticleJob.lease_expires < func.now())
+        .values(
+            status=schemas.ArticleJobStatus.pending,
+            worker_id=None,
+            lease_expires=None,
+        )
+        .returning(models.ArticleJob.id)
+        .execution_options(synchronize_session=False)
+    )
+    await db_session.commit()
+    return result.scalars().all()
+
+
+async def count_article_jobs_by_status(db_session: AsyncSession) -> Dict[str, int]:
+    """
+    Return the number of article jobs per status
+    """
+    result = await db_session.execute(
+        select(models.ArticleJob.status, func.count()).group_by(
+            models.ArticleJob.status
+        )
     )
+    return dict(result.all())
 
 
 async def get_article_jobs_by_status(
@@ -123,24 +508,34 @@ async def get_article_jobs_by_status(
     result = await db_session.execute(
         select(models.ArticleJob)
         .where(models.ArticleJob.status == status)
-        .order_by(models.ArticleJob._updated)
+        .order_by(models.ArticleJob.id)
         .limit(limit)
     )
     return result.scalars().all()
 
 
-async def update_article_job(
-    article_job_id: models.Feed,
-    article_job_update: schemas.FeedUpdate,
-) -> models.ArticleJob:
+async def finish_article_job(
+    article_job_id: int,
+    worker_id: str,
+    article_job_update: schemas.ArticleJobUpdate,
+) -> bool:
     """
-    Update an article job
+    Update the status of a claimed article job and release its lease
+
+    Returns False if the job is no longer claimed by `worker_id`, e.g. when its
+    lease expired and it was reaped
     """
     async with async_session() as db_session:
-        db_article_job: models.ArticleJob = await get_article_job(
-            db_session=db_session, article_job_id=article_job_id
+        result = await db_session.execute(
+            update(models.ArticleJob)
+            .where(models.ArticleJob.id == article_job_id)
+            .where(models.ArticleJob.worker_id == worker_id)
+            .values(
+                status=article_job_update.status,
+                worker_id=None,
+                lease_expires=None,
+            )
+            .execution_options(synchronize_session=False)
         )
-        db_article_job.status = article_job_update.status
         await db_session.commit()
-        await db_session.refresh(db_article_job)
-        return db_article_job
+        return result.rowcount > 0
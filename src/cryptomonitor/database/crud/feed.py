@@ -1,5 +1,5 @@
 from datetime import datetime, timedelta
-from typing import List
+from typing import List, Optional
 
 from sqlalchemy import or_
 from sqlalchemy.ext.asyncio import AsyncSession
@@ -8,6 +8,8 @@ from sqlalchemy.future import select
 from cryptomonitor import schemas
 from cryptomonitor.database import async_session, models
 from cryptomonitor.database.crud.rule import get_or_create_rule
+from cryptomonitor.read_cache import CachedRead, global_read_cache
+from cryptomonitor.rule_engine import global_rule_engine
 
 
 async def get_feed(db_session: AsyncSession, feed_id: int):
@@ -25,9 +27,9 @@ async def get_feed_by_url(db_session: AsyncSession, url: str):
     Get feed identified by `url`
     """
     result = await db_session.execute(
-        select(models.Feed).where(models.Feed.url == url).first()
+        select(models.Feed).where(models.Feed.url == url)
     )
-    return result.scalars().all()
+    return result.scalars().first()
 
 
 async def get_feeds(db_session: AsyncSession, skip: int = 0, limit: int = 100):
@@ -38,6 +40,42 @@ async def get_feeds(db_session: AsyncSession, skip: int = 0, limit: int = 100):
     return result.scalars().all()
 
 
+async def get_cached_feed(
+    db_session: AsyncSession, feed_id: int
+) -> Optional[CachedRead]:
+    """
+    Get feed identified by `feed_id` from the read cache, None if it does not exist
+    """
+
+    async def load():
+        db_feed = await get_feed(db_session=db_session, feed_id=feed_id)
+        return None if db_feed is None else schemas.Feed.from_orm(db_feed)
+
+    return await global_read_cache.get(("feed", feed_id), load)
+
+
+async def get_cached_feeds(
+    db_session: AsyncSession, skip: int = 0, limit: int = 100
+) -> CachedRead:
+    """
+    Get all feeds from the read cache
+    """
+
+    async def load():
+        db_feeds = await get_feeds(db_session=db_session, skip=skip, limit=limit)
+        return [schemas.Feed.from_orm(db_feed) for db_feed in db_feeds]
+
+    return await global_read_cache.get(("feeds", skip, limit), load)
+
+
+async def get_feed_ids(db_session: AsyncSession) -> List[int]:
+    """
+    Get the ids of all feeds
+    """
+    result = await db_session.execute(select(models.Feed.id))
+    return result.scalars().all()
+
+
 async def get_pending_feeds(db_session: AsyncSession, limit: int = 10):
     """
     Get feeds that should be updated
@@ -61,6 +99,7 @@ async def create_feed(db_session: AsyncSession, feed: schemas.FeedCreate):
     db_session.add(db_feed)
     await db_session.commit()
     await db_session.refresh(db_feed)
+    global_read_cache.invalidate()
     return db_feed
 
 
@@ -96,6 +135,8 @@ async def create_feed_rules(
             db_session=db_session, feed_id=feed_id, rule_id=db_rule.id
         )
         db_feed_rules.append(db_feed_rule)
+    global_rule_engine.invalidate()
+    global_read_cache.invalidate()
     return db_feed_rules
 
 
@@ -125,3 +166,18 @@ async def update_feed(
 
         if update:
             await db_session.commit()
+
+
+async def update_feed_validators(
+    feed_id: models.Feed,
+    feed_validators: schemas.FeedValidators,
+):
+    """
+    Update the conditional request validators of a feed
+    """
+    async with async_session() as db_session:
+        db_feed: models.Feed = await get_feed(db_session=db_session, feed_id=feed_id)
+        db_feed.etag = feed_validators.etag
+        db_feed.last_modified = feed_validators.last_modified
+        db_feed.content_hash = feed_validators.content_hash
+        await db_session.commit()
@@ -1,16 +1,23 @@
+from typing import List, Optional
+
+from sqlalchemy import func, update
+from sqlalchemy.dialects.postgresql import insert
 from sqlalchemy.exc import NoResultFound
 from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.future import select
 
 from cryptomonitor import schemas
 from cryptomonitor.database import models
+from cryptomonitor.database.crud import article as article_crud
+from cryptomonitor.read_cache import CachedRead, global_read_cache
+from cryptomonitor.rule_engine import global_rule_engine
 
 
 async def get_rule(db_session: AsyncSession, rule_id: int):
     result = await db_session.execute(
-        select(models.Rule).where(models.Rule.id == rule_id).first()
+        select(models.Rule).where(models.Rule.id == rule_id)
     )
-    return result.scalars().all()
+    return result.scalars().first()
 
 
 async def get_rule_by_pattern(db_session: AsyncSession, pattern: str):
@@ -25,11 +32,41 @@ async def get_rules(db_session: AsyncSession, skip: int = 0, limit: int = 100):
     return result.scalars().all()
 
 
+async def get_cached_rule(
+    db_session: AsyncSession, rule_id: int
+) -> Optional[CachedRead]:
+    """
+    Get rule identified by `rule_id` from the read cache, None if it does not exist
+    """
+
+    async def load():
+        db_rule = await get_rule(db_session=db_session, rule_id=rule_id)
+        return None if db_rule is None else schemas.Rule.from_orm(db_rule)
+
+    return await global_read_cache.get(("rule", rule_id), load)
+
+
+async def get_cached_rules(
+    db_session: AsyncSession, skip: int = 0, limit: int = 100
+) -> CachedRead:
+    """
+    Get rules from the read cache
+    """
+
+    async def load():
+        db_rules = await get_rules(db_session=db_session, skip=skip, limit=limit)
+        return [schemas.Rule.from_orm(db_rule) for db_rule in db_rules]
+
+    return await global_read_cache.get(("rules", skip, limit), load)
+
+
 async def create_rule(db_session: AsyncSession, rule: schemas.RuleCreate):
     db_rule = models.Rule(name=rule.name, pattern=rule.pattern)
     db_session.add(db_rule)
     await db_session.commit()
     await db_session.refresh(db_rule)
+    global_rule_engine.invalidate()
+    global_read_cache.invalidate()
     return db_rule
 
 
@@ -39,3 +76,105 @@ async def get_or_create_rule(db_session: AsyncSession, rule: schemas.RuleCreate)
     except NoResultFound:
         db_rule = await create_rule(db_session=db_session, rule=rule)
     return db_rule
+
+
+async def get_rule_backfill(db_session: AsyncSession, rule_id: int):
+    result = await db_session.execute(
+        select(models.RuleBackfill).where(models.RuleBackfill.rule_id == rule_id)
+    )
+    return result.scalars().first()
+
+
+async def get_running_rule_backfills(db_session: AsyncSession):
+    result = await db_session.execute(
+        select(models.RuleBackfill).where(
+            models.RuleBackfill.status == schemas.RuleBackfillStatus.running
+        )
+    )
+    return result.scalars().all()
+
+
+async def start_rule_backfill(
+    db_session: AsyncSession, rule_id: int, restart: bool = False
+) -> models.RuleBackfill:
+    """
+    Mark the backfill of rule `rule_id` as running, resuming from its checkpoint
+    unless it completed or `restart`, in which case it covers all current articles
+    """
+    db_backfill = await get_rule_backfill(db_session=db_session, rule_id=rule_id)
+    if db_backfill is None:
+        db_backfill = models.RuleBackfill(rule_id=rule_id)
+        db_session.add(db_backfill)
+        restart = True
+    elif db_backfill.status == schemas.RuleBackfillStatus.complete:
+        restart = True
+    if restart:
+        db_backfill.last_article_id = 0
+        db_backfill.max_article_id = await article_crud.get_max_article_id(
+            db_session=db_session
+        )
+        db_backfill.scanned = 0
+        db_backfill.matched = 0
+        db_backfill.elapsed = 0
+        db_backfill.started = func.now()
+    db_backfill.status = schemas.RuleBackfillStatus.running
+    db_backfill.error = None
+    await db_session.commit()
+    await db_session.refresh(db_backfill)
+    return db_backfill
+
+
+async def checkpoint_rule_backfill(
+    db_session: AsyncSession,
+    rule_id: int,
+    article_ids: List[int],
+    last_article_id: int,
+    scanned: int,
+    elapsed: float,
+):
+    """
+    Add rule `rule_id` to matched `article_ids` and advance the backfill checkpoint
+    to `last_article_id` in a single transaction
+
+    Rules already added to an article are ignored, so a chunk can be replayed.
+    """
+    matched = 0
+    if article_ids:
+        result = await db_session.execute(
+            insert(models.ArticleRule)
+            .values(
+                [
+                    {"article_id": article_id, "rule_id": rule_id}
+                    for article_id in article_ids
+                ]
+            )
+            .on_conflict_do_nothing()
+        )
+        matched = result.rowcount
+    await db_session.execute(
+        update(models.RuleBackfill)
+        .where(models.RuleBackfill.rule_id == rule_id)
+        .values(
+            last_article_id=last_article_id,
+            scanned=models.RuleBackfill.scanned + scanned,
+            matched=models.RuleBackfill.matched + matched,
+            elapsed=elapsed,
+        )
+        .execution_options(synchronize_session=False)
+    )
+    await db_session.commit()
+
+
+async def finish_rule_backfill(
+    db_session: AsyncSession,
+    rule_id: int,
+    status: schemas.RuleBackfillStatus,
+    error: Optional[str] = None,
+):
+    await db_session.execute(
+        update(models.RuleBackfill)
+        .where(models.RuleBackfill.rule_id == rule_id)
+        .values(status=status, error=error)
+        .execution_options(synchronize_session=False)
+    )
+    await db_session.commit()
@@ -1,9 +1,28 @@
-from sqlalchemy import Column, DateTime, ForeignKey, Integer, String
-from sqlalchemy.orm import relationship
+from typing import List
+
+from sqlalchemy import (
+    DDL,
+    BigInteger,
+    Column,
+    Computed,
+    DateTime,
+    Float,
+    ForeignKey,
+    Index,
+    Integer,
+    String,
+    event,
+)
+from sqlalchemy.dialects.postgresql import ARRAY, TSVECTOR
+from sqlalchemy.orm import deferred, relationship
 from sqlalchemy.sql import func
 
+from cryptomonitor.config import ARTICLE_BODY_COMPRESSION
 from cryptomonitor.database import Base
 
+# Text search configuration of article search documents and queries
+SEARCH_CONFIG = "english"
+
 
 class Feed(Base):
     __tablename__ = "feeds"
@@ -14,6 +33,10 @@ class Feed(Base):
     _updated = Column(DateTime, onupdate=func.now(), nullable=True)
     last_updated = Column(DateTime, nullable=True)
     last_article_date = Column(DateTime, nullable=True)
+    # Validators from the last processed poll, used for conditional requests
+    etag = Column(String, nullable=True)
+    last_modified = Column(String, nullable=True)
+    content_hash = Column(String, nullable=True)
     rules = relationship(
         "Rule", secondary="feed_rules", back_populates="feeds", lazy="selectin"
     )
@@ -46,23 +69,72 @@ class Article(Base):
 
     id = Column(Integer, primary_key=True)
     title = Column(String)
-    body = Column(String)
+    # Only loaded when explicitly requested, lists of articles never include bodies
+    body = deferred(Column(String))
     url = Column(String)
     published = Column(DateTime)
     rules = relationship(
         "Rule", secondary="article_rules", back_populates="articles", lazy="selectin"
     )
-    feed_id = Column(Integer, ForeignKey("feeds.id"), index=True)
+    # Indexed by ix_articles_feed_id_published_id
+    feed_id = Column(Integer, ForeignKey("feeds.id"))
+    # Article this article is a near-duplicate of, see ArticleFingerprint
+    canonical_id = Column(Integer, ForeignKey("articles.id"), nullable=True)
+    # Full text search document, generated by postgres on insert and update and only
+    # loaded when explicitly selected
+    search_vector = deferred(
+        Column(
+            TSVECTOR,
+            Computed(
+                f"setweight(to_tsvector('{SEARCH_CONFIG}', coalesce(title, '')), 'A')"
+                " || "
+                f"setweight(to_tsvector('{SEARCH_CONFIG}', coalesce(body, '')), 'B')",
+                persisted=True,
+            ),
+        )
+    )
 
-    def to_dict(self) -> dict:
-        return {
+    __table_args__ = (
+        # Keyset pagination of articles, overall and by feed
+        Index("ix_articles_published_id", published, id),
+        Index("ix_articles_feed_id_published_id", feed_id, published, id),
+        Index("ix_articles_search_vector", "search_vector", postgresql_using="gin"),
+    )
+
+    @property
+    def rule_ids(self) -> List[int]:
+        return [rule.id for rule in self.rules]
+
+    def to_dict(self, body: bool = False) -> dict:
+        """
+        Return the slim projection of the article, with its body if `body`, which
+        must then have been loaded
+        """
+        article = {
             "id": self.id,
             "title": self.title,
-            "body": self.body,
             "url": self.url,
+            "feed_id": self.feed_id,
             "published": self.published,
-            "rules": [rule.to_dict() for rule in self.rules],
+            "rule_ids": self.rule_ids,
+            "canonical_id": self.canonical_id,
         }
+        if body:
+            article["body"] = self.body
+        return article
+
+
+if ARTICLE_BODY_COMPRESSION:
+    # Bodies are stored out of line and compressed by postgres (TOAST) once large
+    # enough, lz4 compresses and decompresses several times faster than pglz
+    event.listen(
+        Article.__table__,
+        "after_create",
+        DDL(
+            "ALTER TABLE articles ALTER COLUMN body SET COMPRESSION "
+            f"{ARTICLE_BODY_COMPRESSION}"
+        ),
+    )
 
 
 class ArticleRule(Base):
@@ -72,6 +144,56 @@ class ArticleRule(Base):
     rule_id = Column(Integer, ForeignKey("rules.id"), primary_key=True)
 
 
+class RuleBackfill(Base):
+    __tablename__ = "rule_backfills"
+    # Matching of a rule against the articles persisted before it, see
+    # `cryptomonitor.ingestion.backfill`
+
+    rule_id = Column(Integer, ForeignKey("rules.id"), primary_key=True)
+    status = Column(String)
+    # Checkpoint, articles up to this id have been matched
+    last_article_id = Column(Integer, default=0)
+    # Last article when the backfill started, later articles are not matched
+    max_article_id = Column(Integer, default=0)
+    scanned = Column(Integer, default=0)
+    matched = Column(Integer, default=0)
+    # Seconds spent running, over all resumptions
+    elapsed = Column(Float, default=0)
+    started = Column(DateTime, default=func.now())
+    _updated = Column(DateTime, default=func.now(), onupdate=func.now())
+    error = Column(String, nullable=True)
+
+    @property
+    def progress(self) -> float:
+        """
+        Fraction of the article id range matched
+        """
+        if not self.max_article_id:
+            return 1.0
+        return min(1.0, self.last_article_id / self.max_article_id)
+
+    @property
+    def rate(self) -> float:
+        """
+        Articles matched per second
+        """
+        return self.scanned / self.elapsed if self.elapsed else 0.0
+
+
+class ArticleFingerprint(Base):
+    __tablename__ = "article_fingerprints"
+    # MinHash signature of a canonical article, and the hashes of its bands looked
+    # up by overlap to find near-duplicates (see `cryptomonitor.fingerprint`)
+
+    article_id = Column(Integer, ForeignKey("articles.id"), primary_key=True)
+    signature = Column(ARRAY(BigInteger))
+    bands = Column(ARRAY(BigInteger))
+
+    __table_args__ = (
+        Index("ix_article_fingerprints_bands", bands, postgresql_using="gin"),
+    )
+
+
 class ArticleJob(Base):
     __tablename__ = "article_jobs"
     id = Column(Integer, primary_key=True)
@@ -81,3 +203,13 @@ class ArticleJob(Base):
     published = Column(DateTime)
     feed_id = Column(Integer, ForeignKey("feeds.id"), index=True)
     status = Column(String)
+    # Worker holding the job while processing, until `lease_expires`
+    worker_id = Column(String, nullable=True)
+    lease_expires = Column(DateTime, nullable=True)
+
+    __table_args__ = (
+        # Keyset pagination of article jobs by status, overall pages use the
+        # primary key. Jobs are paginated on id as _updated changes whenever a job
+        # is claimed, finished or reaped, moving it between pages
+        Index("ix_article_jobs_status_id", status, id),
+    )
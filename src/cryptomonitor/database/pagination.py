@@ -0,0 +1,66 @@
+"""
+Keyset pagination helpers
+
+Pages are requested with an opaque cursor encoding the sort key of the last row
+of the previous page. The next page is selected with a row comparison on that
+key, which postgres answers from a composite index on the sort columns, so
+reading any page costs the same however deep it is.
+"""
+import base64
+import json
+from datetime import datetime
+from typing import Any, Optional, Sequence, Tuple
+
+from sqlalchemy import tuple_
+from sqlalchemy.sql import Select
+
+
+def encode_cursor(*values: Any) -> str:
+    """
+    Return a cursor for the sort key `values` of the last row of a page
+    """
+    payload = json.dumps(
+        [
+            value.isoformat() if isinstance(value, datetime) else value
+            for value in values
+        ]
+    )
+    return base64.urlsafe_b64encode(payload.encode()).decode()
+
+
+def decode_cursor(cursor: str, types: Sequence[type]) -> Tuple:
+    """
+    Return the sort key encoded in `cursor`, raises ValueError if it is invalid
+    """
+    try:
+        values = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+    except Exception as e:
+        raise ValueError(f"Invalid cursor {cursor}") from e
+    if not isinstance(values, list) or len(values) != len(types):
+        raise ValueError(f"Invalid cursor {cursor}")
+    try:
+        return tuple(
+            datetime.fromisoformat(value) if type_ is datetime else type_(value)
+            for value, type_ in zip(values, types)
+        )
+    except (TypeError, ValueError) as e:
+        raise ValueError(f"Invalid cursor {cursor}") from e
+
+
+def paginate(
+    query: Select,
+    columns: Sequence,
+    cursor: Optional[str],
+    limit: int,
+    descending: bool = False,
+) -> Select:
+    """
+    Order `query` by `columns` and select the `limit` rows following `cursor`
+    """
+    if cursor is not None:
+        types = [column.type.python_type for column in columns]
+        key = tuple_(*columns)
+        values = tuple_(*decode_cursor(cursor, types=types))
+        query = query.where(key < values if descending else key > values)
+    order_by = [column.desc() if descending else column for column in columns]
+    return query.order_by(*order_by).limit(limit)
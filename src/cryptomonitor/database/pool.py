@@ -0,0 +1,43 @@
+"""
+Defines a connection pool that records checkout wait times.
+
+Used to size the pooled engine, see `DB_POOL_SIZE` and `DB_MAX_OVERFLOW`.
+"""
+import time
+
+from sqlalchemy.pool import AsyncAdaptedQueuePool
+
+
+class PoolStats:
+    def __init__(self):
+        self.checkouts = 0
+        self.wait_total = 0.0
+        self.wait_max = 0.0
+
+    def record_wait(self, wait: float):
+        self.checkouts += 1
+        self.wait_total += wait
+        self.wait_max = max(self.wait_max, wait)
+
+    def to_dict(self) -> dict:
+        return {
+            "checkouts": self.checkouts,
+            "wait_total": self.wait_total,
+            "wait_max": self.wait_max,
+            "wait_avg": self.wait_total / self.checkouts if self.checkouts else 0.0,
+        }
+
+
+class MeteredQueuePool(AsyncAdaptedQueuePool):
+    """
+    Queue pool timing how long each checkout waits for a connection
+    """
+
+    stats = PoolStats()
+
+    def connect(self):
+        start = time.perf_counter()
+        try:
+            return super().connect()
+        finally:
+            self.stats.record_wait(time.perf_counter() - start)
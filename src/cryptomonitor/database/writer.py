@@ -0,0 +1,95 @@
+"""
+Defines a batch writer used to persist articles.
+
+Articles written concurrently (e.g. by parallel article fetches) are grouped and
+persisted together with their article rules in a single transaction, see
+`crud.article.create_articles`. Writers wait until the batch containing their
+article has been committed, a writer cancelled meanwhile does not prevent its
+article or the rest of the batch from being persisted.
+"""
+import asyncio
+import logging
+from typing import List, Optional, Set, Tuple
+
+from cryptomonitor import metrics, schemas
+from cryptomonitor.config import ARTICLE_BATCH_DELAY, ARTICLE_BATCH_SIZE
+from cryptomonitor.database import async_session
+from cryptomonitor.database.crud import article as article_crud
+
+logger = logging.getLogger(__name__)
+
+
+class ArticleWriter:
+    def __init__(
+        self,
+        batch_size: int = ARTICLE_BATCH_SIZE,
+        max_delay: float = ARTICLE_BATCH_DELAY,
+    ):
+        self.batch_size = batch_size
+        self.max_delay = max_delay
+        self._pending: List[Tuple[schemas.ArticleCreate, asyncio.Future]] = []
+        self._timer: Optional[asyncio.TimerHandle] = None
+        # Running flushes, referenced so they are not garbage collected
+        self._flushes: Set[asyncio.Task] = set()
+
+    @property
+    def pending(self) -> int:
+        """
+        Number of articles waiting to be persisted
+        """
+        return len(self._pending)
+
+    async def write(self, article: schemas.ArticleCreate) -> dict:
+        """
+        Queue `article` and return its published message once committed
+        """
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        self._pending.append((article, future))
+        if len(self._pending) >= self.batch_size:
+            self._start_flush()
+        elif self._timer is None:
+            self._timer = loop.call_later(self.max_delay, self._start_flush)
+        return await future
+
+    def _start_flush(self):
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        task = asyncio.create_task(self.flush())
+        self._flushes.add(task)
+        task.add_done_callback(self._flushes.discard)
+
+    async def flush(self):
+        """
+        Persist all queued articles
+        """
+        while self._pending:
+            batch = self._pending[: self.batch_size]
+            self._pending = self._pending[self.batch_size :]
+            await self._write_batch(batch)
+
+    async def _write_batch(
+        self, batch: List[Tuple[schemas.ArticleCreate, asyncio.Future]]
+    ):
+        try:
+            with metrics.stage_seconds.time(stage="persist"):
+                async with async_session() as db_session:
+                    messages = await article_crud.create_articles(
+                        db_session=db_session,
+                        articles=[article for article, _ in batch],
+                    )
+        except Exception as e:
+            logger.error(f"Failed to persist {len(batch)} articles: {e}")
+            for _, future in batch:
+                # Writers cancelled while waiting (e.g. on shutdown) have no result
+                if not future.done():
+                    future.set_exception(e)
+        else:
+            logger.info(f"Persisted {len(batch)} articles")
+            for (_, future), message in zip(batch, messages):
+                if not future.done():
+                    future.set_result(message)
+
+
+article_writer = ArticleWriter()
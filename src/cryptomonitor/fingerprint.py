@@ -0,0 +1,74 @@
+"""
+Module defining MinHash fingerprints used to detect near-duplicate articles
+
+The signature of an article body is the minimum of PERMUTATIONS hash functions
+over its word 3-grams. The fraction of equal values between two signatures
+estimates the Jaccard similarity of the bodies, so syndicated copies of a story
+differing only by boilerplate have mostly equal signatures.
+
+Signatures are split into BANDS bands of ROWS values, each hashed to a single
+integer (locality sensitive hashing). Similar bodies almost certainly share a
+band hash (above 99.9% at a similarity of 0.8) while unrelated ones almost never
+do, so candidates are looked up by band before their similarity is checked.
+"""
+import hashlib
+import random
+import re
+from typing import List, Optional
+
+PERMUTATIONS = 64
+BANDS = 16
+ROWS = PERMUTATIONS // BANDS
+SHINGLE_SIZE = 3
+
+# Hash functions are (a * x + b) mod PRIME over 61 bit shingle hashes, values fit
+# in a signed 64 bit postgres bigint
+PRIME = (1 << 61) - 1
+_random = random.Random(0)
+COEFFICIENTS = [
+    (_random.randrange(1, PRIME), _random.randrange(0, PRIME))
+    for _ in range(PERMUTATIONS)
+]
+
+WORD_PATTERN = re.compile(r"\w+")
+
+
+def _hash(value: bytes) -> int:
+    return int.from_bytes(hashlib.blake2b(value, digest_size=8).digest(), "big")
+
+
+def minhash(text: str, min_words: int = 0) -> Optional[List[int]]:
+    """
+    Return the MinHash signature of `text`, None if it has fewer than `min_words`
+    words
+    """
+    words = WORD_PATTERN.findall(text.lower())
+    if not words or len(words) < min_words:
+        return None
+    shingles = {
+        _hash(" ".join(words[i : i + SHINGLE_SIZE]).encode()) & PRIME
+        for i in range(max(1, len(words) - SHINGLE_SIZE + 1))
+    }
+    return [
+        min((a * shingle + b) % PRIME for shingle in shingles)
+        for a, b in COEFFICIENTS
+    ]
+
+
+def similarity(signature: List[int], other: List[int]) -> float:
+    """
+    Return the estimated Jaccard similarity of two signatures
+    """
+    return sum(a == b for a, b in zip(signature, other)) / PERMUTATIONS
+
+
+def get_bands(signature: List[int]) -> List[int]:
+    """
+    Return the hash of each band of `signature`, as signed 64 bit integers
+    """
+    bands = []
+    for band in range(BANDS):
+        values = signature[band * ROWS : (band + 1) * ROWS]
+        value = _hash(f"{band}:{values}".encode())
+        bands.append(value - (1 << 64) if value >= 1 << 63 else value)
+    return bands
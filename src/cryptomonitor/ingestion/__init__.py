@@ -2,7 +2,9 @@ import asyncio
 import logging
 from typing import Awaitable
 
-from cryptomonitor.ingestion import articles, feeds
+from cryptomonitor import metrics
+from cryptomonitor.ingestion import articles
+from cryptomonitor.ingestion.scheduler import feed_scheduler
 
 logger = logging.getLogger(__name__)
 
@@ -15,6 +17,7 @@ class TaskRunner:
         try:
             while True:
                 await func()
+                metrics.article_cycles.inc()
                 await asyncio.sleep(10)
                 self.value += 1
         except Exception as e:
@@ -34,7 +37,7 @@ if __name__ == "__main__":
     except IndexError:
         raise Exception("Provide task argument [feeds, articles]")
     if task == "feeds":
-        asyncio.run(task_runner.run(feeds.fetch_pending_feeds))
+        asyncio.run(feed_scheduler.run())
     elif task == "articles":
         asyncio.run(task_runner.run(articles.fetch_pending_articles))
     else:
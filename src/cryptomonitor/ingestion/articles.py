@@ -1,98 +1,113 @@
 import asyncio
 import logging
-from typing import Awaitable, List
+import os
+import socket
+from typing import Awaitable, Dict, List
 
-import aiohttp
-
-from cryptomonitor import schemas
+from cryptomonitor import metrics, schemas
 from cryptomonitor.config import HEADERS
 from cryptomonitor.database import async_session, models
 from cryptomonitor.database.crud import article as article_crud
 from cryptomonitor.database.crud import feed as feed_crud
 from cryptomonitor.ingestion import parser
+from cryptomonitor.ingestion.client import http_client
 from cryptomonitor.ingestion.rate_limiter import RateLimiter
+from cryptomonitor.profiling import profiler
 
 logger = logging.getLogger(__name__)
 
+# Identifies the article jobs claimed by this process
+WORKER_ID = f"{socket.gethostname()}-{os.getpid()}"
+
 
-async def fetch_article(article_job: models.ArticleJob, match_rules: List[models.Rule]):
+async def fetch_article(
+    article_job: schemas.ArticleJob, match_rules: List[models.Rule]
+):
     """
     Fetch article from website
     """
     async with async_session() as db_session:
-        async with aiohttp.ClientSession() as http_session:
-            try:
-                async with http_session.get(
-                    article_job.url, raise_for_status=True, headers=HEADERS
-                ) as response:
-                    logger.info(f"Got article {article_job.url}")
-                    html = await response.content.read()
-                    await parser.parse_article(
-                        db_session=db_session,
-                        article_job=article_job,
-                        html=html,
-                        match_rules=match_rules,
-                    )
-                    article_job_update = schemas.ArticleJobUpdate(
-                        status=schemas.ArticleJobStatus.complete
-                    )
-            except Exception as e:
-                logger.error(e)
-                article_job_update = schemas.ArticleJobUpdate(
-                    status=schemas.ArticleJobStatus.error
-                )
-
-            await article_crud.update_article_job(
-                article_job_id=article_job.id,
-                article_job_update=article_job_update,
+        try:
+            async with RateLimiter(article_job.url):
+                with metrics.stage_seconds.time(stage="fetch_article"):
+                    async with http_client.session.get(
+                        article_job.url, raise_for_status=True, headers=HEADERS
+                    ) as response:
+                        logger.info(f"Got article {article_job.url}")
+                        html = await response.content.read()
+            await parser.parse_article(
+                db_session=db_session,
+                article_job=article_job,
+                html=html,
+                match_rules=match_rules,
+            )
+            article_job_update = schemas.ArticleJobUpdate(
+                status=schemas.ArticleJobStatus.complete
+            )
+        except Exception as e:
+            logger.error(e)
+            article_job_update = schemas.ArticleJobUpdate(
+                status=schemas.ArticleJobStatus.error
             )
 
+        if not await article_crud.finish_article_job(
+            article_job_id=article_job.id,
+            worker_id=WORKER_ID,
+            article_job_update=article_job_update,
+        ):
+            logger.warning(f"Lost lease on article job {article_job.url}")
+
 
 async def fetch_articles(
-    pending_article_jobs: List[models.ArticleJob],
+    pending_article_jobs: List[schemas.ArticleJob],
 ):
+    """
+    Fetch articles for article jobs
+
+    All jobs are fetched concurrently, requests to the same host being spaced
+    out by the rate limiter as they are made, so distinct hosts run in parallel.
+    """
     tasks: List[Awaitable] = []
+    feed_rules: Dict[int, List[models.Rule]] = {}
     async with async_session() as db_session:
         for article_job in pending_article_jobs:
-            article_job = await article_crud.update_article_job(
-                article_job_id=article_job.id,
-                article_job_update=schemas.ArticleJobUpdate(
-                    status=schemas.ArticleJobStatus.processing
-                ),
-            )
-            db_feed = await feed_crud.get_feed(
-                db_session=db_session, feed_id=article_job.feed_id
-            )
-            async with RateLimiter(article_job.url):
-                tasks.append(
-                    fetch_article(
-                        article_job=article_job,
-                        match_rules=db_feed.rules,
-                    )
+            if article_job.feed_id not in feed_rules:
+                db_feed = await feed_crud.get_feed(
+                    db_session=db_session, feed_id=article_job.feed_id
                 )
+                feed_rules[article_job.feed_id] = db_feed.rules
+            tasks.append(
+                fetch_article(
+                    article_job=article_job,
+                    match_rules=feed_rules[article_job.feed_id],
+                )
+            )
     return await asyncio.gather(*tasks)
 
 
+@profiler.profiled("fetch_pending_articles")
 async def fetch_pending_articles():
     """
     Fetch pending article jobs
 
-    The method first checks to determine that there are no currently
-    processing article jobs.
+    Jobs whose lease has expired (e.g. after a worker crashed) are first returned
+    to pending, then a batch of jobs is claimed for this worker. Claims skip jobs
+    locked by other workers, so several workers can share the queue.
     """
-    pending_article_jobs = None
     async with async_session() as db_session:
-        if not await article_crud.get_article_jobs_by_status(
-            db_session=db_session, status=schemas.ArticleJobStatus.processing
-        ):
-            pending_article_jobs = await article_crud.get_pending_article_jobs(
-                db_session=db_session
-            )
+        reaped_article_job_ids = await article_crud.reap_expired_article_jobs(
+            db_session=db_session
+        )
+        if reaped_article_job_ids:
+            logger.warning(f"Reaped {len(reaped_article_job_ids)} expired article jobs")
+        pending_article_jobs = await article_crud.claim_article_jobs(
+            db_session=db_session, worker_id=WORKER_ID
+        )
 
-        if pending_article_jobs:
-            logger.info(f"fetching {len(pending_article_jobs)} articles")
-            await fetch_articles(
-                pending_article_jobs=pending_article_jobs,
-            )
-        else:
-            logger.info("No pending articles")
+    if pending_article_jobs:
+        logger.info(f"fetching {len(pending_article_jobs)} articles")
+        await fetch_articles(
+            pending_article_jobs=pending_article_jobs,
+        )
+    else:
+        logger.info("No pending articles")
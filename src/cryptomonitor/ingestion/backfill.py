@@ -0,0 +1,198 @@
+"""
+Defines retroactive rule backfills.
+
+A rule only applies to articles ingested after it was created. A backfill matches
+it against the articles persisted before: article bodies are streamed in id order
+from a server-side cursor, chunks are matched in the parse executor, a bounded
+number at a time, and the ids of matching articles are added to the rule's
+article rules.
+
+Chunks are checkpointed in id order together with their article rules, so an
+interrupted backfill (failure, restart) resumes after the last checkpoint, and
+memory stays bounded by the chunks in flight whatever the number of articles.
+"""
+import asyncio
+import logging
+import re
+from collections import defaultdict, deque
+from typing import Deque, Dict, List, Optional, Tuple
+
+from cryptomonitor import schemas
+from cryptomonitor.config import (
+    RULE_BACKFILL_CHUNK_SIZE,
+    RULE_BACKFILL_CONCURRENCY,
+)
+from cryptomonitor.database import async_session
+from cryptomonitor.database.crud import article as article_crud
+from cryptomonitor.database.crud import rule as rule_crud
+from cryptomonitor.ingestion.executor import parse_executor
+from cryptomonitor.prefilter import extract_literals
+
+logger = logging.getLogger(__name__)
+
+
+def match_rule_chunk(pattern: str, rows: List[Tuple[int, str]]) -> List[int]:
+    """
+    Return the ids of the articles whose body matches `pattern`
+    """
+    compiled = re.compile(pattern)
+    literals = extract_literals(pattern)
+    return [
+        article_id
+        for article_id, body in rows
+        if (not literals or any(literal in body for literal in literals))
+        and compiled.match(body)
+    ]
+
+
+class RuleBackfiller:
+    def __init__(
+        self,
+        chunk_size: int = RULE_BACKFILL_CHUNK_SIZE,
+        concurrency: int = RULE_BACKFILL_CONCURRENCY,
+    ):
+        self.chunk_size = chunk_size
+        self.concurrency = concurrency
+        # rule id -> running backfill
+        self._tasks: Dict[int, asyncio.Task] = {}
+        # Held while a backfill is started, so that concurrent starts of a rule
+        # find it running rather than starting another over the same checkpoint
+        self._locks: Dict[int, asyncio.Lock] = defaultdict(asyncio.Lock)
+
+    def is_running(self, rule_id: int) -> bool:
+        return rule_id in self._tasks
+
+    async def start(
+        self, rule_id: int, restart: bool = False
+    ) -> Optional[schemas.RuleBackfill]:
+        """
+        Start or resume the backfill of rule `rule_id`, unless already running
+
+        Returns None if the rule does not exist
+        """
+        async with self._locks[rule_id]:
+            async with async_session() as db_session:
+                if self.is_running(rule_id):
+                    db_backfill = await rule_crud.get_rule_backfill(
+                        db_session=db_session, rule_id=rule_id
+                    )
+                    return schemas.RuleBackfill.from_orm(db_backfill)
+                db_rule = await rule_crud.get_rule(
+                    db_session=db_session, rule_id=rule_id
+                )
+                if db_rule is None:
+                    return None
+                db_backfill = await rule_crud.start_rule_backfill(
+                    db_session=db_session, rule_id=rule_id, restart=restart
+                )
+            backfill = schemas.RuleBackfill.from_orm(db_backfill)
+            task = asyncio.create_task(
+                self.run(backfill=backfill, pattern=db_rule.pattern)
+            )
+            self._tasks[rule_id] = task
+            task.add_done_callback(lambda _: self._tasks.pop(rule_id, None))
+            return backfill
+
+    async def resume(self):
+        """
+        Resume backfills left running, e.g. by a restart
+        """
+        async with async_session() as db_session:
+            db_backfills = await rule_crud.get_running_rule_backfills(
+                db_session=db_session
+            )
+        for db_backfill in db_backfills:
+            await self.start(rule_id=db_backfill.rule_id)
+
+    async def stop(self):
+        """
+        Cancel running backfills, which resume from their last checkpoint
+        """
+        tasks = list(self._tasks.values())
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+
+    async def run(self, backfill: schemas.RuleBackfill, pattern: str):
+        rule_id = backfill.rule_id
+        loop = asyncio.get_running_loop()
+        started = loop.time()
+        scanned = 0
+        # (last article id, number of articles, matching ids) of chunks in flight
+        chunks: Deque[Tuple[int, int, asyncio.Future]] = deque()
+
+        async def checkpoint():
+            nonlocal scanned
+            last_article_id, count, matching = chunks.popleft()
+            article_ids = await matching
+            scanned += count
+            async with async_session() as db_session:
+                await rule_crud.checkpoint_rule_backfill(
+                    db_session=db_session,
+                    rule_id=rule_id,
+                    article_ids=article_ids,
+                    last_article_id=last_article_id,
+                    scanned=count,
+                    elapsed=backfill.elapsed + loop.time() - started,
+                )
+            logger.debug(f"Rule {rule_id} backfilled up to article {last_article_id}")
+
+        logger.info(
+            f"Backfilling rule {rule_id} from article {backfill.last_article_id}"
+            f" to {backfill.max_article_id}"
+        )
+        status = schemas.RuleBackfillStatus.complete
+        error: Optional[str] = None
+        try:
+            async with async_session() as db_session:
+                async for rows in article_crud.stream_article_bodies(
+                    db_session=db_session,
+                    after_id=backfill.last_article_id,
+                    max_id=backfill.max_article_id,
+                    chunk_size=self.chunk_size,
+                ):
+                    chunks.append(
+                        (
+                            rows[-1][0],
+                            len(rows),
+                            asyncio.ensure_future(
+                                parse_executor.run(match_rule_chunk, pattern, rows)
+                            ),
+                        )
+                    )
+                    if len(chunks) >= self.concurrency:
+                        await checkpoint()
+            while chunks:
+                await checkpoint()
+        except asyncio.CancelledError:
+            logger.info(f"Stopped backfill of rule {rule_id}")
+            raise
+        except Exception as e:
+            logger.error(f"Failed to backfill rule {rule_id}: {e}")
+            status = schemas.RuleBackfillStatus.error
+            error = str(e)
+        finally:
+            for _, _, matching in chunks:
+                matching.cancel()
+
+        elapsed = loop.time() - started
+        async with async_session() as db_session:
+            await rule_crud.finish_rule_backfill(
+                db_session=db_session, rule_id=rule_id, status=status, error=error
+            )
+        logger.info(
+            f"Backfill of rule {rule_id} {status.value}, {scanned} articles in"
+            f" {elapsed:.1f}s ({scanned / elapsed if elapsed else 0:.0f} articles/s)"
+        )
+
+    async def get_status(self, rule_id: int) -> Optional[schemas.RuleBackfill]:
+        async with async_session() as db_session:
+            db_backfill = await rule_crud.get_rule_backfill(
+                db_session=db_session, rule_id=rule_id
+            )
+        if db_backfill is None:
+            return None
+        return schemas.RuleBackfill.from_orm(db_backfill)
+
+
+rule_backfiller = RuleBackfiller()
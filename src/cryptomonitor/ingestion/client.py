@@ -0,0 +1,107 @@
+"""
+Defines the http client shared by all ingestion fetches.
+
+A single aiohttp session is kept for the lifetime of the process so that
+connections, TLS sessions and resolved addresses are reused between feed polls
+and article fetches. Connection reuse is tracked with aiohttp tracing so that
+pool sizing can be checked.
+"""
+import logging
+from collections import Counter
+from typing import Optional
+
+import aiohttp
+
+from cryptomonitor.config import (
+    HEADERS,
+    HTTP_CONNECT_TIMEOUT,
+    HTTP_DNS_TTL,
+    HTTP_KEEPALIVE_TIMEOUT,
+    HTTP_LIMIT,
+    HTTP_LIMIT_PER_HOST,
+    HTTP_READ_TIMEOUT,
+)
+
+logger = logging.getLogger(__name__)
+
+
+class HttpClient:
+    def __init__(
+        self,
+        limit: int = HTTP_LIMIT,
+        limit_per_host: int = HTTP_LIMIT_PER_HOST,
+        keepalive_timeout: float = HTTP_KEEPALIVE_TIMEOUT,
+        dns_ttl: int = HTTP_DNS_TTL,
+        connect_timeout: float = HTTP_CONNECT_TIMEOUT,
+        read_timeout: float = HTTP_READ_TIMEOUT,
+    ):
+        self.limit = limit
+        self.limit_per_host = limit_per_host
+        self.keepalive_timeout = keepalive_timeout
+        self.dns_ttl = dns_ttl
+        self.timeout = aiohttp.ClientTimeout(
+            sock_connect=connect_timeout, sock_read=read_timeout
+        )
+        # requests, connections_created, connections_reused, dns_cache_hits, ...
+        self.stats: Counter = Counter()
+        self._session: Optional[aiohttp.ClientSession] = None
+
+    def _create_trace_config(self) -> aiohttp.TraceConfig:
+        trace_config = aiohttp.TraceConfig()
+
+        async def on_request_start(session, context, params):
+            self.stats["requests"] += 1
+
+        async def on_connection_create_end(session, context, params):
+            # A new connection, i.e. a tcp (and tls) handshake
+            self.stats["connections_created"] += 1
+
+        async def on_connection_reuseconn(session, context, params):
+            self.stats["connections_reused"] += 1
+
+        async def on_dns_cache_hit(session, context, params):
+            self.stats["dns_cache_hits"] += 1
+
+        async def on_dns_cache_miss(session, context, params):
+            self.stats["dns_cache_misses"] += 1
+
+        trace_config.on_request_start.append(on_request_start)
+        trace_config.on_connection_create_end.append(on_connection_create_end)
+        trace_config.on_connection_reuseconn.append(on_connection_reuseconn)
+        trace_config.on_dns_cache_hit.append(on_dns_cache_hit)
+        trace_config.on_dns_cache_miss.append(on_dns_cache_miss)
+        return trace_config
+
+    @property
+    def session(self) -> aiohttp.ClientSession:
+        """
+        Shared client session, created on first use within the running loop
+        """
+        if self._session is None or self._session.closed:
+            connector = aiohttp.TCPConnector(
+                limit=self.limit,
+                limit_per_host=self.limit_per_host,
+                keepalive_timeout=self.keepalive_timeout,
+                ttl_dns_cache=self.dns_ttl,
+                resolver=aiohttp.AsyncResolver(),
+            )
+            self._session = aiohttp.ClientSession(
+                connector=connector,
+                timeout=self.timeout,
+                headers=HEADERS,
+                trace_configs=[self._create_trace_config()],
+            )
+            logger.info(
+                f"Created http session (limit {self.limit}, "
+                f"per host {self.limit_per_host})"
+            )
+        return self._session
+
+    async def close(self):
+        if self._session is not None:
+            await self._session.close()
+            self._session = None
+            logger.info(f"Closed http session {dict(self.stats)}")
+
+
+http_client = HttpClient()
@@ -0,0 +1,189 @@
+"""
+Defines near-duplicate article detection.
+
+Article bodies are fingerprinted with MinHash (see `cryptomonitor.fingerprint`)
+and looked up first among the most recently seen canonical articles held in
+memory, then in the persisted fingerprint index. Only persisted canonical
+articles are indexed, as rules differ between feeds and an article that matched
+no rules of its feed may match those of another.
+
+An article found unique is registered in memory under a provisional id until it
+is persisted, or not, see `Deduplicator.resolve`. Copies of a story arriving
+together from several feeds, written in the same batch, wait for the outcome of
+the first copy instead of all being found unique. Copies processed by other
+processes at the same time may still both be found unique, detection is best
+effort and never prevents an article from being persisted.
+"""
+import asyncio
+import logging
+from collections import OrderedDict, defaultdict
+from typing import Dict, List, Optional, Set, Tuple
+
+from cryptomonitor import fingerprint
+from cryptomonitor.config import (
+    DEDUP_CACHE_SIZE,
+    DEDUP_MIN_SIMILARITY,
+    DEDUP_MIN_WORDS,
+    DEDUP_POLICY,
+)
+from cryptomonitor.database import async_session
+from cryptomonitor.database.crud import article as article_crud
+
+logger = logging.getLogger(__name__)
+
+MARK = "mark"
+SKIP = "skip"
+OFF = "off"
+
+
+def fingerprint_body(body: str) -> Optional[List[int]]:
+    """
+    Return the signature of an article body, None if too short to be meaningful
+    """
+    return fingerprint.minhash(body, min_words=DEDUP_MIN_WORDS)
+
+
+class Deduplicator:
+    def __init__(
+        self,
+        policy: str = DEDUP_POLICY,
+        min_similarity: float = DEDUP_MIN_SIMILARITY,
+        cache_size: int = DEDUP_CACHE_SIZE,
+    ):
+        if policy not in (MARK, SKIP, OFF):
+            raise Exception(
+                f"Unrecognized dedup policy {policy} [{MARK}, {SKIP}, {OFF}]"
+            )
+        self.policy = policy
+        self.min_similarity = min_similarity
+        self.cache_size = cache_size
+        self.hits = 0
+        self.misses = 0
+        self.duplicates = 0
+        # canonical article id -> signature, least recently used first
+        self._signatures: "OrderedDict[int, List[int]]" = OrderedDict()
+        # band hash -> canonical article ids
+        self._bands: Dict[int, Set[int]] = defaultdict(set)
+        # Articles found unique and not yet persisted are cached under a negative
+        # provisional id, resolved to their article id once persisted, None if not
+        self._provisional: Dict[int, asyncio.Future] = {}
+        # signature -> provisional id
+        self._provisional_ids: Dict[Tuple[int, ...], int] = {}
+        self._next_provisional_id = -1
+
+    @property
+    def enabled(self) -> bool:
+        return self.policy != OFF
+
+    def add(self, article_id: int, signature: List[int]):
+        """
+        Remember canonical article `article_id` and its signature
+        """
+        if article_id in self._signatures:
+            self._signatures.move_to_end(article_id)
+            return
+        self._signatures[article_id] = signature
+        for band in fingerprint.get_bands(signature):
+            self._bands[band].add(article_id)
+        while len(self._signatures) > self.cache_size:
+            self._remove(next(iter(self._signatures)))
+
+    def _remove(self, article_id: int):
+        signature = self._signatures.pop(article_id, None)
+        if signature is None:
+            return
+        for band in fingerprint.get_bands(signature):
+            self._bands[band].discard(article_id)
+            if not self._bands[band]:
+                del self._bands[band]
+
+    def _add_provisional(self, signature: List[int]):
+        """
+        Remember an article found unique until it is resolved
+        """
+        provisional_id = self._next_provisional_id
+        self._next_provisional_id -= 1
+        self._provisional[provisional_id] = asyncio.get_running_loop().create_future()
+        self._provisional_ids[tuple(signature)] = provisional_id
+        self.add(provisional_id, signature)
+
+    def resolve(self, signature: Optional[List[int]], article_id: Optional[int]):
+        """
+        Record the outcome of an article `find_canonical` found unique: its id once
+        persisted as a canonical article, None if it was not persisted
+        """
+        if signature is None:
+            return
+        provisional_id = self._provisional_ids.pop(tuple(signature), None)
+        if provisional_id is not None:
+            self._remove(provisional_id)
+            self._provisional.pop(provisional_id).set_result(article_id)
+        if article_id is not None:
+            self.add(article_id, signature)
+
+    def _find_cached(self, signature: List[int]) -> Optional[int]:
+        candidates: Set[int] = set()
+        for band in fingerprint.get_bands(signature):
+            candidates.update(self._bands.get(band, ()))
+        best_similarity, best_id = max(
+            (
+                (fingerprint.similarity(signature, self._signatures[id_]), id_)
+                for id_ in candidates
+            ),
+            default=(0.0, None),
+        )
+        if best_id is None or best_similarity < self.min_similarity:
+            return None
+        self._signatures.move_to_end(best_id)
+        return best_id
+
+    async def find_canonical(self, signature: Optional[List[int]]) -> Optional[int]:
+        """
+        Return the id of the article `signature` is a near-duplicate of, if any
+
+        An article found unique must be resolved with `resolve` once persisted or
+        not, as near-duplicates wait for its outcome meanwhile
+        """
+        if not self.enabled or signature is None:
+            return None
+        article_id = self._find_cached(signature)
+        while article_id is not None and article_id < 0:
+            # A near-duplicate not yet persisted, found again if it is not
+            article_id = await asyncio.shield(self._provisional[article_id])
+            if article_id is None:
+                article_id = self._find_cached(signature)
+        if article_id is not None:
+            self.hits += 1
+        else:
+            self.misses += 1
+            self._add_provisional(signature)
+            try:
+                async with async_session() as db_session:
+                    near_duplicate = await article_crud.get_near_duplicate(
+                        db_session=db_session,
+                        signature=signature,
+                        min_similarity=self.min_similarity,
+                    )
+            except BaseException:
+                self.resolve(signature, None)
+                raise
+            if near_duplicate is None:
+                return None
+            article_id, canonical_signature = near_duplicate
+            self.add(article_id, canonical_signature)
+            self.resolve(signature, article_id)
+        self.duplicates += 1
+        return article_id
+
+    def get_stats(self) -> dict:
+        return {
+            "policy": self.policy,
+            "cached": len(self._signatures),
+            "provisional": len(self._provisional),
+            "hits": self.hits,
+            "misses": self.misses,
+            "duplicates": self.duplicates,
+        }
+
+
+deduplicator = Deduplicator()
@@ -0,0 +1,75 @@
+"""
+Defines an executor used to run cpu bound parsing off the event loop.
+
+Feed and html parsing are submitted to a process (or thread) pool so that a burst
+of large feeds does not stall the API, and the number of jobs in flight is
+bounded so the pool's queue cannot grow without limit.
+"""
+import asyncio
+import functools
+import logging
+from concurrent.futures import Executor, ProcessPoolExecutor, ThreadPoolExecutor
+from typing import Any, Callable, Optional
+
+from cryptomonitor.config import PARSE_EXECUTOR, PARSE_MAX_IN_FLIGHT, PARSE_WORKERS
+
+logger = logging.getLogger(__name__)
+
+
+class ParseExecutor:
+    def __init__(
+        self,
+        kind: str = PARSE_EXECUTOR,
+        workers: int = PARSE_WORKERS,
+        max_in_flight: int = PARSE_MAX_IN_FLIGHT,
+    ):
+        if kind not in ("process", "thread"):
+            raise Exception(f"Unrecognized parse executor {kind} [process, thread]")
+        self.kind = kind
+        self.workers = workers
+        self.max_in_flight = max_in_flight
+        self.in_flight = 0
+        self._executor: Optional[Executor] = None
+        # Created on first use so that it is bound to the running loop
+        self._semaphore: Optional[asyncio.Semaphore] = None
+
+    def _get_executor(self) -> Executor:
+        if self._executor is None:
+            if self.kind == "process":
+                self._executor = ProcessPoolExecutor(max_workers=self.workers)
+            else:
+                self._executor = ThreadPoolExecutor(
+                    max_workers=self.workers, thread_name_prefix="parse"
+                )
+            logger.info(f"Started {self.kind} parse executor ({self.workers} workers)")
+        return self._executor
+
+    async def run(self, func: Callable, *args: Any) -> Any:
+        """
+        Run `func(*args)` in the executor, waiting for a free slot if required
+        """
+        if self._semaphore is None:
+            self._semaphore = asyncio.Semaphore(self.max_in_flight)
+        async with self._semaphore:
+            self.in_flight += 1
+            try:
+                return await asyncio.get_running_loop().run_in_executor(
+                    self._get_executor(), functools.partial(func, *args)
+                )
+            finally:
+                self.in_flight -= 1
+
+    async def shutdown(self):
+        """
+        Wait for running jobs to finish and release the pool, queued jobs are cancelled
+        """
+        if self._executor is None:
+            return
+        executor, self._executor = self._executor, None
+        await asyncio.get_running_loop().run_in_executor(
+            None, functools.partial(executor.shutdown, wait=True, cancel_futures=True)
+        )
+        logger.info(f"Stopped {self.kind} parse executor")
+
+
+parse_executor = ParseExecutor()
@@ -0,0 +1,154 @@
+"""
+Defines a streaming html to text extractor.
+
+Text is collected while the document is tokenized, without building a tree, and
+text whose enclosing tag is blacklisted (script, style, head, ...) is dropped
+as soon as it is seen. The output matches the previous BeautifulSoup based
+`parse_html` implementation.
+"""
+from html.parser import HTMLParser
+from typing import List, Union
+
+from bs4.dammit import UnicodeDammit
+
+# Text directly inside these tags is discarded, "[document]" being the root
+BLACKLIST = frozenset(
+    [
+        "[document]",
+        "noscript",
+        "header",
+        "html",
+        "meta",
+        "head",
+        "input",
+        "script",
+        "style",
+    ]
+)
+
+ROOT = "[document]"
+
+# Tags that never have children
+VOID_ELEMENTS = frozenset(
+    [
+        "area",
+        "base",
+        "basefont",
+        "bgsound",
+        "br",
+        "col",
+        "command",
+        "embed",
+        "frame",
+        "hr",
+        "image",
+        "img",
+        "input",
+        "isindex",
+        "keygen",
+        "link",
+        "menuitem",
+        "meta",
+        "nextid",
+        "param",
+        "source",
+        "spacer",
+        "track",
+        "wbr",
+    ]
+)
+
+PRESERVE_WHITESPACE = frozenset(["pre", "textarea"])
+
+ASCII_SPACES = " \n\t\x0c\r"
+
+
+class TextExtractor(HTMLParser):
+    def __init__(self):
+        super().__init__(convert_charrefs=True)
+        # Open tags, innermost last
+        self._stack: List[str] = []
+        # Data of the text node currently being read
+        self._data: List[str] = []
+        # Text nodes kept so far
+        self._text: List[str] = []
+        self._preserve_whitespace = 0
+
+    def handle_starttag(self, tag, attrs):
+        self._end_data()
+        if tag not in VOID_ELEMENTS:
+            self._stack.append(tag)
+            if tag in PRESERVE_WHITESPACE:
+                self._preserve_whitespace += 1
+
+    def handle_startendtag(self, tag, attrs):
+        self._end_data()
+
+    def handle_endtag(self, tag):
+        self._end_data()
+        if tag not in self._stack:
+            return
+        while True:
+            popped = self._stack.pop()
+            if popped in PRESERVE_WHITESPACE:
+                self._preserve_whitespace -= 1
+            if popped == tag:
+                break
+
+    def handle_data(self, data):
+        self._data.append(data)
+
+    def handle_comment(self, data):
+        self._handle_node(data)
+
+    def handle_decl(self, data):
+        self._handle_node(data[len("DOCTYPE ") :])
+
+    def unknown_decl(self, data):
+        if data.upper().startswith("CDATA["):
+            data = data[len("CDATA[") :]
+        self._handle_node(data)
+
+    def handle_pi(self, data):
+        self._handle_node(data)
+
+    def close(self):
+        super().close()
+        self._end_data()
+
+    def get_text(self) -> str:
+        return " ".join(self._text).replace("\t", "").strip()
+
+    def _handle_node(self, data: str):
+        """
+        Comments, declarations etc. are text nodes of their own
+        """
+        self._end_data()
+        self._data.append(data)
+        self._end_data()
+
+    def _end_data(self):
+        """
+        Complete the current text node, keeping it if its parent is not blacklisted
+        """
+        if not self._data:
+            return
+        data = "".join(self._data)
+        self._data.clear()
+        if (self._stack[-1] if self._stack else ROOT) in BLACKLIST:
+            return
+        if not self._preserve_whitespace and not data.strip(ASCII_SPACES):
+            data = "\n" if "\n" in data else " "
+        self._text.append(data)
+
+
+def extract_text(html: Union[str, bytes]) -> str:
+    """
+    Extract text content from html
+    """
+    if isinstance(html, bytes):
+        html = UnicodeDammit(html, is_html=True).unicode_markup
+    extractor = TextExtractor()
+    extractor.feed(html)
+    extractor.close()
+    return extractor.get_text()
@@ -1,17 +1,22 @@
 import asyncio
+import hashlib
 import logging
+import time
 from datetime import datetime
 from time import mktime
-from typing import Awaitable, List
+from typing import Awaitable, List, Optional
 
 import aiohttp
 import feedparser
 
-from cryptomonitor import schemas
+from cryptomonitor import metrics, schemas
 from cryptomonitor.config import HEADERS
 from cryptomonitor.database import async_session, models
 from cryptomonitor.database.crud import feed as feed_crud
 from cryptomonitor.ingestion import parser
+from cryptomonitor.ingestion.client import http_client
+from cryptomonitor.ingestion.executor import parse_executor
+from cryptomonitor.profiling import profiler
 
 logger = logging.getLogger(__name__)
 
@@ -25,13 +30,79 @@ async def create_feed_update(
     )
 
 
-async def fetch_feed(http_session: aiohttp.ClientSession, feed: models.Feed):
+def parse_feed(text: str) -> feedparser.FeedParserDict:
+    """
+    Parse a feed in the parse executor
+
+    feedparser keeps the exception of a malformed (bozo) feed, which cannot be
+    pickled back from a process pool, so it is returned as its message
+    """
+    parsed_feed = feedparser.parse(text)
+    if "bozo_exception" in parsed_feed:
+        parsed_feed["bozo_exception"] = str(parsed_feed["bozo_exception"])
+    return parsed_feed
+
+
+def create_conditional_headers(feed: models.Feed) -> dict:
+    """
+    Return request headers, with validators from the previous poll of `feed`
+    """
+    headers = dict(HEADERS)
+    if feed.etag:
+        headers["If-None-Match"] = feed.etag
+    if feed.last_modified:
+        headers["If-Modified-Since"] = feed.last_modified
+    return headers
+
+
+def create_feed_validators(
+    response: aiohttp.ClientResponse, content_hash: str
+) -> schemas.FeedValidators:
+    return schemas.FeedValidators(
+        etag=response.headers.get("ETag"),
+        last_modified=response.headers.get("Last-Modified"),
+        content_hash=content_hash,
+    )
+
+
+async def fetch_feed(
+    http_session: aiohttp.ClientSession, feed: models.Feed
+) -> Optional[feedparser.FeedParserDict]:
+    """
+    Fetch and process a feed, returning the parsed feed or None if unchanged
+    """
     async with async_session() as db_session:
+        start = time.perf_counter()
         async with http_session.get(
-            feed.url, raise_for_status=True, headers=HEADERS
+            feed.url, raise_for_status=True, headers=create_conditional_headers(feed)
         ) as response:
+            content = await response.read()
+            metrics.stage_seconds.observe(
+                time.perf_counter() - start, stage="fetch_feed"
+            )
+            if response.status == 304:
+                logger.info(f"Feed not modified {feed.url}")
+                return
+            content_hash = hashlib.sha256(content).hexdigest()
+            feed_validators = create_feed_validators(
+                response=response, content_hash=content_hash
+            )
+            if content_hash == feed.content_hash:
+                logger.info(f"Feed unchanged {feed.url}")
+                # Servers may send new validators for the same body, e.g. rotate
+                # their ETag, which would otherwise never match again
+                if (feed_validators.etag, feed_validators.last_modified) != (
+                    feed.etag,
+                    feed.last_modified,
+                ):
+                    await feed_crud.update_feed_validators(
+                        feed_id=feed.id, feed_validators=feed_validators
+                    )
+                return
             logger.info(f"Got feed {feed.url}")
-            parsed_feed = feedparser.parse(await response.text())
+            text = await response.text()
+            with metrics.stage_seconds.time(stage="parse_feed"):
+                parsed_feed = await parse_executor.run(parse_feed, text)
             if is_updated_feed(feed=feed, parsed_feed=parsed_feed):
                 feed_update = await create_feed_update(
                     parsed_feed=parsed_feed, last_article_date=feed.last_article_date
@@ -46,6 +117,12 @@ async def fetch_feed(http_session: aiohttp.ClientSession, feed: models.Feed):
 
                 await feed_crud.update_feed(feed_id=feed.id, feed_update=feed_update)
 
+            # Only stored once the feed has been processed, so a failed poll is retried
+            await feed_crud.update_feed_validators(
+                feed_id=feed.id, feed_validators=feed_validators
+            )
+            return parsed_feed
+
 
 async def fetch_feeds(
     http_session: aiohttp.ClientSession,
@@ -62,6 +139,7 @@ def is_updated_feed(feed: models.Feed, parsed_feed: feedparser.FeedParserDict):
     return feed.last_updated is None or feed_updated > feed.last_updated
 
 
+@profiler.profiled("fetch_pending_feeds")
 async def fetch_pending_feeds():
     """
     Fetch feed items for all pending feeds
@@ -72,8 +150,7 @@ async def fetch_pending_feeds():
         logger.info(f"Pending feeds: {len(pending_feeds)}")
 
     if pending_feeds:
-        async with aiohttp.ClientSession() as http_session:
-            await fetch_feeds(
-                http_session=http_session,
-                pending_feeds=pending_feeds,
-            )
+        await fetch_feeds(
+            http_session=http_client.session,
+            pending_feeds=pending_feeds,
+        )
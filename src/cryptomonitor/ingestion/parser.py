@@ -1,17 +1,19 @@
+import asyncio
 import logging
 from datetime import datetime
 from time import mktime
-from typing import List
+from typing import Awaitable, List, Optional, Tuple
 
 import feedparser
-from bs4 import BeautifulSoup
-from sqlalchemy.exc import IntegrityError
 from sqlalchemy.ext.asyncio import AsyncSession
 
-from cryptomonitor import schemas
+from cryptomonitor import metrics, schemas
 from cryptomonitor.database import models
 from cryptomonitor.database.crud import article as article_crud
-from cryptomonitor.ingestion import rules
+from cryptomonitor.database.writer import article_writer
+from cryptomonitor.ingestion import dedup, extractor, rules
+from cryptomonitor.ingestion.dedup import deduplicator
+from cryptomonitor.ingestion.executor import parse_executor
 
 logger = logging.getLogger(__name__)
 
@@ -29,13 +31,54 @@ async def parse_entry(
     """
     Parse feed entry
     """
-    article = parse_article_from_entry(feed=feed, entry=entry)
-
-    if len(article.rules) > 0:
-        db_article = await article_crud.create_article(
-            db_session=db_session, article=article
+    with metrics.stage_seconds.time(stage="parse_html"):
+        body, signature = await parse_executor.run(
+            parse_html_fingerprint, entry.content[0].value
         )
-        print(db_article.body)
+    article = parse_article_from_entry(feed=feed, entry=entry, body=body)
+    await write_article(article=article, match_rules=feed.rules, signature=signature)
+
+
+async def write_article(
+    article: schemas.ArticleCreate,
+    match_rules: List[models.Rule],
+    signature: Optional[List[int]],
+):
+    """
+    Persist `article` if it matches any of `match_rules`
+
+    Near-duplicates of an already persisted article are not matched against rules,
+    and are persisted without body linked to that article or skipped, according to
+    the dedup policy
+    """
+    canonical_id = await deduplicator.find_canonical(signature)
+    if canonical_id is not None:
+        if deduplicator.policy == dedup.SKIP:
+            logger.info(f"Skipped {article.url}, duplicate of article {canonical_id}")
+            return
+        article = article.copy(update={"canonical_id": canonical_id, "body": None})
+        await article_writer.write(article)
+        logger.info(f"Linked {article.url} to article {canonical_id}")
+        return
+
+    # Persisted canonical article, near-duplicates found meanwhile wait for it
+    article_id = None
+    try:
+        with metrics.stage_seconds.time(stage="match_rules"):
+            matched_rules = rules.match_rules(
+                match_rules=match_rules, body=article.body
+            )
+        if len(matched_rules) > 0:
+            article = schemas.ArticleCreate(
+                **article.dict(exclude={"rules", "fingerprint"}),
+                rules=matched_rules,
+                fingerprint=signature,
+            )
+            message = await article_writer.write(article)
+            article_id = message["id"]
+            logger.debug(f"Persisted article {article_id} {article.url}")
+    finally:
+        deduplicator.resolve(signature, article_id)
 
 
 def is_new_entry(entry_date: datetime, last_article_date):
@@ -54,45 +97,42 @@ def parse_article_job_from_entry(
     )
 
 
-async def create_article_job(
-    db_session: AsyncSession, feed: models.Feed, entry: feedparser.FeedParserDict
+async def create_article_jobs(
+    db_session: AsyncSession,
+    feed: models.Feed,
+    entries: List[feedparser.FeedParserDict],
 ):
-    article_job = parse_article_job_from_entry(feed=feed, entry=entry)
-    try:
-        await article_crud.create_article_job(
-            db_session=db_session, article_job=article_job
+    """
+    Queue article jobs for `entries`, skipping those already queued
+    """
+    article_jobs = [
+        parse_article_job_from_entry(feed=feed, entry=entry) for entry in entries
+    ]
+    created_urls = set(
+        await article_crud.create_article_jobs(
+            db_session=db_session, article_jobs=article_jobs
         )
-        logger.info(f"Queued article job for {entry['link']}")
-    except IntegrityError:
-        logger.info(f"Article job already exists for {entry['link']}")
-        await db_session.rollback()
+    )
+    for article_job in article_jobs:
+        if article_job.url in created_urls:
+            logger.info(f"Queued article job for {article_job.url}")
+        else:
+            logger.info(f"Article job already exists for {article_job.url}")
 
 
 def parse_html(html: str):
     """
     Extract text content from html
     """
-    soup = BeautifulSoup(html, "html.parser")
-    text = soup.find_all(text=True)
-    # Remove unwanted tag elements:
-    cleaned_text = ""
-    blacklist = [
-        "[document]",
-        "noscript",
-        "header",
-        "html",
-        "meta",
-        "head",
-        "input",
-        "script",
-        "style",
-    ]
-    for item in text:
-        if item.parent.name not in blacklist:
-            cleaned_text += "{} ".format(item)
+    return extractor.extract_text(html)
 
-    cleaned_text = cleaned_text.replace("\t", "")
-    return cleaned_text.strip()
+
+def parse_html_fingerprint(html: str) -> Tuple[str, Optional[List[int]]]:
+    """
+    Extract text content from html, and its fingerprint
+    """
+    body = parse_html(html)
+    return body, dedup.fingerprint_body(body)
 
 
 async def parse_article(
@@ -101,20 +141,16 @@ async def parse_article(
     match_rules: List[models.Rule],
     html: str,
 ):
-    body = parse_html(html)
+    with metrics.stage_seconds.time(stage="parse_html"):
+        body, signature = await parse_executor.run(parse_html_fingerprint, html)
     article = schemas.ArticleCreate(
         title=article_job.title,
         url=article_job.url,
         body=body,
         feed_id=article_job.feed_id,
         published=article_job.published,
-        rules=rules.match_rules(match_rules=match_rules, body=body),
     )
-    if len(article.rules) > 0:
-        db_article = await article_crud.create_article(
-            db_session=db_session, article=article
-        )
-        print(db_article.body)
+    await write_article(article=article, match_rules=match_rules, signature=signature)
 
 
 def parse_last_entry_date(entries: List[feedparser.FeedParserDict]) -> datetime:
@@ -134,25 +170,30 @@ async def parse_entries(
     feed: models.Feed,
     parsed_feed: feedparser.FeedParserDict,
 ):
+    job_entries: List[feedparser.FeedParserDict] = []
+    tasks: List[Awaitable] = []
     for entry in parsed_feed["entries"]:
         entry_date = parse_entry_datetime(entry)
         if is_new_entry(
             entry_date=entry_date, last_article_date=feed.last_article_date
         ):
             if "content" not in entry:
-                await create_article_job(db_session=db_session, feed=feed, entry=entry)
+                job_entries.append(entry)
             else:
-                await parse_entry(db_session=db_session, feed=feed, entry=entry)
+                tasks.append(parse_entry(db_session=db_session, feed=feed, entry=entry))
+
+    # Parsed concurrently so that the articles are persisted in the same batch
+    await asyncio.gather(*tasks)
+    if job_entries:
+        await create_article_jobs(db_session=db_session, feed=feed, entries=job_entries)
 
 
 def parse_article_from_entry(
-    feed: models.Feed, entry: feedparser.FeedParserDict
+    feed: models.Feed, entry: feedparser.FeedParserDict, body: str
 ) -> schemas.ArticleCreate:
-    body = parse_html(entry.content[0].value)
     return schemas.ArticleCreate(
         title=entry.title,
         url=entry.link,
-        rules=rules.match_rules(match_rules=feed.rules, body=body),
         body=body,
         published=datetime.fromtimestamp(mktime(entry.published_parsed)),
         feed_id=feed.id,
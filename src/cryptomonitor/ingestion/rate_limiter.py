@@ -1,6 +1,11 @@
 """
 Defines a per-domain rate limiter to be used with aiohttp client session.
 
+Each host has a token bucket refilled at one token every `request_delay` seconds,
+holding at most `burst` tokens. Entering the limiter reserves a token and waits
+until it is available, so concurrent requests to a host are spaced out at
+request time while requests to other hosts are unaffected.
+
 Adapted from:
 https://stackoverflow.com/questions/49708101/aiohttp-rate-limiting-requests-per-second-by-domain
 """
@@ -9,50 +14,63 @@ import logging
 from collections import defaultdict
 from urllib.parse import urlparse
 
+from cryptomonitor import metrics
+from cryptomonitor.config import RATE_LIMIT_BURST, RATE_LIMIT_DELAY
+
 logger = logging.getLogger(__name__)
 
 
-class RateLimiter:
-    # domain -> lock:
-    _locks = defaultdict(lambda: asyncio.Lock())
+class TokenBucket:
+    def __init__(self, rate: float, capacity: int):
+        self.rate = rate
+        self.capacity = capacity
+        self._tokens = float(capacity)
+        self._updated = asyncio.get_event_loop().time()
 
-    # domain -> last request time
-    _times = defaultdict(lambda: 0)
+    def reserve(self) -> float:
+        """
+        Take a token, returning the time to wait before it is available
 
-    request_delay = 5
+        Tokens may be taken ahead of time, leaving the bucket in debt, which
+        queues concurrent callers one `1 / rate` interval apart.
+        """
+        now = asyncio.get_event_loop().time()
+        self._tokens = min(
+            self.capacity, self._tokens + (now - self._updated) * self.rate
+        )
+        self._updated = now
+        self._tokens -= 1
+        return max(0, -self._tokens / self.rate)
+
+
+class RateLimiter:
+    request_delay = RATE_LIMIT_DELAY
+    burst = RATE_LIMIT_BURST
+
+    # domain -> token bucket
+    _buckets = defaultdict(
+        lambda: TokenBucket(
+            rate=1 / RateLimiter.request_delay, capacity=RateLimiter.burst
+        )
+    )
 
     def __init__(self, url):
         self._host = urlparse(url).hostname
 
     async def __aenter__(self):
-        # await self._lock
-        async with self._lock:
-
-            to_wait = self._to_wait_before_request()
+        to_wait = self._bucket.reserve()
+        if to_wait > 0:
             logger.info(
                 f"Wait {round(to_wait, 2)} sec before next request to {self._host}"
             )
+            metrics.rate_limit_waits.inc(host=self._host)
+            metrics.rate_limit_wait_seconds.inc(to_wait, host=self._host)
             await asyncio.sleep(to_wait)
 
     async def __aexit__(self, *args):
         logger.info(f"Request to {self._host} just finished")
 
-        self._update_request_time()
-
     @property
-    def _lock(self):
-        """Lock that prevents multiple requests to same host."""
-        return self._locks[self._host]
-
-    def _to_wait_before_request(self):
-        """What time we need to wait before request to host."""
-        request_time = self._times[self._host]
-        request_delay = self.request_delay
-        now = asyncio.get_event_loop().time()
-        to_wait = request_time + request_delay - now
-        to_wait = max(0, to_wait)
-        return to_wait
-
-    def _update_request_time(self):
-        now = asyncio.get_event_loop().time()
-        self._times[self._host] = now
+    def _bucket(self) -> TokenBucket:
+        """Token bucket of the host."""
+        return self._buckets[self._host]
@@ -1,12 +1,13 @@
-import re
 from typing import List
 
 from cryptomonitor.database import models
+from cryptomonitor.rule_engine import global_rule_engine
+
+
+def match_rule_ids(match_rules: List[models.Rule], body: str) -> List[int]:
+    return global_rule_engine.match(rules=match_rules, body=body)
 
 
 def match_rules(match_rules: List[models.Rule], body: str) -> List[models.Rule]:
-    matching_rules: List[models.Rule] = []
-    for rule in match_rules:
-        if re.match(rule.pattern, body):
-            matching_rules.append(rule)
-    return matching_rules
+    rule_ids = set(match_rule_ids(match_rules=match_rules, body=body))
+    return [rule for rule in match_rules if rule.id in rule_ids]
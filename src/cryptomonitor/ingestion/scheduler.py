@@ -0,0 +1,214 @@
+"""
+Defines a feed poll scheduler.
+
+Feeds are kept in a priority queue ordered by the time their next poll is due,
+and polled with bounded concurrency as they become due. After each poll a
+feed's interval is adapted to its observed publish rate: unchanged feeds back
+off towards the maximum interval, busy feeds are polled about twice per
+expected new entry, never more often than the minimum interval.
+"""
+import asyncio
+import heapq
+import logging
+import random
+from statistics import median
+from typing import Dict, List, Optional, Set, Tuple
+
+import feedparser
+
+from cryptomonitor.config import (
+    FEED_POLL_CONCURRENCY,
+    FEED_POLL_MAX_INTERVAL,
+    FEED_POLL_MIN_INTERVAL,
+    FEED_REFRESH_INTERVAL,
+)
+from cryptomonitor.database import async_session
+from cryptomonitor.database.crud import feed as feed_crud
+from cryptomonitor.ingestion import feeds, parser
+from cryptomonitor.ingestion.client import http_client
+from cryptomonitor.profiling import profiler
+
+logger = logging.getLogger(__name__)
+
+# Factor applied to the interval of a feed that has not changed, or failed
+BACKOFF = 1.5
+# Number of most recent entries used to estimate a feed's publish rate
+RECENT_ENTRIES = 10
+
+
+def estimate_poll_interval(
+    parsed_feed: feedparser.FeedParserDict, min_interval: float, max_interval: float
+) -> float:
+    """
+    Return half the median time between the most recent entries of `parsed_feed`
+    """
+    entry_dates = sorted(
+        parser.parse_entry_datetime(entry)
+        for entry in parsed_feed.entries
+        if entry.get("published_parsed")
+    )[-RECENT_ENTRIES:]
+    if len(entry_dates) < 2:
+        return min_interval
+    gaps = [
+        (later - earlier).total_seconds()
+        for earlier, later in zip(entry_dates, entry_dates[1:])
+    ]
+    return min(max_interval, max(min_interval, median(gaps) / 2))
+
+
+class FeedSchedule:
+    def __init__(self, feed_id: int, interval: float, due: float):
+        self.feed_id = feed_id
+        self.interval = interval
+        # Loop time the next poll is due
+        self.due = due
+        # Seconds between the poll being due and starting, for the last poll
+        self.lag = 0.0
+        self.polls = 0
+        self.errors = 0
+
+
+class FeedScheduler:
+    def __init__(
+        self,
+        min_interval: float = FEED_POLL_MIN_INTERVAL,
+        max_interval: float = FEED_POLL_MAX_INTERVAL,
+        concurrency: int = FEED_POLL_CONCURRENCY,
+        refresh_interval: float = FEED_REFRESH_INTERVAL,
+    ):
+        self.min_interval = min_interval
+        self.max_interval = max_interval
+        self.concurrency = concurrency
+        self.refresh_interval = refresh_interval
+        # feed id -> schedule
+        self._schedules: Dict[int, FeedSchedule] = {}
+        # (due, feed id), entries not matching the feed's schedule are stale
+        self._queue: List[Tuple[float, int]] = []
+        self._semaphore: Optional[asyncio.Semaphore] = None
+        # Set when a feed is queued, so the dispatch loop recomputes its next wakeup
+        self._queued: Optional[asyncio.Event] = None
+        # Running polls, referenced so they are not garbage collected
+        self._polls: Set[asyncio.Task] = set()
+
+    def _push(self, schedule: FeedSchedule):
+        heapq.heappush(self._queue, (schedule.due, schedule.feed_id))
+        if self._queued is not None:
+            self._queued.set()
+
+    async def refresh_feeds(self):
+        """
+        Schedule new feeds, spread over the minimum interval, and drop removed ones
+        """
+        async with async_session() as db_session:
+            feed_ids = set(await feed_crud.get_feed_ids(db_session=db_session))
+        now = asyncio.get_running_loop().time()
+        for feed_id in feed_ids - self._schedules.keys():
+            schedule = FeedSchedule(
+                feed_id=feed_id,
+                interval=self.min_interval,
+                due=now + random.uniform(0, self.min_interval),
+            )
+            self._schedules[feed_id] = schedule
+            self._push(schedule)
+        for feed_id in self._schedules.keys() - feed_ids:
+            del self._schedules[feed_id]
+        logger.info(f"Scheduled feeds: {len(self._schedules)}")
+
+    async def run(self):
+        loop = asyncio.get_running_loop()
+        self._semaphore = asyncio.Semaphore(self.concurrency)
+        self._queued = asyncio.Event()
+        next_refresh = loop.time()
+        while True:
+            if loop.time() >= next_refresh:
+                try:
+                    await self.refresh_feeds()
+                except Exception as e:
+                    logger.error(e)
+                next_refresh = loop.time() + self.refresh_interval
+
+            while self._queue and self._queue[0][0] <= loop.time():
+                due, feed_id = heapq.heappop(self._queue)
+                schedule = self._schedules.get(feed_id)
+                if schedule is None or schedule.due != due:
+                    continue
+                task = asyncio.create_task(self._dispatch(schedule))
+                self._polls.add(task)
+                task.add_done_callback(self._polls.discard)
+
+            # Sleep until the next poll or refresh is due, or a feed is queued,
+            # possibly due earlier
+            next_due = self._queue[0][0] if self._queue else next_refresh
+            self._queued.clear()
+            try:
+                await asyncio.wait_for(
+                    self._queued.wait(),
+                    timeout=max(0, min(next_due, next_refresh) - loop.time()),
+                )
+            except asyncio.TimeoutError:
+                pass
+
+    async def _dispatch(self, schedule: FeedSchedule):
+        """
+        Poll a due feed once a slot is free, so lag reflects polls held back
+        """
+        async with self._semaphore:
+            await self.poll(schedule)
+
+    @profiler.profiled("poll_feed")
+    async def poll(self, schedule: FeedSchedule):
+        """
+        Poll a feed and schedule its next poll
+        """
+        loop = asyncio.get_running_loop()
+        schedule.lag = loop.time() - schedule.due
+        try:
+            async with async_session() as db_session:
+                feed = await feed_crud.get_feed(
+                    db_session=db_session, feed_id=schedule.feed_id
+                )
+            if feed is None:
+                self._schedules.pop(schedule.feed_id, None)
+                return
+            parsed_feed = await feeds.fetch_feed(
+                http_session=http_client.session, feed=feed
+            )
+            if parsed_feed is None:
+                schedule.interval = min(
+                    self.max_interval, schedule.interval * BACKOFF
+                )
+            else:
+                schedule.interval = estimate_poll_interval(
+                    parsed_feed=parsed_feed,
+                    min_interval=self.min_interval,
+                    max_interval=self.max_interval,
+                )
+        except Exception as e:
+            logger.error(f"Failed to poll feed {schedule.feed_id}: {e}")
+            schedule.errors += 1
+            schedule.interval = min(self.max_interval, schedule.interval * BACKOFF)
+        finally:
+            schedule.polls += 1
+            schedule.due = loop.time() + schedule.interval
+            if self._schedules.get(schedule.feed_id) is schedule:
+                self._push(schedule)
+
+    def get_status(self) -> List[dict]:
+        """
+        Return the interval, time until next poll and last poll lag of each feed
+        """
+        now = asyncio.get_running_loop().time()
+        return [
+            {
+                "feed_id": schedule.feed_id,
+                "interval": schedule.interval,
+                "due_in": schedule.due - now,
+                "lag": schedule.lag,
+                "polls": schedule.polls,
+                "errors": schedule.errors,
+            }
+            for schedule in self._schedules.values()
+        ]
+
+
+feed_scheduler = FeedScheduler()
@@ -1,29 +1,238 @@
 """
 Module defining an event listener to be used by websocket
 
+New articles are announced on a postgres channel (see `crud.article.notify_articles`)
+by whichever process persisted them. Each API process holds a single asyncpg
+connection listening on that channel, loads the notified articles by id in batches
+and broadcasts them to its websocket subscribers.
+
+Subscribers may filter articles by rule and feed. They are indexed on their
+filters, so a broadcast only visits the subscribers it may match. Articles are
+sent as their slim projection, bodies are only loaded and sent when a subscriber
+asks for them. Every message is serialized once per payload variant (with or
+without body) and the same string is fanned out to the matching subscribers
+without blocking. Each subscriber has a bounded buffer, so a slow websocket
+client either loses its oldest messages or is disconnected, and never delays
+delivery to other clients.
+
 Taken from:
 https://stackoverflow.com/questions/72564515/fastapi-permanently-running-background-task-that-listens-to-postgres-notificati
 """
-from typing import Any
-from asyncio import Queue, Task
 import asyncio
+import logging
+from asyncio import Task
+from collections import defaultdict, deque
+from typing import Any, Deque, Dict, FrozenSet, Iterable, Optional, Set
+
+import asyncpg
+import orjson
+
+from cryptomonitor import metrics
+from cryptomonitor.config import (
+    ARTICLE_EVENTS_BATCH_SIZE,
+    ARTICLE_EVENTS_CHANNEL,
+    WS_BUFFER_SIZE,
+    WS_SLOW_CONSUMER_POLICY,
+)
+from cryptomonitor.database import ASYNCPG_DATABASE_URL, async_session
+from cryptomonitor.database.crud import article as article_crud
+
+logger = logging.getLogger(__name__)
+
+DROP_OLDEST = "drop_oldest"
+DISCONNECT = "disconnect"
+
+# Seconds to wait before reconnecting a lost listen connection
+RECONNECT_DELAY = 5
+
+
+class SubscriptionClosed(Exception):
+    """Raised to a subscriber whose subscription has been closed"""
+
+
+class SlowConsumer(SubscriptionClosed):
+    """Raised to a subscriber disconnected for not keeping up with messages"""
+
+
+def serialize_message(msg: Any) -> str:
+    if isinstance(msg, str):
+        return msg
+    return orjson.dumps(msg, default=str).decode()
+
+
+class Subscription:
+    def __init__(
+        self,
+        rule_ids: Iterable[int] = (),
+        feed_ids: Iterable[int] = (),
+        body: bool = False,
+        maxsize: int = WS_BUFFER_SIZE,
+        policy: str = WS_SLOW_CONSUMER_POLICY,
+    ):
+        if policy not in (DROP_OLDEST, DISCONNECT):
+            raise Exception(
+                f"Unrecognized slow consumer policy {policy} "
+                f"[{DROP_OLDEST}, {DISCONNECT}]"
+            )
+        # Only articles matching one of `rule_ids` and from one of `feed_ids` are
+        # received, an empty filter matching everything
+        self.rule_ids: FrozenSet[int] = frozenset(rule_ids)
+        self.feed_ids: FrozenSet[int] = frozenset(feed_ids)
+        # Receive articles with their body
+        self.body = body
+        self.maxsize = maxsize
+        self.policy = policy
+        self.dropped = 0
+        self.closed = False
+        self.slow = False
+        # Ring buffer of serialized messages, each subscription has its own, the
+        # message strings being shared between subscriptions
+        self._buffer: Deque[str] = deque(maxlen=maxsize)
+        self._ready = asyncio.Event()
+
+    def __len__(self) -> int:
+        return len(self._buffer)
+
+    def matches(self, rule_ids: Iterable[int], feed_id: Optional[int]) -> bool:
+        if self.feed_ids and feed_id not in self.feed_ids:
+            return False
+        return not self.rule_ids or not self.rule_ids.isdisjoint(rule_ids)
+
+    def put(self, message: str) -> bool:
+        """
+        Buffer a message without blocking, returns False once the subscription is closed
+        """
+        if self.closed:
+            return False
+        if len(self._buffer) >= self.maxsize:
+            if self.policy == DISCONNECT:
+                self.slow = True
+                self.close()
+                return False
+            # The deque drops the oldest message on append
+            self.dropped += 1
+            metrics.websocket_dropped_messages.inc()
+        self._buffer.append(message)
+        self._ready.set()
+        return True
 
-import websockets
+    async def get(self) -> str:
+        """
+        Wait for the next message, raises `SubscriptionClosed` once closed
+        """
+        while True:
+            if self.closed:
+                raise SlowConsumer() if self.slow else SubscriptionClosed()
+            if self._buffer:
+                return self._buffer.popleft()
+            self._ready.clear()
+            await self._ready.wait()
+
+    def close(self):
+        self.closed = True
+        self._ready.set()
 
 
 class Listener:
     def __init__(self):
-        # Every incoming websocket conneciton adds it own Queue to this list called
-        # subscribers.
-        self.subscribers: list[Queue] = []
+        # Every incoming websocket connection adds its own Subscription, and removes
+        # it again when the connection is closed.
+        self.subscribers: Set[Subscription] = set()
+        # Subscribers are indexed on their filters so that a broadcast only visits
+        # the subscribers it may match: by rule id if filtered on rules, otherwise
+        # by feed id if filtered on feeds, otherwise unfiltered.
+        self._by_rule: Dict[int, Set[Subscription]] = defaultdict(set)
+        self._by_feed: Dict[int, Set[Subscription]] = defaultdict(set)
+        self._unfiltered: Set[Subscription] = set()
         # This will hold a asyncio task which will receives messages and broadcasts them
         # to all subscribers.
-        self.listener_task: Task
+        self.listener_task: Optional[Task] = None
+        # Ids of notified articles waiting to be loaded and broadcast
+        self._article_ids: Optional[asyncio.Queue] = None
+
+    def subscribe(self, subscription: Subscription) -> Subscription:
+        # Every incoming websocket connection must create a Subscription and subscribe
+        # itself to this class instance, and unsubscribe when it disconnects
+        self.subscribers.add(subscription)
+        self._index(subscription)
+        return subscription
+
+    def unsubscribe(self, subscription: Subscription):
+        subscription.close()
+        self._remove(subscription)
+
+    def update_subscription(
+        self,
+        subscription: Subscription,
+        rule_ids: Iterable[int],
+        feed_ids: Iterable[int],
+        body: bool,
+    ):
+        self._unindex(subscription)
+        subscription.rule_ids = frozenset(rule_ids)
+        subscription.feed_ids = frozenset(feed_ids)
+        subscription.body = body
+        if subscription in self.subscribers:
+            self._index(subscription)
+
+    def _index(self, subscription: Subscription):
+        if subscription.rule_ids:
+            for rule_id in subscription.rule_ids:
+                self._by_rule[rule_id].add(subscription)
+        elif subscription.feed_ids:
+            for feed_id in subscription.feed_ids:
+                self._by_feed[feed_id].add(subscription)
+        else:
+            self._unfiltered.add(subscription)
+
+    def _unindex(self, subscription: Subscription):
+        for index, keys in (
+            (self._by_rule, subscription.rule_ids),
+            (self._by_feed, subscription.feed_ids),
+        ):
+            for key in keys:
+                subscribers = index.get(key)
+                if subscribers is not None:
+                    subscribers.discard(subscription)
+                    if not subscribers:
+                        del index[key]
+        self._unfiltered.discard(subscription)
+
+    def _remove(self, subscription: Subscription):
+        self._unindex(subscription)
+        self.subscribers.discard(subscription)
+
+    def get_subscribers(
+        self, rule_ids: Iterable[int], feed_id: Optional[int]
+    ) -> Set[Subscription]:
+        """
+        Return the subscribers of an article with `rule_ids` from `feed_id`
+        """
+        rule_ids = list(rule_ids)
+        candidates = set(self._unfiltered)
+        for rule_id in rule_ids:
+            candidates.update(self._by_rule.get(rule_id, ()))
+        candidates.update(self._by_feed.get(feed_id, ()))
+        return {
+            subscription
+            for subscription in candidates
+            if subscription.matches(rule_ids=rule_ids, feed_id=feed_id)
+        }
 
-    async def subscribe(self, q: Queue):
-        # Every incoming websocket connection must create a Queue and subscribe itself to
-        # this class instance
-        self.subscribers.append(q)
+    def get_stats(self) -> dict:
+        """
+        Return subscriber counts and buffered messages
+        """
+        buffered = [len(subscription) for subscription in self.subscribers]
+        return {
+            "subscribers": len(self.subscribers),
+            "buffered": sum(buffered),
+            "buffered_max": max(buffered, default=0),
+            "dropped": sum(subscription.dropped for subscription in self.subscribers),
+            "pending_articles": (
+                0 if self._article_ids is None else self._article_ids.qsize()
+            ),
+        }
 
     async def start_listening(self):
         # Method that must be called on startup of application to start the listening
@@ -31,37 +240,92 @@ class Listener:
         self.listener_task = asyncio.create_task(self._listener())
 
     async def _listener(self) -> None:
-        # The method with the infinite listener. In this example, it listens to a websocket
-        # as it was the fastest way for me to mimic the 'infinite generator' in issue 5015
-        # but this can be anything. It is started (via start_listening()) on startup of app.
-        async with websockets.connect("ws://localhost:8001") as websocket:
-            async for message in websocket:
-                for q in self.subscribers:
-                    # important here: every websocket connection has its own Queue added to
-                    # the list of subscribers. Here, we actually broadcast incoming messages
-                    # to all open websocket connections.
-                    await q.put(message)
+        # The method with the infinite listener, it listens for article notifications
+        # and broadcasts the notified articles. It is started (via start_listening())
+        # on startup of app, and reconnects if the connection is lost.
+        self._article_ids = asyncio.Queue()
+        while True:
+            try:
+                connection = await asyncpg.connect(ASYNCPG_DATABASE_URL)
+                try:
+                    await connection.add_listener(
+                        ARTICLE_EVENTS_CHANNEL, self._on_notification
+                    )
+                    logger.info(f"Listening on {ARTICLE_EVENTS_CHANNEL}")
+                    while not connection.is_closed():
+                        await self._publish_articles()
+                finally:
+                    await connection.close()
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error(f"Article listener failed: {e}")
+                await asyncio.sleep(RECONNECT_DELAY)
+
+    def _on_notification(self, connection, pid, channel, payload: str):
+        for article_id in payload.split(","):
+            self._article_ids.put_nowait(int(article_id))
+
+    async def _publish_articles(self, timeout: float = 5):
+        """
+        Load and broadcast up to ARTICLE_EVENTS_BATCH_SIZE notified articles
+
+        Returns after `timeout` seconds without notifications, so the connection
+        can be checked
+        """
+        try:
+            article_ids = [
+                await asyncio.wait_for(self._article_ids.get(), timeout=timeout)
+            ]
+        except asyncio.TimeoutError:
+            return
+        while not self._article_ids.empty() and (
+            len(article_ids) < ARTICLE_EVENTS_BATCH_SIZE
+        ):
+            article_ids.append(self._article_ids.get_nowait())
+        # Bodies are only loaded if someone is subscribed to them
+        body = any(subscription.body for subscription in self.subscribers)
+        async with async_session() as db_session:
+            db_articles = await article_crud.get_articles_by_ids(
+                db_session=db_session, article_ids=article_ids, body=body
+            )
+        for db_article in db_articles:
+            self.publish(db_article.to_dict(body=body))
 
     async def stop_listening(self):
         # closing off the asyncio task when stopping the app. This method is called on
         # app shutdown
+        if self.listener_task is None:
+            return
         if self.listener_task.done():
             self.listener_task.result()
         else:
             self.listener_task.cancel()
 
-    async def receive_and_publish_message(self, msg: Any):
-        # this was a method that was called when someone would make a request
-        # to /add_item endpoint as part of earlier solution to see if the msg would be
-        # broadcasted to all open websocket connections (it does)
-        for q in self.subscribers:
-            try:
-                q.put_nowait(str(msg))
-            except Exception as e:
-                raise e
+    def publish(self, msg: dict):
+        # Serialize once per payload variant and hand the same string to every
+        # matching subscriber. Subscribers closed for being too slow are removed.
+        rule_ids = msg.get("rule_ids", [])
+        subscribers = self.get_subscribers(
+            rule_ids=rule_ids, feed_id=msg.get("feed_id")
+        )
+        messages: Dict[bool, str] = {}
+        for subscription in subscribers:
+            message = messages.get(subscription.body)
+            if message is None:
+                message = messages[subscription.body] = serialize_message(
+                    msg if subscription.body else create_slim_message(msg)
+                )
+            if not subscription.put(message):
+                self._remove(subscription)
+                logger.warning("Disconnected slow websocket subscriber")
+
 
-    # Note: missing here is any disconnect logic (e.g. removing the queue from the list of subscribers
-    # when a websocket connection is ended or closed.)
+def create_slim_message(msg: dict) -> dict:
+    """
+    Return an article message without its body
+    """
+    return {key: value for key, value in msg.items() if key != "body"}
 
 
 global_listener = Listener()
@@ -0,0 +1,265 @@
+"""
+Module defining application metrics, exposed in the Prometheus text format
+
+Metrics are plain in-process counters, gauges and histograms updated from the
+event loop, recording a value is a dict lookup and a few additions so they can
+stay enabled in production. Values held elsewhere (job counts, subscribers, pool
+usage) are copied into gauges when metrics are scraped, see `api.collect_metrics`.
+"""
+import time
+from bisect import bisect_left
+from contextlib import contextmanager
+from typing import Dict, Iterator, List, Sequence, Tuple
+
+LabelValues = Tuple[str, ...]
+
+# Seconds, from a fast rule match to a slow article fetch
+DEFAULT_BUCKETS = (
+    0.001,
+    0.0025,
+    0.005,
+    0.01,
+    0.025,
+    0.05,
+    0.1,
+    0.25,
+    0.5,
+    1.0,
+    2.5,
+    5.0,
+    10.0,
+    30.0,
+)
+
+# Text exposition format, responses add the utf-8 charset
+CONTENT_TYPE = "text/plain; version=0.0.4"
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _format_value(value: float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class Metric:
+    type = ""
+
+    def __init__(self, name: str, documentation: str, labels: Sequence[str] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labels = tuple(labels)
+
+    def _label_values(self, labels: Dict[str, str]) -> LabelValues:
+        if labels.keys() != set(self.labels):
+            raise ValueError(f"{self.name} expects labels {self.labels}")
+        return tuple(str(labels[label]) for label in self.labels)
+
+    def _format_labels(self, values: LabelValues, extra: str = "") -> str:
+        pairs = [
+            f'{label}="{_escape(value)}"' for label, value in zip(self.labels, values)
+        ]
+        if extra:
+            pairs.append(extra)
+        return "{" + ",".join(pairs) + "}" if pairs else ""
+
+    def samples(self) -> Iterator[str]:
+        raise NotImplementedError
+
+    def render(self) -> str:
+        lines = [
+            f"# HELP {self.name} {self.documentation}",
+            f"# TYPE {self.name} {self.type}",
+            *self.samples(),
+        ]
+        return "\n".join(lines)
+
+
+class Counter(Metric):
+    type = "counter"
+
+    def __init__(self, name: str, documentation: str, labels: Sequence[str] = ()):
+        super().__init__(name, documentation, labels)
+        self._values: Dict[LabelValues, float] = {}
+        if not self.labels:
+            self._values[()] = 0
+
+    def inc(self, amount: float = 1, **labels: str):
+        key = self._label_values(labels)
+        self._values[key] = self._values.get(key, 0) + amount
+
+    def set(self, value: float, **labels: str):
+        """
+        Set the total, for totals counted elsewhere
+        """
+        self._values[self._label_values(labels)] = value
+
+    def get(self, **labels: str) -> float:
+        return self._values.get(self._label_values(labels), 0)
+
+    def samples(self) -> Iterator[str]:
+        for values, value in self._values.items():
+            yield f"{self.name}{self._format_labels(values)} {_format_value(value)}"
+
+
+class Gauge(Counter):
+    type = "gauge"
+
+    def clear(self):
+        """
+        Drop all values, e.g. before setting those of label values still present
+        """
+        self._values.clear()
+
+
+class Histogram(Metric):
+    type = "histogram"
+
+    def __init__(
+        self,
+        name: str,
+        documentation: str,
+        labels: Sequence[str] = (),
+        buckets: Sequence[float] = DEFAULT_BUCKETS,
+    ):
+        super().__init__(name, documentation, labels)
+        self.buckets = tuple(sorted(buckets))
+        # label values -> (count per bucket and above the last bucket, sum, count)
+        self._values: Dict[LabelValues, Tuple[List[int], List[float]]] = {}
+
+    def observe(self, value: float, **labels: str):
+        key = self._label_values(labels)
+        entry = self._values.get(key)
+        if entry is None:
+            entry = self._values[key] = ([0] * (len(self.buckets) + 1), [0.0, 0])
+        counts, totals = entry
+        counts[bisect_left(self.buckets, value)] += 1
+        totals[0] += value
+        totals[1] += 1
+
+    @contextmanager
+    def time(self, **labels: str):
+        """
+        Observe the seconds spent in the block, whether or not it raises
+        """
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - start, **labels)
+
+    def samples(self) -> Iterator[str]:
+        for values, (counts, (total, count)) in self._values.items():
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets + (float("inf"),), counts):
+                cumulative += bucket_count
+                labels = self._format_labels(values, f'le="{_format_value(bound)}"')
+                yield f"{self.name}_bucket{labels} {cumulative}"
+            labels = self._format_labels(values)
+            yield f"{self.name}_sum{labels} {_format_value(total)}"
+            yield f"{self.name}_count{labels} {count}"
+
+
+class Registry:
+    def __init__(self):
+        self._metrics: Dict[str, Metric] = {}
+
+    def register(self, metric: Metric):
+        if metric.name in self._metrics:
+            raise ValueError(f"Metric {metric.name} already registered")
+        self._metrics[metric.name] = metric
+
+    def counter(
+        self, name: str, documentation: str, labels: Sequence[str] = ()
+    ) -> Counter:
+        counter = Counter(name, documentation, labels)
+        self.register(counter)
+        return counter
+
+    def gauge(self, name: str, documentation: str, labels: Sequence[str] = ()) -> Gauge:
+        gauge = Gauge(name, documentation, labels)
+        self.register(gauge)
+        return gauge
+
+    def histogram(
+        self,
+        name: str,
+        documentation: str,
+        labels: Sequence[str] = (),
+        buckets: Sequence[float] = DEFAULT_BUCKETS,
+    ) -> Histogram:
+        histogram = Histogram(name, documentation, labels, buckets)
+        self.register(histogram)
+        return histogram
+
+    def render(self) -> str:
+        return "\n".join(metric.render() for metric in self._metrics.values()) + "\n"
+
+
+registry = Registry()
+
+# Recorded as work happens
+stage_seconds = registry.histogram(
+    "cryptomonitor_stage_seconds",
+    "Seconds spent per ingestion stage: fetch_feed, fetch_article, parse_feed, "
+    "parse_html, match_rules and persist (an article batch)",
+    labels=("stage",),
+)
+rate_limit_wait_seconds = registry.counter(
+    "cryptomonitor_rate_limit_wait_seconds_total",
+    "Seconds requests waited for the per host rate limiter",
+    labels=("host",),
+)
+rate_limit_waits = registry.counter(
+    "cryptomonitor_rate_limit_waits_total",
+    "Requests delayed by the per host rate limiter",
+    labels=("host",),
+)
+article_cycles = registry.counter(
+    "cryptomonitor_article_cycles_total", "Completed article job cycles"
+)
+websocket_dropped_messages = registry.counter(
+    "cryptomonitor_websocket_dropped_messages_total",
+    "Messages dropped for slow websocket subscribers",
+)
+
+# Collected when scraped
+article_jobs = registry.gauge(
+    "cryptomonitor_article_jobs", "Article jobs per status", labels=("status",)
+)
+websocket_subscribers = registry.gauge(
+    "cryptomonitor_websocket_subscribers", "Connected websocket subscribers"
+)
+websocket_queued_messages = registry.gauge(
+    "cryptomonitor_websocket_queued_messages",
+    "Messages buffered for websocket subscribers, in total and for the fullest",
+    labels=("aggregate",),
+)
+
+queue_depth = registry.gauge(
+    "cryptomonitor_queue_depth",
+    "Items waiting per internal queue: article_events (notified article ids), "
+    "article_writer (articles to persist) and parse_executor (jobs in flight)",
+    labels=("queue",),
+)
+db_sessions = registry.counter(
+    "cryptomonitor_db_sessions_total", "Database sessions opened"
+)
+db_sessions_active = registry.gauge(
+    "cryptomonitor_db_sessions_active", "Database sessions currently open"
+)
+db_pool_connections = registry.gauge(
+    "cryptomonitor_db_pool_connections",
+    "Pooled database connections per state",
+    labels=("state",),
+)
+db_pool_checkout_wait_seconds = registry.counter(
+    "cryptomonitor_db_pool_checkout_wait_seconds_total",
+    "Seconds spent waiting for a pooled connection",
+)
+db_pool_checkouts = registry.counter(
+    "cryptomonitor_db_pool_checkouts_total", "Pooled connection checkouts"
+)
@@ -0,0 +1,147 @@
+"""
+Module defining a literal prefilter for regex rules
+
+Rule patterns such as `.*((hack)|(exploit)|(vuln)).*` can only match text that
+contains one of a few literals. `extract_literals` walks the parsed pattern and
+returns such a set of alternative literals, or None when no literal is required.
+A `LiteralIndex` (an Aho-Corasick automaton) then finds every literal of every
+rule present in a text in a single pass, so only rules whose literals appear
+need their regex to be evaluated.
+"""
+from collections import deque
+from typing import Dict, FrozenSet, Iterable, List, Optional, Sequence, Tuple
+
+try:
+    from re import _constants as sre_constants
+    from re import _parser as sre_parse
+except ImportError:  # Python < 3.11
+    import sre_constants
+    import sre_parse
+
+REPEATS = {
+    sre_constants.MAX_REPEAT,
+    sre_constants.MIN_REPEAT,
+    getattr(sre_constants, "POSSESSIVE_REPEAT", sre_constants.MAX_REPEAT),
+}
+
+
+def _is_better(literals: FrozenSet[str], other: Optional[FrozenSet[str]]) -> bool:
+    """
+    Prefer the requirement whose shortest literal is longest, then the fewest
+    alternatives, as the least likely to appear by chance
+    """
+    if other is None:
+        return True
+    shortest = min(len(literal) for literal in literals)
+    other_shortest = min(len(literal) for literal in other)
+    if shortest != other_shortest:
+        return shortest > other_shortest
+    return len(literals) < len(other)
+
+
+def _required_literals(items: Sequence[Tuple]) -> Optional[FrozenSet[str]]:
+    """
+    Return literals one of which appears in any match of the parsed `items`
+    """
+    best: Optional[FrozenSet[str]] = None
+    run: List[str] = []
+
+    def consider(literals: Optional[FrozenSet[str]]):
+        nonlocal best
+        if literals and _is_better(literals, best):
+            best = literals
+
+    for op, av in items:
+        if op is sre_constants.LITERAL:
+            run.append(chr(av))
+            continue
+        if run:
+            consider(frozenset(["".join(run)]))
+            run = []
+        if op is sre_constants.SUBPATTERN:
+            _, add_flags, _, sub_pattern = av
+            if not add_flags & sre_constants.SRE_FLAG_IGNORECASE:
+                consider(_required_literals(sub_pattern.data))
+        elif op is sre_constants.BRANCH:
+            _, branches = av
+            alternatives = [_required_literals(branch.data) for branch in branches]
+            if all(alternatives):
+                consider(frozenset().union(*alternatives))
+        elif op in REPEATS:
+            min_repeat, _, sub_pattern = av
+            if min_repeat >= 1:
+                consider(_required_literals(sub_pattern.data))
+        # Any other item (classes, anchors, lookarounds, ...) requires no literal
+    if run:
+        consider(frozenset(["".join(run)]))
+    return best
+
+
+def extract_literals(pattern: str) -> Optional[FrozenSet[str]]:
+    """
+    Return literals one of which appears in any text matching `pattern`, None if
+    there are none, in which case the pattern must always be evaluated
+    """
+    try:
+        parsed = sre_parse.parse(pattern)
+    except Exception:
+        return None
+    if parsed.state.flags & sre_constants.SRE_FLAG_IGNORECASE:
+        return None
+    return _required_literals(parsed.data)
+
+
+class LiteralIndex:
+    def __init__(self, literals: Iterable[str]):
+        self.literals: List[str] = list(dict.fromkeys(literals))
+        # Trie transitions, failure links and the literals ending at each state,
+        # including those ending at its failure states
+        self._goto: List[Dict[str, int]] = [{}]
+        self._fail: List[int] = [0]
+        self._out: List[FrozenSet[int]] = [frozenset()]
+        for literal_index, literal in enumerate(self.literals):
+            state = 0
+            for char in literal:
+                next_state = self._goto[state].get(char)
+                if next_state is None:
+                    next_state = len(self._goto)
+                    self._goto[state][char] = next_state
+                    self._goto.append({})
+                    self._fail.append(0)
+                    self._out.append(frozenset())
+                state = next_state
+            self._out[state] = self._out[state] | {literal_index}
+        self._build_failure_links()
+
+    def __len__(self) -> int:
+        return len(self.literals)
+
+    def _build_failure_links(self):
+        queue = deque(self._goto[0].values())
+        while queue:
+            state = queue.popleft()
+            for char, next_state in self._goto[state].items():
+                queue.append(next_state)
+                fail = self._fail[state]
+                while fail and char not in self._goto[fail]:
+                    fail = self._fail[fail]
+                fail = self._goto[fail].get(char, 0)
+                self._fail[next_state] = fail
+                self._out[next_state] = self._out[next_state] | self._out[fail]
+
+    def scan(self, text: str) -> FrozenSet[int]:
+        """
+        Return the indexes of all literals appearing in `text`
+        """
+        goto = self._goto
+        fail = self._fail
+        out = self._out
+        found: FrozenSet[int] = frozenset()
+        state = 0
+        for char in text:
+            while state and char not in goto[state]:
+                state = fail[state]
+            state = goto[state].get(char, 0)
+            if out[state]:
+                found = found | out[state]
+        return found
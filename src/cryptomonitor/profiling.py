@@ -0,0 +1,244 @@
+"""
+Module defining on-demand profiling of ingestion cycles and API requests
+
+Functions decorated with `profiler.profiled` are profiled by a sampling profiler:
+while any of them runs, a single thread takes the stack of every other thread every
+PROFILE_INTERVAL seconds, and each run's profile is made of the samples taken
+during its time window. Samples are written in the collapsed stack format, one
+`frame;frame;... count` line per distinct stack, read by flamegraph.pl, speedscope
+and similar tools.
+
+A profile is written when a run takes longer than PROFILE_SLOW_SECONDS, or for each
+of the next runs of a profiled function requested with `profiler.request` (see
+`/profiling`). When neither applies, profiled functions are called directly, the
+only cost being a check.
+
+Code run in a parse executor process is not sampled, use PARSE_EXECUTOR=thread to
+include parsing. Other tasks running on the event loop at the same time appear in
+the profile of a run, as does time spent waiting (e.g. on postgres) in the loop's
+selector.
+"""
+import asyncio
+import functools
+import logging
+import os
+import sys
+import threading
+import time
+from collections import Counter, deque
+from datetime import datetime
+from typing import Callable, Deque, Dict, List, Optional, Set, Tuple
+
+from cryptomonitor.config import PROFILE_DIR, PROFILE_INTERVAL, PROFILE_SLOW_SECONDS
+
+logger = logging.getLogger(__name__)
+
+# Number of written profiles listed by `Profiler.get_status`
+RECENT_PROFILES = 20
+
+
+def _format_frame(frame) -> str:
+    code = frame.f_code
+    path = os.path.join(*code.co_filename.split(os.sep)[-2:])
+    return f"{code.co_name} ({path}:{code.co_firstlineno})"
+
+
+def collapse_stack(frame, thread_name: str) -> str:
+    """
+    Return the stack of `frame` as `thread;outermost frame;...;innermost frame`
+    """
+    frames: List[str] = []
+    while frame is not None:
+        frames.append(_format_frame(frame))
+        frame = frame.f_back
+    frames.append(thread_name)
+    return ";".join(reversed(frames))
+
+
+class StackSampler:
+    def __init__(self, interval: float = PROFILE_INTERVAL):
+        self.interval = interval
+        # (perf counter time, collapsed stack of each thread) of each sample
+        self._samples: Deque[Tuple[float, List[str]]] = deque()
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread = threading.Thread(
+            target=self._run, name="profiler", daemon=True
+        )
+
+    def start(self):
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        self._thread.join()
+
+    def _run(self):
+        own_id = threading.get_ident()
+        while not self._stop.wait(self.interval):
+            thread_names = {
+                thread.ident: thread.name for thread in threading.enumerate()
+            }
+            stacks = [
+                collapse_stack(frame, thread_names.get(thread_id, str(thread_id)))
+                for thread_id, frame in sys._current_frames().items()
+                if thread_id != own_id
+            ]
+            with self._lock:
+                self._samples.append((time.perf_counter(), stacks))
+
+    def collect(self, start: float, end: float) -> Tuple[Counter, int]:
+        """
+        Return the number of samples of each stack taken between `start` and `end`,
+        and the number of samples
+        """
+        stacks: Counter = Counter()
+        samples = 0
+        with self._lock:
+            for sampled, sample_stacks in self._samples:
+                if start <= sampled <= end:
+                    stacks.update(sample_stacks)
+                    samples += 1
+        return stacks, samples
+
+    def discard(self, before: float):
+        """
+        Drop the samples taken before `before`, no longer needed by any run
+        """
+        with self._lock:
+            while self._samples and self._samples[0][0] < before:
+                self._samples.popleft()
+
+
+def to_collapsed(stacks: Counter) -> str:
+    return "".join(f"{stack} {count}\n" for stack, count in stacks.most_common())
+
+
+class Profile:
+    def __init__(self, name: str, path: str, seconds: float, samples: int):
+        self.name = name
+        self.path = path
+        self.seconds = seconds
+        self.samples = samples
+
+    def to_dict(self) -> dict:
+        return {
+            "name": self.name,
+            "file": os.path.basename(self.path),
+            "seconds": self.seconds,
+            "samples": self.samples,
+        }
+
+
+class Profiler:
+    def __init__(
+        self,
+        slow_seconds: float = PROFILE_SLOW_SECONDS,
+        interval: float = PROFILE_INTERVAL,
+        directory: str = PROFILE_DIR,
+    ):
+        # Runs taking longer are profiled, 0 to only profile requested runs
+        self.slow_seconds = slow_seconds
+        self.interval = interval
+        self.directory = directory
+        # Names of the profiled functions
+        self.targets: Set[str] = set()
+        # name -> number of next runs to profile whatever their duration
+        self.requested: Dict[str, int] = {}
+        self.profiles: Deque[Profile] = deque(maxlen=RECENT_PROFILES)
+        # Sampler shared by the runs being profiled, running while there are any
+        self._sampler: Optional[StackSampler] = None
+        # Start time of each run being profiled
+        self._runs: List[float] = []
+
+    def is_enabled(self, name: str) -> bool:
+        return self.slow_seconds > 0 or self.requested.get(name, 0) > 0
+
+    def request(self, target: str, runs: int):
+        """
+        Profile the next `runs` runs of profiled function `target`
+        """
+        if target not in self.targets:
+            raise ValueError(
+                f"Unknown profiling target {target} {sorted(self.targets)}"
+            )
+        self.requested[target] = runs
+        logger.info(f"Profiling the next {runs} runs of {target}")
+
+    def profiled(self, name: str) -> Callable:
+        """
+        Decorate an async function so that its runs are profiled when enabled
+        """
+        self.targets.add(name)
+
+        def decorator(func: Callable) -> Callable:
+            @functools.wraps(func)
+            async def wrapper(*args, **kwargs):
+                if not self.is_enabled(name):
+                    return await func(*args, **kwargs)
+                return await self._run_profiled(name, func, *args, **kwargs)
+
+            return wrapper
+
+        return decorator
+
+    async def _run_profiled(self, name: str, func: Callable, *args, **kwargs):
+        requested = self.requested.get(name, 0) > 0
+        if requested:
+            self.requested[name] -= 1
+        if self._sampler is None:
+            self._sampler = StackSampler(interval=self.interval)
+            self._sampler.start()
+        sampler = self._sampler
+        start = time.perf_counter()
+        self._runs.append(start)
+        try:
+            return await func(*args, **kwargs)
+        finally:
+            end = time.perf_counter()
+            seconds = end - start
+            self._runs.remove(start)
+            stacks, samples = sampler.collect(start, end)
+            if self._runs:
+                sampler.discard(before=min(self._runs))
+            else:
+                self._sampler = None
+                sampler.stop()
+            if requested or (self.slow_seconds and seconds >= self.slow_seconds):
+                await asyncio.get_running_loop().run_in_executor(
+                    None, self._write, name, seconds, stacks, samples
+                )
+
+    def _write(self, name: str, seconds: float, stacks: Counter, samples: int):
+        os.makedirs(self.directory, exist_ok=True)
+        timestamp = datetime.now().strftime("%Y%m%dT%H%M%S.%f")
+        path = os.path.join(self.directory, f"{name}-{timestamp}.collapsed")
+        with open(path, "w") as f:
+            f.write(to_collapsed(stacks))
+        self.profiles.append(
+            Profile(name=name, path=path, seconds=seconds, samples=samples)
+        )
+        logger.info(f"Profiled {name} ({seconds:.2f}s, {samples} samples) to {path}")
+
+    def get_profile(self, file: str) -> Optional[Profile]:
+        """
+        Return the recent profile written to `file`, if any
+        """
+        for profile in self.profiles:
+            if os.path.basename(profile.path) == file:
+                return profile
+        return None
+
+    def get_status(self) -> dict:
+        return {
+            "slow_seconds": self.slow_seconds,
+            "interval": self.interval,
+            "targets": sorted(self.targets),
+            "requested": {
+                target: runs for target, runs in self.requested.items() if runs
+            },
+            "profiles": [profile.to_dict() for profile in self.profiles],
+        }
+
+
+profiler = Profiler()
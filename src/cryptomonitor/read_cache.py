@@ -0,0 +1,106 @@
+"""
+Module defining an in-process cache for feed and rule reads
+
+Feeds and rules only change when they are created through the crud layer, which
+invalidates the cache, so reads are served from memory until then or until their
+TTL expires. Each read is stored serialized, together with an ETag derived from
+its content, so cached responses are neither re-encoded nor re-sent when the
+client already holds them.
+"""
+import asyncio
+import hashlib
+import logging
+import time
+from collections import OrderedDict
+from typing import Any, Awaitable, Callable, Dict, Hashable, Optional, Tuple
+
+import orjson
+from pydantic.json import pydantic_encoder
+
+from cryptomonitor.config import READ_CACHE_SIZE, READ_CACHE_TTL
+
+logger = logging.getLogger(__name__)
+
+
+class CachedRead:
+    def __init__(self, body: bytes, expires: float):
+        self.body = body
+        self.etag = f'"{hashlib.sha1(body).hexdigest()}"'
+        self.expires = expires
+
+
+class ReadCache:
+    def __init__(self, maxsize: int = READ_CACHE_SIZE, ttl: float = READ_CACHE_TTL):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.version = 0
+        self.hits = 0
+        self.misses = 0
+        # key -> read, least recently used first
+        self._reads: "OrderedDict[Hashable, CachedRead]" = OrderedDict()
+        # (key, version) -> running load, shared by concurrent misses
+        self._loading: Dict[Tuple[Hashable, int], asyncio.Future] = {}
+
+    def invalidate(self):
+        """
+        Drop all cached reads, called whenever feeds or rules are created
+        """
+        self.version += 1
+        self._reads.clear()
+        logger.info(f"Read cache invalidated, version {self.version}")
+
+    async def get(
+        self, key: Hashable, load: Callable[[], Awaitable[Any]]
+    ) -> Optional[CachedRead]:
+        """
+        Return the cached read for `key`, calling `load` on a miss
+
+        Returns None, without caching it, if `load` returns None
+        """
+        read = self._reads.get(key)
+        if read is not None and read.expires > time.monotonic():
+            self._reads.move_to_end(key)
+            self.hits += 1
+            return read
+        self.misses += 1
+
+        version = self.version
+        loading = self._loading.get((key, version))
+        if loading is not None:
+            return await asyncio.shield(loading)
+        loading = self._loading[(key, version)] = asyncio.ensure_future(
+            self._load(load)
+        )
+        try:
+            read = await asyncio.shield(loading)
+        finally:
+            self._loading.pop((key, version), None)
+        # Reads loaded across an invalidation may be stale, so are not stored
+        if read is not None and version == self.version:
+            self._reads[key] = read
+            self._reads.move_to_end(key)
+            while len(self._reads) > self.maxsize:
+                self._reads.popitem(last=False)
+        return read
+
+    async def _load(self, load: Callable[[], Awaitable[Any]]) -> Optional[CachedRead]:
+        value = await load()
+        if value is None:
+            return None
+        body = orjson.dumps(value, default=pydantic_encoder)
+        return CachedRead(body=body, expires=time.monotonic() + self.ttl)
+
+    def get_stats(self) -> dict:
+        lookups = self.hits + self.misses
+        return {
+            "size": len(self._reads),
+            "maxsize": self.maxsize,
+            "ttl": self.ttl,
+            "version": self.version,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_ratio": self.hits / lookups if lookups else 0.0,
+        }
+
+
+global_read_cache = ReadCache()
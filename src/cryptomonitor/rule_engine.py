@@ -0,0 +1,145 @@
+"""
+Module defining a compiled rule engine used to match article bodies against rules
+
+Patterns are compiled once and grouped into a `RuleSet` per distinct collection of
+rules (typically the rules attached to a feed). Rule sets are keyed on the
+`(id, pattern)` of every rule so a changed pattern always yields a fresh set, and
+the engine version is bumped whenever the rules are changed through the crud layer.
+
+Each pattern's required literals are extracted once (see `cryptomonitor.prefilter`)
+and indexed per rule set, so a body is scanned once for all of them and only the
+patterns of rules whose literals appear, or that require none, are evaluated.
+"""
+import logging
+import re
+from typing import Dict, FrozenSet, Iterable, List, Optional, Pattern, Tuple
+
+from cryptomonitor.database import models
+from cryptomonitor.prefilter import LiteralIndex, extract_literals
+
+logger = logging.getLogger(__name__)
+
+RuleKey = Tuple[Tuple[int, str], ...]
+
+# Below this many rules requiring literals, scanning the body costs more than
+# evaluating every pattern
+PREFILTER_MIN_RULES = 16
+
+
+class RuleSet:
+    def __init__(
+        self,
+        patterns: List[Tuple[int, Pattern]],
+        version: int = 0,
+        literals: Optional[List[Optional[FrozenSet[str]]]] = None,
+    ):
+        self.version = version
+        self._patterns = patterns
+        # Positions of the rules to evaluate whatever the body
+        self._unfiltered: List[int] = []
+        # literal index -> positions of the rules requiring it
+        self._literal_rules: List[List[int]] = []
+        self._index: Optional[LiteralIndex] = None
+        if (
+            literals is None
+            or sum(1 for rule_literals in literals if rule_literals)
+            < PREFILTER_MIN_RULES
+        ):
+            self._unfiltered = list(range(len(patterns)))
+            return
+
+        literal_positions: Dict[str, List[int]] = {}
+        for position, rule_literals in enumerate(literals):
+            if not rule_literals:
+                self._unfiltered.append(position)
+                continue
+            for literal in rule_literals:
+                literal_positions.setdefault(literal, []).append(position)
+        self._index = LiteralIndex(literal_positions)
+        self._literal_rules = list(literal_positions.values())
+
+    def __len__(self) -> int:
+        return len(self._patterns)
+
+    def get_candidates(self, body: str) -> List[int]:
+        """
+        Return the positions of the rules that may match `body`, in rule order
+        """
+        if self._index is None:
+            return self._unfiltered
+        candidates = set(self._unfiltered)
+        for literal_index in self._index.scan(body):
+            candidates.update(self._literal_rules[literal_index])
+        return sorted(candidates)
+
+    def match(self, body: str) -> List[int]:
+        """
+        Return the ids of all rules matching `body`
+        """
+        patterns = self._patterns
+        return [
+            patterns[position][0]
+            for position in self.get_candidates(body)
+            if patterns[position][1].match(body)
+        ]
+
+
+class RuleEngine:
+    def __init__(self, prefilter: bool = True):
+        self.version = 0
+        self.prefilter = prefilter
+        # pattern -> compiled pattern, shared between rule sets
+        self._compiled: Dict[str, Pattern] = {}
+        # pattern -> literals one of which any match contains, None if there are none
+        self._literals: Dict[str, Optional[FrozenSet[str]]] = {}
+        # (id, pattern) of each rule -> rule set
+        self._rule_sets: Dict[RuleKey, RuleSet] = {}
+
+    def invalidate(self):
+        """
+        Drop all compiled rule sets, called whenever rules are created or changed
+        """
+        self.version += 1
+        self._compiled.clear()
+        self._literals.clear()
+        self._rule_sets.clear()
+        logger.info(f"Rule engine invalidated, version {self.version}")
+
+    def compile(self, pattern: str) -> Pattern:
+        compiled = self._compiled.get(pattern)
+        if compiled is None:
+            compiled = self._compiled[pattern] = re.compile(pattern)
+        return compiled
+
+    def get_literals(self, pattern: str) -> Optional[FrozenSet[str]]:
+        if pattern not in self._literals:
+            self._literals[pattern] = extract_literals(pattern)
+        return self._literals[pattern]
+
+    def get_rule_set(self, rules: Iterable[models.Rule]) -> RuleSet:
+        """
+        Return the compiled rule set for `rules`, building it if required
+        """
+        key: RuleKey = tuple((rule.id, rule.pattern) for rule in rules)
+        rule_set = self._rule_sets.get(key)
+        if rule_set is None:
+            rule_set = RuleSet(
+                [(rule_id, self.compile(pattern)) for rule_id, pattern in key],
+                version=self.version,
+                literals=(
+                    [self.get_literals(pattern) for _, pattern in key]
+                    if self.prefilter
+                    else None
+                ),
+            )
+            self._rule_sets[key] = rule_set
+        return rule_set
+
+    def match(self, rules: Iterable[models.Rule], body: str) -> List[int]:
+        """
+        Return the ids of `rules` matching `body`
+        """
+        return self.get_rule_set(rules).match(body)
+
+
+global_rule_engine = RuleEngine()
@@ -1,6 +1,6 @@
 from datetime import datetime
 from enum import Enum
-from typing import List
+from typing import List, Optional
 
 from pydantic import BaseModel, validator
 
@@ -63,17 +63,26 @@ class FeedUpdate(BaseModel):
     last_article_date: datetime
 
 
+class FeedValidators(BaseModel):
+    etag: Optional[str]
+    last_modified: Optional[str]
+    content_hash: Optional[str]
+
+
 class ArticleBase(BaseModel):
     title: str
-    body: str
+    # Not stored for near-duplicates of another article, see `canonical_id`
+    body: Optional[str]
     url: str
     feed_id: int
     published: datetime
     rules: List[Rule] = []
+    canonical_id: Optional[int]
 
 
 class ArticleCreate(ArticleBase):
-    pass
+    # MinHash signature of the body, see `cryptomonitor.fingerprint`
+    fingerprint: Optional[List[int]]
 
 
 class Article(ArticleBase):
@@ -83,6 +92,32 @@ class Article(ArticleBase):
         orm_mode = True
 
 
+class ArticleField(str, Enum):
+    body = "body"
+
+
+class ArticleSummary(BaseModel):
+    id: int
+    title: str
+    url: str
+    feed_id: int
+    published: datetime
+    rule_ids: List[int] = []
+    canonical_id: Optional[int]
+    # Only set when requested with ArticleField.body
+    body: Optional[str]
+
+
+class ArticleSearchResult(ArticleSummary):
+    rank: float
+
+
+class SubscriptionFilter(BaseModel):
+    rules: List[int] = []
+    feeds: List[int] = []
+    fields: List[ArticleField] = []
+
+
 class ArticleJobStatus(str, Enum):
     pending = "pending"
     processing = "processing"
@@ -107,6 +142,8 @@ class ArticleJobCreate(ArticleJobBase):
 
 class ArticleJob(ArticleJobBase):
     id: int
+    worker_id: Optional[str]
+    lease_expires: Optional[datetime]
 
     class Config:
         orm_mode = True
@@ -114,3 +151,26 @@ class ArticleJob(ArticleJobBase):
 
 class ArticleJobUpdate(BaseModel):
     status: ArticleJobStatus
+
+
+class RuleBackfillStatus(str, Enum):
+    running = "running"
+    complete = "complete"
+    error = "error"
+
+
+class RuleBackfill(BaseModel):
+    rule_id: int
+    status: RuleBackfillStatus
+    last_article_id: int
+    max_article_id: int
+    scanned: int
+    matched: int
+    elapsed: float
+    progress: float
+    rate: float
+    started: datetime
+    error: Optional[str]
+
+    class Config:
+        orm_mode = True
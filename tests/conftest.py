@@ -1,10 +1,153 @@
 """
-    Dummy conftest.py for cryptomonitor.
+Shared fixtures for cryptomonitor tests.
 
-    If you don't know what this is for, just leave it empty.
-    Read more about conftest.py under:
-    - https://docs.pytest.org/en/stable/fixture.html
-    - https://docs.pytest.org/en/stable/writing_plugins.html
+Read more about conftest.py under:
+- https://docs.pytest.org/en/stable/fixture.html
+- https://docs.pytest.org/en/stable/writing_plugins.html
 """
+import asyncio
+import selectors
+from contextlib import asynccontextmanager
+from datetime import datetime
+from types import SimpleNamespace
 
-# import pytest
+import pytest
+from sqlalchemy.dialects import postgresql
+
+from cryptomonitor import schemas
+from cryptomonitor.database import writer
+from cryptomonitor.database.crud import article as article_crud
+from cryptomonitor.ingestion import backfill, dedup, feeds, scheduler
+
+
+def compile_query(query):
+    return query.compile(dialect=postgresql.dialect())
+
+
+class FakeClockSelector(selectors.DefaultSelector):
+    """
+    Selector advancing a virtual clock by the timeout it is given instead of
+    waiting, so that sleeps and timers complete immediately in virtual time
+    """
+
+    def __init__(self):
+        super().__init__()
+        self.now = 0.0
+
+    def time(self) -> float:
+        return self.now
+
+    def select(self, timeout=None):
+        if timeout:
+            self.now += timeout
+            timeout = 0
+        return super().select(timeout)
+
+
+@pytest.fixture
+def fake_clock_loop():
+    """
+    An event loop whose time only advances when it would otherwise wait
+    """
+    selector = FakeClockSelector()
+    loop = asyncio.SelectorEventLoop(selector)
+    loop.time = selector.time
+    asyncio.set_event_loop(loop)
+    yield loop
+    asyncio.set_event_loop(None)
+    loop.close()
+
+
+class FakeSession:
+    """
+    Session recording executed queries, compiled for postgres, and returning
+    `rows` from every query
+    """
+
+    def __init__(self):
+        self.rows = []
+        self.queries = []
+        self.commits = 0
+
+    async def execute(self, query):
+        self.queries.append(compile_query(query))
+        rows = self.rows
+        return SimpleNamespace(
+            all=lambda: rows,
+            mappings=lambda: SimpleNamespace(all=lambda: rows),
+            scalars=lambda: SimpleNamespace(all=lambda: rows),
+        )
+
+    async def commit(self):
+        self.commits += 1
+
+
+@pytest.fixture
+def db_session():
+    return FakeSession()
+
+
+@asynccontextmanager
+async def fake_async_session():
+    yield None
+
+
+@pytest.fixture
+def stub_sessions(monkeypatch):
+    """
+    Open no database session in the modules under test, their crud functions
+    are stubbed by the tests
+    """
+    for module in (writer, dedup, scheduler, backfill, feeds):
+        monkeypatch.setattr(module, "async_session", fake_async_session)
+
+
+def create_article(i: int, body: str = "body", **fields) -> schemas.ArticleCreate:
+    return schemas.ArticleCreate(
+        **{
+            "title": f"Article {i}",
+            "body": body,
+            "url": f"https://example.com/{i}",
+            "feed_id": 1,
+            "published": datetime(2022, 1, 1),
+            **fields,
+        }
+    )
+
+
+@pytest.fixture
+def make_article():
+    """
+    Factory of the article numbered `i`, with any field overridden
+    """
+    return create_article
+
+
+class ArticleStore:
+    """
+    Stub of `crud.article.create_articles` recording persisted articles, by id
+    and by batch
+    """
+
+    def __init__(self):
+        self.articles = {}
+        self.batches = []
+
+    async def create_articles(self, db_session, articles):
+        await asyncio.sleep(0)
+        self.batches.append(articles)
+        messages = []
+        for article in articles:
+            article_id = len(self.articles) + 1
+            self.articles[article_id] = article
+            messages.append(
+                {"id": article_id, "url": article.url, "body": article.body}
+            )
+        return messages
+
+
+@pytest.fixture
+def persisted(monkeypatch, stub_sessions):
+    store = ArticleStore()
+    monkeypatch.setattr(article_crud, "create_articles", store.create_articles)
+    return store
@@ -0,0 +1,83 @@
+import asyncio
+from datetime import datetime
+from types import SimpleNamespace
+
+import pytest
+
+from cryptomonitor import schemas
+from cryptomonitor.ingestion import backfill
+from cryptomonitor.ingestion.backfill import RuleBackfiller, match_rule_chunk
+
+
+def make_backfill(rule_id: int) -> SimpleNamespace:
+    return SimpleNamespace(
+        rule_id=rule_id,
+        status=schemas.RuleBackfillStatus.running,
+        last_article_id=0,
+        max_article_id=100,
+        scanned=0,
+        matched=0,
+        elapsed=0.0,
+        progress=0.0,
+        rate=0.0,
+        started=datetime(2022, 1, 1),
+        error=None,
+    )
+
+
+@pytest.fixture
+def started_backfills(monkeypatch, stub_sessions):
+    """
+    Stub the rules and backfills of the database, recording started backfills
+    """
+    started = []
+
+    async def get_rule(db_session, rule_id):
+        await asyncio.sleep(0)
+        return SimpleNamespace(id=rule_id, pattern=".*bitcoin.*")
+
+    async def start_rule_backfill(db_session, rule_id, restart):
+        await asyncio.sleep(0)
+        started.append(rule_id)
+        return make_backfill(rule_id)
+
+    async def get_rule_backfill(db_session, rule_id):
+        return make_backfill(rule_id)
+
+    monkeypatch.setattr(backfill.rule_crud, "get_rule", get_rule)
+    monkeypatch.setattr(backfill.rule_crud, "start_rule_backfill", start_rule_backfill)
+    monkeypatch.setattr(backfill.rule_crud, "get_rule_backfill", get_rule_backfill)
+    return started
+
+
+def test_concurrent_starts_run_one_backfill(started_backfills):
+    rule_backfiller = RuleBackfiller()
+    runs = []
+
+    async def run(backfill, pattern):
+        runs.append(backfill.rule_id)
+        await asyncio.Event().wait()
+
+    rule_backfiller.run = run
+
+    async def start():
+        backfills = await asyncio.gather(
+            rule_backfiller.start(rule_id=1), rule_backfiller.start(rule_id=1)
+        )
+        await asyncio.sleep(0)
+        running = rule_backfiller.is_running(1)
+        await rule_backfiller.stop()
+        return backfills, running
+
+    backfills, running = asyncio.run(start())
+    assert [backfill.rule_id for backfill in backfills] == [1, 1]
+    assert running
+    assert started_backfills == [1]
+    assert runs == [1]
+
+
+def test_match_rule_chunk():
+    rows = [(1, "bitcoin rallies"), (2, "ether rallies"), (3, "the bitcoin fee")]
+    assert match_rule_chunk(".*bitcoin.*", rows) == [1, 3]
+    # Patterns without required literals are matched against every body
+    assert match_rule_chunk(".*", rows) == [1, 2, 3]
@@ -0,0 +1,59 @@
+import pytest
+from bs4 import BeautifulSoup
+
+from cryptomonitor.ingestion.extractor import BLACKLIST, extract_text
+
+DOCUMENTS = [
+    """<!DOCTYPE html>
+<html>
+<head><title>Title</title><style>body { color: red; }</style></head>
+<body>
+<header><nav>Home</nav></header>
+<script>var tracked = true;</script>
+<article>
+<h1>Bitcoin &amp; Ethereum</h1>
+<p>First <b>bold</b> paragraph.</p>
+<p>Second&nbsp;paragraph<br>after a break.</p>
+<pre>  keep
+    whitespace  </pre>
+<!-- a comment -->
+</article>
+<noscript>Enable javascript</noscript>
+</body>
+</html>""",
+    "<div><p>Unclosed paragraph<div>nested</div></span>stray end tag</div>",
+    "plain text without tags",
+    "<p>\ttabs\tare\tremoved</p>",
+]
+
+
+def extract_text_bs4(html: str) -> str:
+    """
+    Reference BeautifulSoup implementation the extractor replaces
+    """
+    soup = BeautifulSoup(html, "html.parser")
+    text = ""
+    for item in soup.find_all(string=True):
+        if item.parent.name not in BLACKLIST:
+            text += f"{item} "
+    return text.replace("\t", "").strip()
+
+
+@pytest.mark.parametrize("html", DOCUMENTS)
+def test_matches_beautifulsoup(html):
+    assert extract_text(html) == extract_text_bs4(html)
+
+
+def test_blacklisted_text_dropped():
+    text = extract_text(DOCUMENTS[0])
+    assert "Bitcoin & Ethereum" in text
+    assert "bold" in text
+    # Only text directly inside a blacklisted tag is dropped
+    assert "Title" in text and "Home" in text
+    for dropped in ("color: red", "tracked", "Enable javascript"):
+        assert dropped not in text
+
+
+def test_bytes_decoded():
+    html = "<p>Prix du bitcoin en hausse à 20 000 €</p>"
+    assert extract_text(html.encode("utf-8")) == extract_text(html)
@@ -0,0 +1,110 @@
+import asyncio
+import hashlib
+from contextlib import asynccontextmanager
+from types import SimpleNamespace
+
+import pytest
+
+from cryptomonitor.ingestion import feeds
+from cryptomonitor.ingestion.executor import ParseExecutor
+
+# The bare & makes the feed malformed, feedparser still parses it leniently
+BOZO_FEED = """<?xml version="1.0"?>
+<rss version="2.0">
+  <channel>
+    <title>Feed</title>
+    <item>
+      <title>Bitcoin & Ethereum</title>
+      <link>https://example.com/1</link>
+    </item>
+  </channel>
+</rss>
+"""
+
+
+def test_bozo_feed_parsed_in_process_pool():
+    async def parse():
+        parse_executor = ParseExecutor(kind="process", workers=1)
+        try:
+            return await parse_executor.run(feeds.parse_feed, BOZO_FEED)
+        finally:
+            await parse_executor.shutdown()
+
+    parsed_feed = asyncio.run(parse())
+    assert parsed_feed.bozo
+    assert isinstance(parsed_feed.bozo_exception, str)
+    assert [entry.title for entry in parsed_feed.entries] == ["Bitcoin & Ethereum"]
+
+
+def make_feed(**validators) -> SimpleNamespace:
+    fields = {"etag": None, "last_modified": None, "content_hash": None, **validators}
+    return SimpleNamespace(id=1, url="https://example.com/feed", **fields)
+
+
+def test_conditional_headers():
+    headers = feeds.create_conditional_headers(make_feed())
+    assert "If-None-Match" not in headers and "If-Modified-Since" not in headers
+
+    feed = make_feed(etag='"v1"', last_modified="Sat, 01 Jan 2022 00:00:00 GMT")
+    headers = feeds.create_conditional_headers(feed)
+    assert headers["If-None-Match"] == '"v1"'
+    assert headers["If-Modified-Since"] == "Sat, 01 Jan 2022 00:00:00 GMT"
+
+
+class FakeHttpSession:
+    """
+    Http session serving `content` with `status` and `headers`
+    """
+
+    def __init__(self, status: int, content: bytes, headers: dict):
+        self.response = SimpleNamespace(status=status, headers=headers)
+
+        async def read():
+            return content
+
+        self.response.read = read
+
+    @asynccontextmanager
+    async def get(self, url, raise_for_status, headers):
+        yield self.response
+
+
+@pytest.fixture
+def stored_validators(monkeypatch, stub_sessions):
+    """
+    Stub feed updates, recording the stored validators
+    """
+    stored = []
+
+    async def update_feed_validators(feed_id, feed_validators):
+        stored.append(feed_validators)
+
+    monkeypatch.setattr(
+        feeds.feed_crud, "update_feed_validators", update_feed_validators
+    )
+    return stored
+
+
+def fetch(feed, status: int = 200, headers: dict = None):
+    http_session = FakeHttpSession(
+        status=status, content=BOZO_FEED.encode(), headers=headers or {}
+    )
+    return asyncio.run(feeds.fetch_feed(http_session=http_session, feed=feed))
+
+
+def test_not_modified(stored_validators):
+    feed = make_feed(etag='"v1"')
+    assert fetch(feed, status=304, headers={"ETag": '"v1"'}) is None
+    assert stored_validators == []
+
+
+def test_unchanged_with_new_etag(stored_validators):
+    content_hash = hashlib.sha256(BOZO_FEED.encode()).hexdigest()
+    feed = make_feed(etag='"v1"', content_hash=content_hash)
+    # Same validators, nothing to store
+    assert fetch(feed, headers={"ETag": '"v1"'}) is None
+    assert stored_validators == []
+    # The server rotated its ETag for the same body, which is stored
+    assert fetch(feed, headers={"ETag": '"v2"'}) is None
+    assert [validators.etag for validators in stored_validators] == ['"v2"']
+    assert stored_validators[0].content_hash == content_hash
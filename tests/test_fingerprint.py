@@ -0,0 +1,65 @@
+import asyncio
+import random
+
+from cryptomonitor import fingerprint
+from cryptomonitor.ingestion.dedup import MARK, Deduplicator
+
+# fmt: off
+WORDS = [
+    "market", "price", "token", "network", "wallet", "block", "chain", "fee",
+    "trader", "volume", "protocol", "validator", "miner", "exchange", "report",
+]
+# fmt: on
+
+
+def make_story(seed: int, words: int = 300) -> str:
+    story_random = random.Random(seed)
+    return " ".join(story_random.choice(WORDS) for _ in range(words))
+
+
+def test_minhash():
+    story = make_story(0)
+    signature = fingerprint.minhash(story)
+    assert len(signature) == fingerprint.PERMUTATIONS
+    assert all(0 <= value < fingerprint.PRIME for value in signature)
+    # Case and punctuation are ignored
+    assert fingerprint.minhash(story.upper().replace(" ", ", ")) == signature
+    assert fingerprint.minhash("") is None
+    assert fingerprint.minhash("three words only", min_words=4) is None
+
+
+def test_similarity():
+    story = make_story(0)
+    copy = "Syndicated by another site. " + story + " Read more on our site."
+    signature = fingerprint.minhash(story)
+    assert fingerprint.similarity(signature, signature) == 1.0
+    assert fingerprint.similarity(signature, fingerprint.minhash(copy)) > 0.8
+    other = fingerprint.minhash(make_story(1))
+    assert fingerprint.similarity(signature, other) < 0.5
+
+
+def test_bands():
+    signature = fingerprint.minhash(make_story(0))
+    bands = fingerprint.get_bands(signature)
+    assert len(bands) == fingerprint.BANDS
+    assert all(-(1 << 63) <= band < 1 << 63 for band in bands)
+    copy = fingerprint.minhash(make_story(0) + " Read more on our site.")
+    assert set(bands) & set(fingerprint.get_bands(copy))
+    other = fingerprint.minhash(make_story(1))
+    assert not set(bands) & set(fingerprint.get_bands(other))
+
+
+def test_deduplicator_cache():
+    deduplicator = Deduplicator(policy=MARK, min_similarity=0.8, cache_size=2)
+    signatures = [fingerprint.minhash(make_story(seed)) for seed in range(3)]
+    for article_id, signature in enumerate(signatures, start=1):
+        deduplicator.add(article_id, signature)
+    copy = fingerprint.minhash(make_story(2) + " Read more on our site.")
+
+    # Found among the cached canonical articles, without a database lookup
+    assert asyncio.run(deduplicator.find_canonical(copy)) == 3
+    assert deduplicator.get_stats()["hits"] == 1
+    # The least recently used article was evicted along with its bands
+    assert deduplicator.get_stats()["cached"] == 2
+    assert deduplicator._find_cached(signatures[0]) is None
+    assert all(1 not in ids for ids in deduplicator._bands.values())
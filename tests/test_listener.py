@@ -0,0 +1,130 @@
+import asyncio
+
+import orjson
+import pytest
+
+from cryptomonitor.listener import (
+    DISCONNECT,
+    DROP_OLDEST,
+    Listener,
+    SlowConsumer,
+    Subscription,
+    SubscriptionClosed,
+)
+
+SUBSCRIBERS = 10_000
+# Every tenth subscriber never reads its messages
+SLOW_EVERY = 10
+MESSAGES = 100
+BUFFER_SIZE = 20
+# Messages published between fast subscribers draining their buffers
+BURST = BUFFER_SIZE // 2
+RULES = 1_000
+
+
+async def consume(subscription: Subscription, received: list):
+    while True:
+        received.append(await subscription.get())
+
+
+def message_ids(messages) -> list:
+    return [orjson.loads(message)["id"] for message in messages]
+
+
+@pytest.mark.parametrize("policy", [DROP_OLDEST, DISCONNECT])
+def test_slow_subscribers_bounded(policy):
+    async def simulate():
+        listener = Listener()
+        subscriptions = []
+        received = {}
+        consumers = []
+        for i in range(SUBSCRIBERS):
+            subscription = listener.subscribe(
+                Subscription(maxsize=BUFFER_SIZE, policy=policy)
+            )
+            subscriptions.append(subscription)
+            if i % SLOW_EVERY:
+                received[subscription] = []
+                consumers.append(
+                    asyncio.create_task(consume(subscription, received[subscription]))
+                )
+
+        for i in range(MESSAGES):
+            listener.publish({"id": i, "title": "title", "body": "body"})
+            if not (i + 1) % BURST:
+                # Let fast subscribers drain their buffers
+                await asyncio.sleep(0)
+        await asyncio.sleep(0)
+        for consumer in consumers:
+            consumer.cancel()
+        await asyncio.gather(*consumers, return_exceptions=True)
+        return listener, subscriptions, received
+
+    listener, subscriptions, received = asyncio.run(simulate())
+    slow = subscriptions[::SLOW_EVERY]
+
+    # Fast subscribers receive every message, in order, whatever the slow ones do
+    assert len(received) == SUBSCRIBERS - len(slow)
+    assert all(
+        message_ids(messages) == list(range(MESSAGES)) for messages in received.values()
+    )
+    assert all(len(subscription) <= BUFFER_SIZE for subscription in slow)
+
+    if policy == DROP_OLDEST:
+        # Slow subscribers keep the most recent messages
+        for subscription in slow:
+            assert message_ids(subscription._buffer) == list(
+                range(MESSAGES - BUFFER_SIZE, MESSAGES)
+            )
+            assert subscription.dropped == MESSAGES - BUFFER_SIZE
+        assert len(listener.subscribers) == SUBSCRIBERS
+        assert listener.get_stats()["dropped"] == len(slow) * (MESSAGES - BUFFER_SIZE)
+    else:
+        # Slow subscribers are disconnected and removed
+        assert all(subscription.closed for subscription in slow)
+        assert len(listener.subscribers) == SUBSCRIBERS - len(slow)
+        assert not listener._unfiltered & set(slow)
+        with pytest.raises(SlowConsumer):
+            asyncio.run(slow[0].get())
+
+    # Unsubscribing every remaining subscriber leaves nothing behind
+    for subscription in subscriptions:
+        listener.unsubscribe(subscription)
+    assert not listener.subscribers
+    assert not listener._unfiltered
+
+
+def test_filtered_subscribers():
+    listener = Listener()
+    subscriptions = [
+        listener.subscribe(
+            Subscription(rule_ids=[i % RULES], body=not i % 2, maxsize=MESSAGES)
+        )
+        for i in range(SUBSCRIBERS)
+    ]
+    for i in range(MESSAGES):
+        listener.publish(
+            {"id": i, "body": "body", "feed_id": 1, "rule_ids": [i, i + 1]}
+        )
+
+    # Each subscriber only receives the articles of its rule
+    for i, subscription in enumerate(subscriptions):
+        rule_id = i % RULES
+        expected = [j for j in range(MESSAGES) if rule_id in (j, j + 1)]
+        assert message_ids(subscription._buffer) == expected
+        if subscription._buffer:
+            assert ("body" in orjson.loads(subscription._buffer[0])) == (not i % 2)
+
+    for subscription in subscriptions:
+        listener.unsubscribe(subscription)
+    assert not listener.subscribers
+    assert not listener._by_rule
+
+
+def test_closed_subscription():
+    subscription = Subscription(maxsize=1)
+    assert subscription.put("message")
+    subscription.close()
+    assert not subscription.put("message")
+    with pytest.raises(SubscriptionClosed):
+        asyncio.run(subscription.get())
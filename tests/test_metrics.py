@@ -0,0 +1,65 @@
+import pytest
+
+from cryptomonitor.metrics import Registry
+
+
+def test_render():
+    registry = Registry()
+    requests = registry.counter("requests_total", "Requests", labels=("host",))
+    queued = registry.gauge("queued", "Queued items")
+    requests.inc(host="a.com")
+    requests.inc(2, host='b"c')
+    queued.set(3)
+
+    assert registry.render() == (
+        "# HELP requests_total Requests\n"
+        "# TYPE requests_total counter\n"
+        'requests_total{host="a.com"} 1\n'
+        'requests_total{host="b\\"c"} 2\n'
+        "# HELP queued Queued items\n"
+        "# TYPE queued gauge\n"
+        "queued 3\n"
+    )
+
+
+def test_histogram():
+    registry = Registry()
+    seconds = registry.histogram(
+        "seconds", "Seconds", labels=("stage",), buckets=(0.1, 1.0)
+    )
+    for value in (0.05, 0.1, 0.5, 2.0):
+        seconds.observe(value, stage="parse")
+
+    assert registry.render().splitlines()[2:] == [
+        'seconds_bucket{stage="parse",le="0.1"} 2',
+        'seconds_bucket{stage="parse",le="1.0"} 3',
+        'seconds_bucket{stage="parse",le="+Inf"} 4',
+        'seconds_sum{stage="parse"} 2.65',
+        'seconds_count{stage="parse"} 4',
+    ]
+
+
+def test_histogram_time_observes_on_error():
+    seconds = Registry().histogram("seconds", "Seconds")
+    with pytest.raises(RuntimeError):
+        with seconds.time():
+            raise RuntimeError()
+    assert "seconds_count 1" in seconds.render()
+
+
+def test_labels_checked():
+    registry = Registry()
+    requests = registry.counter("requests_total", "Requests", labels=("host",))
+    with pytest.raises(ValueError):
+        requests.inc(status="ok")
+    with pytest.raises(ValueError):
+        registry.gauge("requests_total", "Duplicate")
+
+
+def test_gauge_clear():
+    gauge = Registry().gauge("jobs", "Jobs", labels=("status",))
+    gauge.set(1, status="pending")
+    gauge.clear()
+    gauge.set(2, status="done")
+    assert gauge.get(status="pending") == 0
+    assert list(gauge.samples()) == ['jobs{status="done"} 2']
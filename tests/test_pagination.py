@@ -0,0 +1,73 @@
+import asyncio
+from datetime import datetime
+
+import pytest
+from sqlalchemy import select
+from sqlalchemy.dialects import postgresql
+
+from cryptomonitor import schemas
+from cryptomonitor.database import models
+from cryptomonitor.database.crud import article as article_crud
+from cryptomonitor.database.pagination import decode_cursor, encode_cursor, paginate
+
+
+def compile_query(query):
+    return query.compile(dialect=postgresql.dialect())
+
+
+def test_cursor_round_trip():
+    published = datetime(2022, 1, 2, 3, 4, 5, 6)
+    cursor = encode_cursor(published, 42)
+    assert decode_cursor(cursor, types=[datetime, int]) == (published, 42)
+
+
+@pytest.mark.parametrize(
+    "cursor", ["not base64 json", encode_cursor(1), encode_cursor("a", 1), "W10="]
+)
+def test_invalid_cursor(cursor):
+    with pytest.raises(ValueError):
+        decode_cursor(cursor, types=[datetime, int])
+
+
+def test_paginate_first_page():
+    columns = [models.Article.published, models.Article.id]
+    query = compile_query(
+        paginate(select(models.Article.id), columns, cursor=None, limit=10)
+    )
+    assert "WHERE" not in str(query)
+    assert "ORDER BY articles.published, articles.id" in str(query)
+    assert list(query.params.values()) == [10]
+
+
+def test_paginate_after_cursor():
+    columns = [models.Article.published, models.Article.id]
+    cursor = encode_cursor(datetime(2022, 1, 1), 42)
+    query = compile_query(
+        paginate(
+            select(models.Article.id), columns, cursor=cursor, limit=5, descending=True
+        )
+    )
+    sql = str(query)
+    assert "(articles.published, articles.id) < (%(param_1)s, %(param_2)s)" in sql
+    assert "ORDER BY articles.published DESC, articles.id DESC" in sql
+    assert list(query.params.values()) == [datetime(2022, 1, 1), 42, 5]
+
+
+def test_article_jobs_paginated_on_id(db_session):
+    rows = [{"id": 1}, {"id": 2}]
+    db_session.rows = rows
+    article_jobs, cursor = asyncio.run(
+        article_crud.get_article_job_rows(
+            db_session,
+            cursor=encode_cursor(0),
+            limit=2,
+            status=schemas.ArticleJobStatus.pending,
+        )
+    )
+    assert article_jobs == rows
+    assert decode_cursor(cursor, types=[int]) == (2,)
+    # A stable key, unlike _updated which changes as jobs are processed
+    sql = str(db_session.queries[0])
+    assert "WHERE article_jobs.status = %(status_1)s AND (article_jobs.id) > (" in sql
+    assert "ORDER BY article_jobs.id" in sql
+    assert "_updated" not in sql
@@ -0,0 +1,93 @@
+import asyncio
+
+import pytest
+
+from cryptomonitor import fingerprint
+from cryptomonitor.database import models
+from cryptomonitor.database.writer import ArticleWriter
+from cryptomonitor.ingestion import dedup, parser
+from cryptomonitor.ingestion.dedup import MARK, SKIP, Deduplicator
+
+STORY = " ".join(f"bitcoin word{i} rallies" for i in range(100))
+
+
+@pytest.fixture(autouse=True)
+def empty_index(monkeypatch, persisted):
+    """
+    Stub an empty fingerprint index, articles are persisted in batches
+    """
+
+    async def get_near_duplicate(db_session, signature, min_similarity):
+        await asyncio.sleep(0)
+        return None
+
+    monkeypatch.setattr(dedup.article_crud, "get_near_duplicate", get_near_duplicate)
+    monkeypatch.setattr(parser, "article_writer", ArticleWriter(max_delay=0.01))
+
+
+@pytest.fixture
+def make_copy(make_article):
+    """
+    Factory of copies of a story published by the site and feed numbered `i`
+    """
+
+    def make_copy(i: int, body: str = STORY):
+        return make_article(i, body=body, url=f"https://site{i}.com/story", feed_id=i)
+
+    return make_copy
+
+
+def write_copies(monkeypatch, policy: str, copies):
+    deduplicator = Deduplicator(policy=policy, min_similarity=0.8)
+    monkeypatch.setattr(parser, "deduplicator", deduplicator)
+    rules = [models.Rule(id=1, name="bitcoin", pattern=".*bitcoin.*")]
+
+    async def write():
+        await asyncio.gather(
+            *(
+                parser.write_article(
+                    article=article,
+                    match_rules=rules,
+                    signature=fingerprint.minhash(article.body),
+                )
+                for article in copies
+            )
+        )
+
+    asyncio.run(write())
+    return deduplicator
+
+
+def test_copies_in_one_batch_linked(monkeypatch, persisted, make_copy):
+    copies = [make_copy(1), make_copy(2, STORY + " Read more on site 2.")]
+    deduplicator = write_copies(monkeypatch, MARK, copies)
+
+    # The first copy is canonical, the second is linked to it without its body
+    articles = persisted.articles
+    assert len(articles) == 2
+    assert articles[1].canonical_id is None and articles[1].rules
+    assert articles[2].canonical_id == 1
+    assert articles[2].body is None
+    stats = deduplicator.get_stats()
+    assert stats["duplicates"] == 1
+    assert stats["provisional"] == 0
+    assert stats["cached"] == 1
+
+
+def test_copies_in_one_batch_skipped(monkeypatch, persisted, make_copy):
+    copies = [make_copy(i) for i in range(3)]
+    write_copies(monkeypatch, SKIP, copies)
+    assert [article.url for article in persisted.articles.values()] == [copies[0].url]
+
+
+def test_unmatched_copy_not_canonical(monkeypatch, persisted, make_copy):
+    # The first copy matches no rule, the second is then found unique
+    story = STORY.replace("bitcoin", "ether")
+    copies = [make_copy(1, story), make_copy(2, story + " bitcoin")]
+    deduplicator = write_copies(monkeypatch, MARK, copies)
+
+    articles = persisted.articles
+    assert len(articles) == 1
+    assert articles[1].url == copies[1].url
+    assert articles[1].canonical_id is None
+    assert deduplicator.get_stats()["provisional"] == 0
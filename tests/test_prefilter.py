@@ -0,0 +1,102 @@
+import random
+import re
+
+import pytest
+
+from cryptomonitor.prefilter import LiteralIndex, extract_literals
+
+TEXTS = [
+    "",
+    "hack",
+    "HACK",
+    "Hack of the bridge",
+    "exploit",
+    "a vulnerability was found",
+    "foobar",
+    "bar",
+    "xbar",
+    "barbaz",
+    "abcd",
+    "xcd",
+    "abcbcd",
+    "Bitcoin and BTC",
+    "bitcoin",
+    "ushers",
+]
+
+
+@pytest.mark.parametrize(
+    "pattern, literals",
+    [
+        # Literal runs, the longest being preferred
+        (".*hack.*", {"hack"}),
+        (".*ab.*cde.*", {"cde"}),
+        # Alternation requires one literal of each branch
+        (".*((hack)|(exploit)|(vuln)).*", {"hack", "exploit", "vuln"}),
+        ("ab|c", {"ab", "c"}),
+        (".*BTC|bitcoin.*", {"BTC", "bitcoin"}),
+        # A branch without a literal means none is required
+        (".*(hack|[0-9]+).*", None),
+        # Case insensitive patterns and groups require no literal
+        ("(?i).*hack.*", None),
+        (".*(?i:hack).*", None),
+        (".*(?i:hack).*bar.*", {"bar"}),
+        # Optional groups and repeats require no literal
+        (".*(foo)?bar.*", {"bar"}),
+        (".*(foo)*", None),
+        (".*x{0}bar.*", {"bar"}),
+        (".*a(bc)+d.*", {"bc"}),
+        ("(ab){2}", {"ab"}),
+        # Lookarounds require no literal
+        (".*(?=hack)bar.*", {"bar"}),
+        (".*(?<!ab)cd.*", {"cd"}),
+        (".*(?!hack)baz.*", {"baz"}),
+        ("(?=.*hack).*", None),
+        # Character classes split literal runs
+        (".*[Bb]itcoin.*", {"itcoin"}),
+        (".*", None),
+        # Invalid patterns are left to the regex engine
+        ("(unbalanced", None),
+    ],
+)
+def test_extract_literals(pattern, literals):
+    extracted = extract_literals(pattern)
+    assert extracted == (frozenset(literals) if literals is not None else None)
+    if extracted is None:
+        return
+    # Any text matching the pattern contains one of the literals
+    for text in TEXTS:
+        if re.match(pattern, text):
+            assert any(literal in text for literal in extracted)
+
+
+def test_extract_literals_never_excludes_a_match():
+    fuzz_random = random.Random(0)
+    atoms = ["a", "b", "ab", "(a|b)", "(ab)?", "b{0}", "[ab]", "(?=a)", "(?i:a)"]
+    texts = ["".join(fuzz_random.choice("abAB") for _ in range(8)) for _ in range(200)]
+    for _ in range(500):
+        pattern = ".*" + "".join(fuzz_random.choice(atoms) for _ in range(4)) + ".*"
+        literals = extract_literals(pattern)
+        if literals is None:
+            continue
+        for text in texts:
+            if re.match(pattern, text):
+                assert any(literal in text for literal in literals), (pattern, text)
+
+
+def test_literal_index_overlapping_literals():
+    index = LiteralIndex(["he", "she", "his", "hers"])
+    # "she", "he" and "hers" all end inside "ushers"
+    assert index.scan("ushers") == {0, 1, 3}
+    assert index.scan("this") == {2}
+    assert index.scan("") == frozenset()
+    assert index.scan("xyz") == frozenset()
+
+
+def test_literal_index_matches_substring_search():
+    literals = ["hack", "ack", "exploit", "vuln", "BTC", "bitcoin", "coin", "c"]
+    index = LiteralIndex(literals + ["hack"])
+    assert len(index) == len(literals)
+    for text in TEXTS:
+        expected = {i for i, literal in enumerate(literals) if literal in text}
+        assert index.scan(text) == expected
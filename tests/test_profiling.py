@@ -0,0 +1,80 @@
+import asyncio
+import sys
+import threading
+import time
+
+import pytest
+
+from cryptomonitor.profiling import Profiler, collapse_stack
+
+
+def count_sampler_threads() -> int:
+    return sum(thread.name == "profiler" for thread in threading.enumerate())
+
+
+@pytest.fixture
+def profiler(tmp_path):
+    return Profiler(slow_seconds=0, interval=0.001, directory=str(tmp_path))
+
+
+def test_requested_runs_per_target(profiler):
+    @profiler.profiled("cycle")
+    async def cycle():
+        time.sleep(0.02)
+
+    @profiler.profiled("request")
+    async def request():
+        time.sleep(0.02)
+
+    async def run():
+        profiler.request(target="cycle", runs=2)
+        # Runs of other targets do not use up the requested runs
+        for _ in range(3):
+            await request()
+        for _ in range(3):
+            await cycle()
+
+    asyncio.run(run())
+    assert [profile.name for profile in profiler.profiles] == ["cycle", "cycle"]
+    assert all(profile.samples > 0 for profile in profiler.profiles)
+    assert profiler.get_status()["requested"] == {}
+
+
+def test_unknown_target(profiler):
+    @profiler.profiled("cycle")
+    async def cycle():
+        pass
+
+    with pytest.raises(ValueError):
+        profiler.request(target="unknown", runs=1)
+    assert profiler.get_status()["targets"] == ["cycle"]
+
+
+def test_concurrent_runs_share_a_sampler(profiler):
+    profiler.slow_seconds = 0.001
+    sampler_threads = []
+
+    @profiler.profiled("request")
+    async def request():
+        await asyncio.sleep(0.02)
+        sampler_threads.append(count_sampler_threads())
+
+    async def run():
+        await asyncio.gather(*(request() for _ in range(5)))
+
+    asyncio.run(run())
+    assert sampler_threads == [1] * 5
+    assert len(profiler.profiles) == 5
+    assert all(profile.samples > 0 for profile in profiler.profiles)
+    # The sampler stops once no run is profiled
+    assert count_sampler_threads() == 0
+
+
+def test_collapse_stack():
+    def inner():
+        return collapse_stack(sys._getframe(), "MainThread")
+
+    stack = inner().split(";")
+    assert stack[0] == "MainThread"
+    assert stack[-1].startswith("inner (tests/test_profiling.py:")
+    assert stack[-2].startswith("test_collapse_stack (tests/test_profiling.py:")
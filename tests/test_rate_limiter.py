@@ -0,0 +1,27 @@
+import asyncio
+
+import pytest
+
+from cryptomonitor.ingestion.rate_limiter import TokenBucket
+
+
+def test_token_bucket_spaces_requests(fake_clock_loop):
+    async def reserve():
+        bucket = TokenBucket(rate=0.5, capacity=1)
+        return [bucket.reserve() for _ in range(3)]
+
+    assert fake_clock_loop.run_until_complete(reserve()) == [0, 2, 4]
+
+
+def test_token_bucket_burst(fake_clock_loop):
+    async def reserve():
+        bucket = TokenBucket(rate=1, capacity=3)
+        waits = [bucket.reserve() for _ in range(4)]
+        # Idle long enough to refill, tokens are capped at the capacity
+        await asyncio.sleep(10)
+        waits += [bucket.reserve() for _ in range(4)]
+        return waits
+
+    assert fake_clock_loop.run_until_complete(reserve()) == pytest.approx(
+        [0, 0, 0, 1, 0, 0, 0, 1]
+    )
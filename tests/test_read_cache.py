@@ -0,0 +1,132 @@
+import asyncio
+from types import SimpleNamespace
+
+import orjson
+import pytest
+from starlette.requests import Request
+
+from cryptomonitor import read_cache
+from cryptomonitor.api import create_cached_response
+from cryptomonitor.read_cache import ReadCache
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    """
+    Clock of the cache, only advanced by the tests
+    """
+    clock = SimpleNamespace(now=0.0)
+    time = SimpleNamespace(monotonic=lambda: clock.now)
+    monkeypatch.setattr(read_cache, "time", time)
+    return clock
+
+
+class Loader:
+    """
+    Load of a key counting its calls, returning the key and call number
+    """
+
+    def __init__(self, key):
+        self.key = key
+        self.calls = 0
+
+    async def __call__(self):
+        self.calls += 1
+        await asyncio.sleep(0)
+        return {"key": self.key, "call": self.calls}
+
+
+def get(cache: ReadCache, key, load):
+    read = asyncio.run(cache.get(key, load))
+    return orjson.loads(read.body)
+
+
+def test_ttl_expiry(clock):
+    cache = ReadCache(maxsize=10, ttl=5)
+    load = Loader("feeds")
+    assert get(cache, "feeds", load)["call"] == 1
+    clock.now = 4
+    assert get(cache, "feeds", load)["call"] == 1
+    clock.now = 5
+    assert get(cache, "feeds", load)["call"] == 2
+    assert cache.get_stats()["hits"] == 1
+    assert cache.get_stats()["misses"] == 2
+
+
+def test_lru_eviction(clock):
+    cache = ReadCache(maxsize=2, ttl=60)
+    loads = {key: Loader(key) for key in ("a", "b", "c")}
+    get(cache, "a", loads["a"])
+    get(cache, "b", loads["b"])
+    # a is now more recently used than b, which c evicts
+    get(cache, "a", loads["a"])
+    get(cache, "c", loads["c"])
+    assert list(cache._reads) == ["a", "c"]
+    get(cache, "b", loads["b"])
+    assert [load.calls for load in loads.values()] == [1, 2, 1]
+
+
+def test_concurrent_misses_share_a_load(clock):
+    cache = ReadCache(maxsize=10, ttl=60)
+    load = Loader("feeds")
+
+    async def get_all():
+        return await asyncio.gather(*(cache.get("feeds", load) for _ in range(5)))
+
+    reads = asyncio.run(get_all())
+    assert load.calls == 1
+    assert all(read is reads[0] for read in reads)
+
+
+def test_load_across_invalidation_not_stored(clock):
+    cache = ReadCache(maxsize=10, ttl=60)
+    invalidated = []
+
+    async def load():
+        # A feed is created while the read is loaded
+        cache.invalidate()
+        invalidated.append(cache.version)
+        return {"feeds": []}
+
+    read = asyncio.run(cache.get("feeds", load))
+    assert read is not None
+    assert invalidated == [1]
+    assert not cache._reads
+
+
+def test_missing_read_not_cached(clock):
+    cache = ReadCache(maxsize=10, ttl=60)
+
+    async def load():
+        return None
+
+    assert asyncio.run(cache.get("feed", load)) is None
+    assert not cache._reads
+
+
+def make_request(if_none_match: str = None) -> Request:
+    headers = []
+    if if_none_match is not None:
+        headers.append((b"if-none-match", if_none_match.encode()))
+    return Request({"type": "http", "method": "GET", "headers": headers})
+
+
+def test_cached_response_not_modified(clock):
+    cache = ReadCache(maxsize=10, ttl=60)
+    read = asyncio.run(cache.get("feeds", Loader("feeds")))
+
+    response = create_cached_response(request=make_request(), read=read)
+    assert response.status_code == 200
+    assert response.body == read.body
+    assert response.headers["etag"] == read.etag
+
+    for if_none_match in (read.etag, f'"other", W/{read.etag}', "*"):
+        response = create_cached_response(
+            request=make_request(if_none_match), read=read
+        )
+        assert response.status_code == 304
+        assert response.body == b""
+        assert response.headers["etag"] == read.etag
+
+    response = create_cached_response(request=make_request('"other"'), read=read)
+    assert response.status_code == 200
@@ -0,0 +1,86 @@
+import re
+
+from cryptomonitor.database import models
+from cryptomonitor.rule_engine import PREFILTER_MIN_RULES, RuleEngine, RuleSet
+
+PATTERNS = [
+    ".*((hack)|(exploit)|(vuln)).*",
+    ".*((Coinbase)|(Binance)).*list.*",
+    ".*((Ethereum)|(ETH)).*((fork)|(upgrad)).*",
+    ".*([Bb]itcoin|BTC).*",
+    ".*",
+]
+
+BODIES = [
+    "Binance announces the listing of a new token",
+    "An exploit drained the bridge",
+    "Ethereum developers schedule the next upgrade",
+    "bitcoin and BTC are the same thing",
+    "Nothing to see here",
+    "",
+]
+
+
+def make_rules(patterns):
+    return [
+        models.Rule(id=rule_id, name=str(rule_id), pattern=pattern)
+        for rule_id, pattern in enumerate(patterns, start=1)
+    ]
+
+
+def expected_matches(rules, body):
+    return [rule.id for rule in rules if re.match(rule.pattern, body)]
+
+
+def test_match():
+    engine = RuleEngine()
+    rules = make_rules(PATTERNS)
+    assert engine.match(rules, BODIES[0]) == [2, 5]
+    assert engine.match(rules, BODIES[4]) == [5]
+    for body in BODIES:
+        assert engine.match(rules, body) == expected_matches(rules, body)
+
+
+def test_prefilter_matches_unfiltered():
+    # Enough rules requiring literals for the prefilter to be used
+    patterns = [f".*keyword{i}.*" for i in range(PREFILTER_MIN_RULES)] + PATTERNS
+    rules = make_rules(patterns)
+    bodies = BODIES + ["keyword3 and keyword12 with BTC", "keyword1"]
+    prefiltered = RuleEngine(prefilter=True)
+    unfiltered = RuleEngine(prefilter=False)
+    assert prefiltered.get_rule_set(rules)._index is not None
+    assert unfiltered.get_rule_set(rules)._index is None
+    for body in bodies:
+        expected = expected_matches(rules, body)
+        assert prefiltered.match(rules, body) == expected
+        assert unfiltered.match(rules, body) == expected
+
+
+def test_candidates_in_rule_order():
+    words = [f"<{i}>" for i in reversed(range(PREFILTER_MIN_RULES))]
+    rule_set = RuleSet(
+        [(i, re.compile(f".*{word}.*")) for i, word in enumerate(words)],
+        literals=[frozenset([word]) for word in words],
+    )
+    # Literals are found in the reverse order of their rules
+    assert rule_set.get_candidates("<0> <15>") == [0, 15]
+    assert rule_set.match("<0> <15>") == [0, 15]
+    assert rule_set.get_candidates("nothing") == []
+
+
+def test_rule_sets_cached_until_invalidated():
+    engine = RuleEngine()
+    rules = make_rules(PATTERNS)
+    rule_set = engine.get_rule_set(rules)
+    assert engine.get_rule_set(make_rules(PATTERNS)) is rule_set
+    assert rule_set.version == 0
+
+    engine.invalidate()
+    assert engine.version == 1
+    rule_set = engine.get_rule_set(rules)
+    assert rule_set.version == 1
+
+    # A changed pattern yields a new rule set
+    changed = make_rules(PATTERNS[:-1] + [".*Solana.*"])
+    assert engine.get_rule_set(changed) is not rule_set
+    assert engine.match(changed, "Solana") == [5]
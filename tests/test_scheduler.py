@@ -0,0 +1,134 @@
+import asyncio
+from datetime import datetime, timedelta
+from types import SimpleNamespace
+
+import feedparser
+import pytest
+
+from cryptomonitor.ingestion import scheduler
+from cryptomonitor.ingestion.scheduler import FeedScheduler, estimate_poll_interval
+
+
+def make_feed(*minutes_ago: float) -> feedparser.FeedParserDict:
+    now = datetime(2022, 1, 1)
+    return feedparser.FeedParserDict(
+        entries=[
+            feedparser.FeedParserDict(
+                published_parsed=(now - timedelta(minutes=minutes)).timetuple()
+            )
+            for minutes in minutes_ago
+        ]
+    )
+
+
+@pytest.mark.parametrize(
+    "minutes_ago, expected",
+    [
+        # Half the median gap between entries
+        ((0, 10, 20, 30), 300),
+        ((30, 0, 20, 10), 300),
+        ((0, 10, 20, 300), 300),
+        # Clamped to the minimum and maximum interval
+        ((0, 1, 2), 60),
+        ((0, 600, 1200), 3600),
+        # Too few entries to estimate a rate
+        ((0,), 60),
+        ((), 60),
+    ],
+)
+def test_estimate_poll_interval(minutes_ago, expected):
+    interval = estimate_poll_interval(
+        make_feed(*minutes_ago), min_interval=60, max_interval=3600
+    )
+    assert interval == expected
+
+
+def test_estimate_poll_interval_ignores_undated_entries():
+    feed = make_feed(0, 10, 20)
+    feed.entries.append(feedparser.FeedParserDict(title="undated"))
+    assert estimate_poll_interval(feed, min_interval=60, max_interval=3600) == 300
+
+
+def test_estimate_poll_interval_uses_recent_entries():
+    # A burst of old entries does not shorten the interval of a now quiet feed
+    feed = make_feed(*range(0, 100, 10), *range(100, 110))
+    interval = estimate_poll_interval(feed, min_interval=60, max_interval=3600)
+    assert interval == 300
+
+
+@pytest.fixture
+def polled_feeds(monkeypatch, stub_sessions):
+    """
+    Stub the database and fetches of the scheduler, recording the loop time of
+    each poll per feed id
+    """
+    polls = {}
+
+    async def get_feed_ids(db_session):
+        return list(polls)
+
+    async def get_feed(db_session, feed_id):
+        return SimpleNamespace(id=feed_id)
+
+    async def fetch_feed(http_session, feed):
+        polls[feed.id].append(asyncio.get_running_loop().time())
+        # No dated entries, polled at the minimum interval
+        return feedparser.FeedParserDict(entries=[])
+
+    monkeypatch.setattr(scheduler.feed_crud, "get_feed_ids", get_feed_ids)
+    monkeypatch.setattr(scheduler.feed_crud, "get_feed", get_feed)
+    monkeypatch.setattr(scheduler.feeds, "fetch_feed", fetch_feed)
+    monkeypatch.setattr(scheduler, "http_client", SimpleNamespace(session=None))
+    return polls
+
+
+def run_scheduler(loop, feed_scheduler: FeedScheduler, seconds: float):
+    async def run():
+        task = asyncio.create_task(feed_scheduler.run())
+        await asyncio.sleep(seconds)
+        tasks = [task, *feed_scheduler._polls]
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+
+    loop.run_until_complete(run())
+
+
+def test_feeds_polled_at_their_interval(fake_clock_loop, polled_feeds):
+    polled_feeds[1] = []
+    feed_scheduler = FeedScheduler(
+        min_interval=1, max_interval=60, concurrency=2, refresh_interval=6
+    )
+    run_scheduler(fake_clock_loop, feed_scheduler, seconds=12.5)
+
+    # Polled every second, not only when feeds are refreshed
+    polls = polled_feeds[1]
+    assert len(polls) >= 12
+    gaps = [later - earlier for earlier, later in zip(polls, polls[1:])]
+    assert gaps == pytest.approx([1] * len(gaps))
+
+
+def test_polls_bounded_by_concurrency(fake_clock_loop, polled_feeds):
+    polled_feeds.update({feed_id: [] for feed_id in range(4)})
+    feed_scheduler = FeedScheduler(
+        min_interval=1, max_interval=60, concurrency=1, refresh_interval=60
+    )
+    running = 0
+    max_running = 0
+    poll = feed_scheduler.poll
+
+    async def slow_poll(schedule):
+        nonlocal running, max_running
+        running += 1
+        max_running = max(max_running, running)
+        await asyncio.sleep(0.5)
+        await poll(schedule)
+        running -= 1
+
+    feed_scheduler.poll = slow_poll
+    run_scheduler(fake_clock_loop, feed_scheduler, seconds=10)
+
+    assert max_running == 1
+    # Feeds held back by the full semaphore are polled in turn, with lag
+    assert all(polls for polls in polled_feeds.values())
+    assert max(s.lag for s in feed_scheduler._schedules.values()) >= 1
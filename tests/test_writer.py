@@ -0,0 +1,75 @@
+import asyncio
+
+from cryptomonitor import schemas
+from cryptomonitor.database.crud import article as article_crud
+from cryptomonitor.database.writer import ArticleWriter
+
+
+def test_writes_batched(persisted, make_article):
+    async def write():
+        article_writer = ArticleWriter(batch_size=2, max_delay=0.01)
+        return await asyncio.gather(
+            *(article_writer.write(make_article(i)) for i in range(5))
+        )
+
+    messages = asyncio.run(write())
+    assert [message["url"] for message in messages] == [
+        f"https://example.com/{i}" for i in range(5)
+    ]
+    assert [len(batch) for batch in persisted.batches] == [2, 2, 1]
+
+
+def test_cancelled_writer_does_not_stall_batch(persisted, make_article):
+    async def write():
+        article_writer = ArticleWriter(batch_size=10, max_delay=0.01)
+        writes = [
+            asyncio.create_task(article_writer.write(make_article(i)))
+            for i in range(3)
+        ]
+        await asyncio.sleep(0)
+        writes[1].cancel()
+        results = await asyncio.wait_for(
+            asyncio.gather(*writes, return_exceptions=True), timeout=1
+        )
+        await asyncio.gather(*article_writer._flushes)
+        return results
+
+    first, cancelled, last = asyncio.run(write())
+    assert isinstance(cancelled, asyncio.CancelledError)
+    assert first["url"] == "https://example.com/0"
+    assert last["url"] == "https://example.com/2"
+    # The cancelled writer's article is still persisted
+    assert [[article.url for article in batch] for batch in persisted.batches] == [
+        [f"https://example.com/{i}" for i in range(3)]
+    ]
+
+
+def test_same_url_from_two_feeds(db_session, make_article):
+    # The same story, at the same url, from two feeds matching different rules
+    articles = [
+        make_article(
+            0,
+            feed_id=feed_id,
+            rules=[schemas.Rule(id=feed_id, name=f"rule {feed_id}", pattern=".*")],
+        )
+        for feed_id in (1, 2)
+    ]
+    db_session.rows = [7, 8]
+    messages = asyncio.run(
+        article_crud.create_articles(db_session=db_session, articles=articles)
+    )
+
+    assert [(message["id"], message["feed_id"]) for message in messages] == [
+        (7, 1),
+        (8, 2),
+    ]
+    _, article_insert, rule_insert, *_ = db_session.queries
+    assert {
+        article_insert.params[f"id_m{i}"]: article_insert.params[f"feed_id_m{i}"]
+        for i in range(2)
+    } == {7: 1, 8: 2}
+    assert {
+        rule_insert.params[f"article_id_m{i}"]: rule_insert.params[f"rule_id_m{i}"]
+        for i in range(2)
+    } == {7: 1, 8: 2}
+    assert db_session.commits == 1